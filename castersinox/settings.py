@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db_router.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,6 +75,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.navigation',
             ],
         },
     },
@@ -87,15 +89,67 @@ WSGI_APPLICATION = 'castersinox.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # PostgreSQL in production; DB_ENGINE=django.db.backends.sqlite3 runs
+        # the test suite without a server (search falls back to ILIKE).
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('DB_NAME'),  # Set your database name
         'USER': os.getenv('DB_USER'),  # Set your database user
         'PASSWORD': os.getenv('DB_PASSWORD'),  # Set your database password
         'HOST': os.getenv('DB_HOST'),  # Set to your database host, default is localhost
         'PORT': os.getenv('DB_PORT'),      # Set to your database port
+        # Keep each worker's connection open between requests instead of
+        # reconnecting every time (0 disables); health checks replace a
+        # connection the server dropped before it is reused.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() in ('1', 'true', 'yes'),
     }
 }
 
+# Optional streaming replica for catalog reads (see core.db_router). Unset
+# DB_REPLICA_* values fall back to the primary's.
+if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+
+# Seconds a client reads from the primary after it wrote, and every client
+# after a catalog change, so nobody renders (or caches) a page from a
+# replica that has not caught up yet.
+DB_REPLICA_STICKINESS = int(os.getenv('DB_REPLICA_STICKINESS', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Use a backend shared by all Gunicorn workers in production (Redis,
+# Memcached or file-based) so cache invalidation reaches every process.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Seconds an anonymous catalog/product page may be served from the page
+# cache; edits invalidate it earlier (see core.page_cache).
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', 600))
+
+# On-disk LRU cache of admin/preview thumbnails (see core.thumbnails).
+THUMBNAIL_CACHE_DIR = os.getenv('THUMBNAIL_CACHE_DIR', str(BASE_DIR / 'var' / 'thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Delete a product image's file along with its row, unless another row
+# still uses it. Off by default; collect_orphaned_media cleans up either way.
+DELETE_PRODUCT_IMAGE_FILES = os.getenv('DELETE_PRODUCT_IMAGE_FILES', '').lower() in ('1', 'true', 'yes')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,29 +1,48 @@
 from django.contrib import admin
-from .models import Category, SubCategory, Product, ProductImage, ContactSubmission
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import PermissionDenied
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from .models import Category, SubCategory, Product, ProductImage, ContactSubmission, ImageUploadJob
 from django import forms
 from django.utils.html import format_html
+from .forms import IMAGE_SCOPES, FeaturesField, MainImageField
+from .thumbnails import thumbnail_url
+from .upload_jobs import enqueue
+
+IMAGE_AUTOCOMPLETE_PAGE_SIZE = 20
 
 
 # Register your models here.
 
 class ProductImageInline(admin.TabularInline):
+    # New images go through the "Upload images" fieldset and the job queue
+    # (upload_images below), so no image is decoded in the admin request;
+    # rows here can only be reviewed and deleted.
     model = ProductImage
-    extra = 1
-    readonly_fields = ('thumbnail',)
+    extra = 0
+    readonly_fields = ('thumbnail', 'image')
     fields = ('thumbnail', 'image',)
 
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        # The row titles show the product name.
+        return super().get_queryset(request).select_related('product')
+
     def thumbnail(self, instance):
         if instance.image:
-            return format_html('<img src="{}" style="max-height:100px;"/>', instance.image.url)
+            return format_html('<img src="{}" style="max-height:100px;" loading="lazy"/>', thumbnail_url(instance, 'small'))
         return ''
     thumbnail.short_description = 'Preview'
 
 class ProductAdminForm(forms.ModelForm):
-    main_image = forms.ModelChoiceField(
-        queryset=ProductImage.objects.none(),
-        required=False,
-        label='Main image'
-    )
+    main_image = MainImageField()
+    features = FeaturesField(required=False, label='Features')
 
     class Meta:
         model = Product
@@ -32,24 +51,101 @@ class ProductAdminForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.pk:
-            self.fields['main_image'].queryset = ProductImage.objects.filter(
-                product=self.instance
-            )
+            self.fields['main_image'].limit_to('product', self.instance.pk)
+
+
+def upload_job_status(job):
+    return {
+        'id': job.pk,
+        'name': job.original_name,
+        'status': job.status,
+        'error': job.error,
+        'thumbnail': thumbnail_url(job.image, 'small') if job.image_id else '',
+    }
+
 class ProductAdmin(admin.ModelAdmin):
     form = ProductAdminForm
     list_display = ['name', 'category', 'subcategory']
+    list_select_related = ['category', 'subcategory']
     list_filter = ['category', 'subcategory']
     search_fields = ['name', 'description']
     prepopulated_fields = {'slug': ('name',)}
     inlines = [ProductImageInline]
 
+    def get_urls(self):
+        urls = [
+            path('image-autocomplete/', self.admin_site.admin_view(self.image_autocomplete),
+                 name='core_image_autocomplete'),
+            path('<path:object_id>/upload-images/', self.admin_site.admin_view(csrf_exempt(self.upload_images)),
+                 name='core_product_upload_images'),
+            path('<path:object_id>/upload-images/status/', self.admin_site.admin_view(self.upload_status),
+                 name='core_product_upload_status'),
+        ]
+        return urls + super().get_urls()
+
+    def upload_images(self, request, object_id):
+        """
+        Stage the files posted as `images` and queue them for the
+        process_image_uploads worker; no image is decoded here. Uploads are
+        streamed to temporary files rather than held in memory, so the
+        handlers are swapped before the CSRF check reads the body.
+        """
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return csrf_protect(self._upload_images)(request, object_id)
+
+    def _upload_images(self, request, object_id):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        product = self.get_object(request, unquote(object_id))
+        if product is None:
+            raise Http404
+        if not self.has_change_permission(request, product):
+            raise PermissionDenied
+        jobs, errors = [], []
+        for upload in request.FILES.getlist('images'):
+            try:
+                jobs.append(enqueue(product, upload))
+            except ValueError as exc:
+                errors.append({'name': upload.name, 'error': str(exc)})
+        return JsonResponse({'jobs': [upload_job_status(job) for job in jobs], 'errors': errors},
+                            status=202 if jobs else 400)
+
+    def upload_status(self, request, object_id):
+        product = self.get_object(request, unquote(object_id))
+        if product is None:
+            raise Http404
+        if not self.has_view_or_change_permission(request, product):
+            raise PermissionDenied
+        ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk.isdigit()]
+        jobs = ImageUploadJob.objects.filter(product=product, pk__in=ids).select_related('image')
+        return JsonResponse({'jobs': [upload_job_status(job) for job in jobs.order_by('pk')]})
+
+    def image_autocomplete(self, request):
+        """
+        select2 results for the main image pickers: the images of one
+        product, category or subcategory (?product=, ?category=,
+        ?subcategory=), filtered by product name, with thumbnails.
+        """
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        scope = {lookup: request.GET[name] for name, lookup in IMAGE_SCOPES.items() if request.GET.get(name)}
+        if not scope:
+            return JsonResponse({'results': [], 'pagination': {'more': False}})
+        images = ProductImage.objects.filter(**scope).select_related('product').order_by('pk')
+        if request.GET.get('term'):
+            images = images.filter(product__name__icontains=request.GET['term'])
+        page = Paginator(images, IMAGE_AUTOCOMPLETE_PAGE_SIZE).get_page(request.GET.get('page'))
+        return JsonResponse({
+            'results': [
+                {'id': str(image.pk), 'text': str(image), 'thumbnail': thumbnail_url(image, 'small')}
+                for image in page
+            ],
+            'pagination': {'more': page.has_next()},
+        })
+
 
 class CategoryAdminForm(forms.ModelForm):
-    main_image = forms.ModelChoiceField(
-        queryset=ProductImage.objects.none(),
-        required=False,
-        label='Main image'
-    )
+    main_image = MainImageField()
 
     class Meta:
         model = Category
@@ -58,29 +154,24 @@ class CategoryAdminForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.pk:
-            self.fields['main_image'].queryset = ProductImage.objects.filter(
-                product__category=self.instance
-            )
+            self.fields['main_image'].limit_to('category', self.instance.pk)
 
 class CategoryAdmin(admin.ModelAdmin):
     form = CategoryAdminForm
     list_display = ['name', 'slug', 'main_image', 'main_image_preview']
+    list_select_related = ['main_image__product']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name']
     readonly_fields = ('main_image_preview',)
 
     def main_image_preview(self, obj):
         if obj.main_image and obj.main_image.image:
-            return format_html('<img src="{}" style="max-height:150px;"/>', obj.main_image.image.url)
+            return format_html('<img src="{}" style="max-height:150px;" loading="lazy"/>', thumbnail_url(obj.main_image, 'medium'))
         return ''
     main_image_preview.short_description = 'Main image preview'
 
 class SubCategoryAdminForm(forms.ModelForm):
-    main_image = forms.ModelChoiceField(
-        queryset=ProductImage.objects.none(),
-        required=False,
-        label='Main image'
-    )
+    main_image = MainImageField()
 
     class Meta:
         model = SubCategory
@@ -89,12 +180,11 @@ class SubCategoryAdminForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         if self.instance and self.instance.pk:
-            self.fields['main_image'].queryset = ProductImage.objects.filter(
-                product__subcategory=self.instance
-            )
+            self.fields['main_image'].limit_to('subcategory', self.instance.pk)
 class SubCategoryAdmin(admin.ModelAdmin):
     form = SubCategoryAdminForm
     list_display = ['name', 'category', 'slug', 'main_image']
+    list_select_related = ['category', 'main_image__product']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name']
     list_filter = ['category']
@@ -125,6 +215,9 @@ class ContactSubmissionAdmin(admin.ModelAdmin):
         'message', 'testimonial_consent', 'features_list'
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('features')
+
     def features_list(self, obj):
         return ", ".join([c.name for c in obj.features.all()]) if obj.pk else ""
     features_list.short_description = "Categorii"
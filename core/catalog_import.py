@@ -0,0 +1,255 @@
+"""
+Batched database writer for catalog imports (media/scraping.py).
+
+Products are written a page at a time and images a group at a time, each
+batch in one transaction with bulk_create/bulk_update instead of a save()
+per row. Categories and subcategories are resolved from an in-memory map.
+Since bulk writes skip Model.save() and the signals, the writer performs
+their work itself, once per batch: slugs, search vectors, the facet
+attribute index, derivatives, main images, and cache invalidation.
+"""
+import hashlib
+import json
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import page_cache
+from .facets import sync_product_attributes
+from .features import parse_features
+from .image_hashes import find_near_duplicate, fingerprint
+from .images import build_variants
+from .ingest import store_image
+from .models import CatalogVersion, Category, Product, ProductImage, SubCategory
+from .navigation import invalidate_navigation_tree
+from .search import refresh_search_vectors
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_FIELDS = ['name', 'description', 'features', 'category', 'subcategory']
+
+
+def content_hash(pdata, category, sub):
+    payload = {
+        "title": pdata["title"],
+        "description": pdata["description"],
+        "features": parse_features(pdata["features"]),
+        "images": pdata["images"],
+        "category": category.name,
+        "subcategory": sub.name if sub else None,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+class CatalogWriter:
+
+    def __init__(self, full=False):
+        self.full = full
+        self.categories = {}
+        self.subcategories = {}
+        self.diff = {"created": [], "updated": [], "unchanged": 0, "images_added": 0, "images_removed": 0,
+                     "images_similar": 0}
+        self.rows = 0
+        self.seconds = 0.0
+        # Part of `seconds` spent writing image files and derivatives.
+        self.file_seconds = 0.0
+
+    def category(self, name):
+        if name not in self.categories:
+            self.categories[name], _ = Category.objects.get_or_create(name=name)
+        return self.categories[name]
+
+    def subcategory(self, name, category):
+        if name not in self.subcategories:
+            self.subcategories[name], _ = SubCategory.objects.get_or_create(
+                name=name, defaults={"category": category})
+        return self.subcategories[name]
+
+    def write_products(self, items):
+        """
+        Create or update the products for `items`, [(pdata, category, sub)],
+        in one transaction. Returns [(product, changed)] in input order; an
+        unchanged product is not written and its images need no checking.
+        Products are matched on the slug of their title, the key the upsert
+        conflicts on, so titles differing only in case or accents are one
+        product (the last one in the batch wins).
+        """
+        started = time.perf_counter()
+        existing = {p.slug: p for p in Product.objects.filter(slug__in={slugify(p["title"]) for p, _, _ in items})}
+
+        now = timezone.now()
+        to_create, to_update, hash_only, result = {}, {}, {}, []
+        for pdata, category, sub in items:
+            digest = content_hash(pdata, category, sub)
+            fields = {
+                "name": pdata["title"],
+                "description": pdata["description"],
+                "features": parse_features(pdata["features"]),
+                "category_id": category.pk,
+                "subcategory_id": sub.pk if sub else None,
+            }
+            slug = slugify(pdata["title"])
+            product = existing.get(slug)
+            if product is None:
+                product = existing[slug] = Product(name=pdata["title"], slug=slug)
+                to_create[id(product)] = product
+                self.diff["created"].append(product.name)
+            elif product.source_hash == digest and not self.full:
+                self.diff["unchanged"] += 1
+                result.append((product, False))
+                continue
+            else:
+                changed = [name for name, value in fields.items() if getattr(product, name) != value]
+                if not changed and not self.full and id(product) not in to_create:
+                    # Same content, the hash just wasn't recorded yet: don't
+                    # bump updated_at.
+                    product.source_hash = digest
+                    hash_only[id(product)] = product
+                    self.diff["unchanged"] += 1
+                    result.append((product, True))
+                    continue
+                if id(product) not in to_create:
+                    to_update[id(product)] = product
+                    self.diff["updated"].append((product.name, changed))
+            for name, value in fields.items():
+                setattr(product, name, value)
+            product.source_hash = digest
+            product.updated_at = now
+            result.append((product, True))
+
+        changed = list(to_create.values()) + list(to_update.values())
+        if not changed and not hash_only:
+            return result
+        with transaction.atomic():
+            if to_create:
+                Product.objects.bulk_create(
+                    to_create.values(),
+                    update_conflicts=True,
+                    unique_fields=["slug"],
+                    update_fields=[*PRODUCT_FIELDS, "source_hash", "updated_at"],
+                )
+            if to_update:
+                Product.objects.bulk_update(to_update.values(), [*PRODUCT_FIELDS, "source_hash", "updated_at"])
+            if hash_only:
+                Product.objects.bulk_update(hash_only.values(), ["source_hash"])
+            if changed:
+                refresh_search_vectors(Product.objects.filter(pk__in=[p.pk for p in changed]))
+                sync_product_attributes(changed)
+        if changed:
+            page_cache.invalidate_all()
+            CatalogVersion.bump()
+        self._count(len(changed) + len(hash_only), started)
+        return result
+
+    def plan_images(self, product, urls):
+        """
+        Compare the product's images with the scraped `urls`: delete the
+        ones no longer listed and return the urls still to download.
+        """
+        if product.pk is None or not product.images.exists():
+            return list(urls)
+        existing = list(product.images.order_by("pk"))
+        by_url = {pi.source_url: pi for pi in existing if pi.source_url}
+        if not by_url and len(existing) == len(urls):
+            # Imported before source URLs were recorded; images were saved in
+            # page order, so adopt them instead of downloading them again.
+            for pi, url in zip(existing, urls):
+                pi.source_url = url
+            ProductImage.objects.bulk_update(existing, ["source_url"])
+            return []
+        for url, pi in by_url.items():
+            if url not in urls:
+                pi.delete()
+                self.diff["images_removed"] += 1
+        return [url for url in urls if url not in by_url]
+
+    def write_images(self, groups):
+        """
+        Store and attach processed images, [(product, [(url, data), ...])],
+        in one transaction. Files and derivatives are written first, outside
+        of it; products without a main image get their first new image.
+        Images whose bytes the product already has are skipped, and images
+        that look like another image of the product are flagged as its
+        near-duplicates.
+        """
+        started = time.perf_counter()
+        staged = [
+            (product, url, store_image(data), fingerprint(data))
+            for product, images in groups
+            for url, data in images
+        ]
+        if not staged:
+            return []
+        names = {name for _, _, name, _ in staged}
+        product_ids = {product.pk for product, _, _, _ in staged}
+        attached = set()
+        variants = {}
+        known = {}
+        existing = ProductImage.objects.filter(Q(image__in=names) | Q(product__in=product_ids)).only(
+            "product_id", "image", "variants", "content_hash", "perceptual_hash")
+        for image in existing:
+            name = image.image.name
+            if image.product_id in product_ids:
+                attached.update({(image.product_id, name), (image.product_id, image.content_hash)})
+                known.setdefault(image.product_id, []).append(image)
+            if image.variants and image.variants.get("source") == name and image.variants.get("files"):
+                variants[name] = image.variants
+
+        new, similar = [], []
+        for product, url, name, (digest, phash) in staged:
+            if (product.pk, name) in attached or (product.pk, digest) in attached:
+                continue
+            attached.update({(product.pk, name), (product.pk, digest)})
+            if name not in variants:
+                try:
+                    variants[name] = build_variants(name)
+                except OSError as exc:
+                    logger.warning("No derivatives for %s: %s", name, exc)
+                    variants[name] = {}
+            image = ProductImage(product=product, image=name, source_url=url, variants=variants[name],
+                                 content_hash=digest, perceptual_hash=phash)
+            match = find_near_duplicate(phash, known.get(product.pk, ()))
+            if match is not None:
+                similar.append((image, match))
+            known.setdefault(product.pk, []).append(image)
+            new.append(image)
+        self.file_seconds += time.perf_counter() - started
+
+        now = timezone.now()
+        touched = {}
+        with transaction.atomic():
+            ProductImage.objects.bulk_create(new)
+            if similar:
+                # Matches may be new themselves, so their keys are only
+                # known now.
+                for image, match in similar:
+                    image.near_duplicate_of_id = match.pk
+                ProductImage.objects.bulk_update([image for image, _ in similar], ["near_duplicate_of"])
+            for image in new:
+                product = touched.setdefault(image.product_id, image.product)
+                product.updated_at = now
+                if product.main_image_id is None:
+                    product.main_image = image
+            Product.objects.bulk_update(touched.values(), ["main_image", "updated_at"])
+        if new:
+            invalidate_navigation_tree()
+            page_cache.invalidate_all()
+            CatalogVersion.bump()
+        self.diff["images_added"] += len(new)
+        self.diff["images_similar"] += len(similar)
+        self._count(len(new) + len(similar) + len(touched), started)
+        return new
+
+    def _count(self, rows, started):
+        self.rows += rows
+        self.seconds += time.perf_counter() - started
+
+    def summary(self):
+        db_seconds = self.seconds - self.file_seconds
+        rate = self.rows / db_seconds if db_seconds else 0
+        return (f"Wrote {self.rows} rows in {db_seconds:.2f}s ({rate:.0f} rows/s), "
+                f"plus {self.file_seconds:.2f}s writing image files and derivatives")
@@ -0,0 +1,6 @@
+from .navigation import get_navigation_tree
+
+
+def navigation(request):
+    """Category menu shared by every page (see core.navigation)."""
+    return {'nav_categories': get_navigation_tree()}
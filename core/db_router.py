@@ -0,0 +1,82 @@
+"""
+Routing between the primary database and the optional `replica` alias.
+
+Writes, migrations and every read outside a request (management
+commands, the scraper, the upload worker) use the primary. Reads move to
+the replica only inside a request that ReplicaMiddleware lets through:
+a GET or HEAD to a view marked with @replica_reads, from a client that
+has not written in the last DB_REPLICA_STICKINESS seconds (tracked with
+a cookie set on every POST, such as an admin save or the contact form),
+while the catalog has not changed within that window either. The
+last rule keeps the page cache and the navigation tree from being
+rebuilt out of a replica that is still catching up.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import page_cache
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def replica_reads(view):
+    """Mark a view (function or class) whose queries may run on the replica."""
+    view.replica_reads = True
+    return view
+
+
+def has_replica():
+    return REPLICA in connections.settings
+
+
+def _stickiness():
+    return getattr(settings, 'DB_REPLICA_STICKINESS', 10)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication.
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _read_alias.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if request.method not in SAFE_METHODS and has_replica():
+            response.set_cookie(STICKY_COOKIE, '1', max_age=_stickiness(), httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        if (
+            request.method in SAFE_METHODS
+            and getattr(view, 'replica_reads', False)
+            and STICKY_COOKIE not in request.COOKIES
+            and has_replica()
+            and not page_cache.changed_within(_stickiness())
+        ):
+            _read_alias.set(REPLICA)
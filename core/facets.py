@@ -0,0 +1,107 @@
+from django.db.models import Count, Max
+from django.utils.text import slugify
+
+from .models import ProductAttribute
+
+# URL parameter holding selected facets, repeated as ?f=<key>:<value>.
+FACET_PARAM = 'f'
+MAX_FACETS = 8
+MAX_VALUES = 15
+
+
+def iter_attributes(features):
+    """
+    Yield distinct (key, label, value) triples for the facetable entries of
+    a Product.features list; entries without a value are skipped.
+    """
+    seen = set()
+    for item in features or ():
+        label = ' '.join(str(item.get('k') or '').split())[:200]
+        value = ' '.join(str(item.get('v') or '').split())[:200]
+        key = slugify(label)[:100]
+        if not key or not value or (key, value) in seen:
+            continue
+        seen.add((key, value))
+        yield key, label, value
+
+
+def sync_product_attributes(products):
+    """Rebuild the attribute rows of `products` from their features."""
+    products = list(products)
+    ProductAttribute.objects.filter(product__in=[p.pk for p in products]).delete()
+    ProductAttribute.objects.bulk_create([
+        ProductAttribute(product_id=product.pk, key=key, label=label, value=value)
+        for product in products
+        for key, label, value in iter_attributes(product.features)
+    ])
+
+
+def parse_facet_params(values):
+    """['lungime:1200 mm', ...] -> {'lungime': {'1200 mm'}, ...}"""
+    selected = {}
+    for raw in values:
+        key, sep, value = raw.partition(':')
+        key, value = key.strip(), value.strip()
+        if sep and key and value:
+            selected.setdefault(key, set()).add(value)
+    return selected
+
+
+def filter_by_facets(queryset, selected):
+    """
+    Keep products having, for every selected key, one of its selected
+    values (AND across keys, OR within a key).
+    """
+    for key, values in selected.items():
+        queryset = queryset.filter(pk__in=ProductAttribute.objects.filter(
+            key=key, value__in=values
+        ).values('product_id'))
+    return queryset
+
+
+def _value_counts(queryset):
+    return (
+        ProductAttribute.objects
+        .filter(product__in=queryset.order_by().values('pk'))
+        .values('key', 'value')
+        .annotate(count=Count('product_id'), label=Max('label'))
+        .order_by()
+    )
+
+
+def facet_counts(queryset, selected=None):
+    """
+    Facets for the products in `queryset` (before facet filtering), computed
+    with GROUP BYs over the attribute index:
+    [{'key', 'label', 'values': [{'value', 'count', 'selected'}, ...]}, ...]
+    Unselected keys are counted over the products matching every selected
+    facet; a selected key is counted over the products matching the other
+    keys only, so its remaining values can still be added (OR within a
+    key). That is one query, plus one per selected key. Keys with a single
+    value are dropped unless selected; the most common keys and values
+    come first.
+    """
+    selected = selected or {}
+    rows = list(_value_counts(filter_by_facets(queryset, selected)).exclude(key__in=list(selected)))
+    for key in selected:
+        others = {k: values for k, values in selected.items() if k != key}
+        rows.extend(_value_counts(filter_by_facets(queryset, others)).filter(key=key))
+    facets = {}
+    for row in rows:
+        facet = facets.setdefault(row['key'], {'key': row['key'], 'label': row['label'], 'values': [], 'total': 0})
+        facet['values'].append({
+            'value': row['value'],
+            'count': row['count'],
+            'selected': row['value'] in selected.get(row['key'], ()),
+        })
+        facet['total'] += row['count']
+
+    result = []
+    for facet in facets.values():
+        if len(facet['values']) < 2 and facet['key'] not in selected:
+            continue
+        facet['values'].sort(key=lambda v: (not v['selected'], -v['count'], v['value']))
+        facet['values'] = facet['values'][:MAX_VALUES]
+        result.append(facet)
+    result.sort(key=lambda f: (f['key'] not in selected, -f['total'], f['label']))
+    return result[:MAX_FACETS]
@@ -0,0 +1,71 @@
+# Product features are stored as a JSON list of {'k': key, 'v': value} pairs.
+# These helpers convert the legacy free-text forms into that shape; they run
+# when data is written (admin, scraper, migration), never while rendering.
+import ast
+import re
+
+
+def _strip_quotes(s):
+    return s.strip().strip("'\" ")
+
+
+def parse_features(value):
+    """
+    Parse features into a list of dicts: [{'k': key, 'v': value}, ...]
+    Handles lists, Python-list strings, newline or comma separated text.
+    If a line has no ':' then the whole line becomes `k` and `v` is ''.
+    Lists that are already structured are returned normalized.
+    """
+    if not value:
+        return []
+
+    # If already a list/tuple, use it directly
+    if isinstance(value, (list, tuple)):
+        seq = value
+    else:
+        s = str(value).strip()
+        seq = None
+        try:
+            if s.startswith('[') and s.endswith(']'):
+                parsed = ast.literal_eval(s)
+                seq = parsed if isinstance(parsed, (list, tuple)) else [s]
+            else:
+                if '\n' in s:
+                    seq = s.splitlines()
+                else:
+                    seq = re.split(r'\s*,\s*', s) if ',' in s else [s]
+        except Exception:
+            seq = s.splitlines()
+
+    out = []
+    for item in seq:
+        if item is None:
+            continue
+        if isinstance(item, dict):
+            k = str(item.get('k') or '').strip()
+            v = str(item.get('v') or '').strip()
+            if k or v:
+                out.append({'k': k, 'v': v})
+            continue
+        it = _strip_quotes(str(item))
+        if not it:
+            continue
+        if ':' in it:
+            k, v = it.split(':', 1)
+            k = k.strip()
+            v = v.strip()
+        else:
+            k = it.strip()
+            v = ''
+        out.append({'k': k, 'v': v})
+    return out
+
+
+def has_feature_values(features):
+    """True if at least one feature has a non-empty value."""
+    return any(item.get('v') for item in features or ())
+
+
+def features_to_text(features):
+    """One "Key: Value" line per feature, as edited in the admin."""
+    return '\n'.join(f"{f['k']}: {f['v']}" if f.get('v') else f['k'] for f in features or ())
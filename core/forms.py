@@ -1,5 +1,96 @@
+from urllib.parse import urlencode
+
 from django import forms
-from .models  import Category
+from django.urls import reverse
+from .features import features_to_text, parse_features
+from .models  import Category, ProductImage
+
+# ProductImage lookups for the scopes an image picker can be limited to.
+IMAGE_SCOPES = {
+    'product': 'product',
+    'category': 'product__category',
+    'subcategory': 'product__subcategory',
+}
+
+
+class FeaturesField(forms.CharField):
+    """
+    Edits Product.features as one "Key: Value" line per feature and cleans
+    it into the stored [{'k': ..., 'v': ...}] list.
+    """
+    widget = forms.Textarea(attrs={"rows": 8})
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("help_text", "Câte o caracteristică pe rând, sub forma „Cheie: Valoare”.")
+        super().__init__(strip=False, **kwargs)
+
+    def prepare_value(self, value):
+        if isinstance(value, (list, tuple)):
+            return features_to_text(value)
+        return value
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        # Line by line, so commas inside a value are kept.
+        return parse_features(value.splitlines())
+
+class ImageAutocompleteSelect(forms.Select):
+    """
+    Renders only the selected image; the others are searched a page at a
+    time, with thumbnails, from the admin's image autocomplete endpoint.
+    """
+
+    class Media:
+        css = {'screen': ('admin/css/vendor/select2/select2.min.css', 'admin/css/autocomplete.css')}
+        js = (
+            'admin/js/vendor/jquery/jquery.min.js',
+            'admin/js/vendor/select2/select2.full.min.js',
+            'admin/js/jquery.init.js',
+            'js/admin-image-autocomplete.js',
+        )
+
+    def __init__(self, attrs=None):
+        super().__init__(attrs)
+        self.scope = {}
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs.update({
+            'class': 'admin-image-autocomplete',
+            'data-ajax--url': f"{reverse('admin:core_image_autocomplete')}?{urlencode(self.scope)}",
+            'data-ajax--delay': 250,
+            'data-ajax--cache': 'true',
+            'data-theme': 'admin-autocomplete',
+            'data-allow-clear': 'true',
+            'data-placeholder': '',
+        })
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        options = [self.create_option(name, '', '', False, 0)]
+        selected = [v for v in value if v not in field.empty_values]
+        if selected:
+            for obj in field.queryset.filter(pk__in=selected):
+                options.append(self.create_option(name, obj.pk, field.label_from_instance(obj), True, len(options)))
+        return [(None, options, 0)]
+
+
+class MainImageField(forms.ModelChoiceField):
+    """
+    Picks a ProductImage among the images of one product, category or
+    subcategory, see limit_to().
+    """
+    widget = ImageAutocompleteSelect
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('label', 'Main image')
+        super().__init__(queryset=ProductImage.objects.none(), required=False, **kwargs)
+
+    def limit_to(self, scope, pk):
+        self.queryset = ProductImage.objects.filter(**{IMAGE_SCOPES[scope]: pk}).select_related('product')
+        self.widget.scope = {scope: pk}
+
 
 class ContactForm(forms.Form):
     fullname = forms.CharField(
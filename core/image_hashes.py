@@ -0,0 +1,60 @@
+"""
+Content and perceptual fingerprints of product images.
+
+content_hash is the SHA-256 of the stored bytes, so equal hashes mean the
+same file. perceptual_hash is a 64-bit difference hash (dHash) of the
+picture as 16 hex digits: resized, re-encoded or recompressed copies of an
+image differ from it in a few bits (see hamming()), unrelated images in
+about half of them.
+"""
+import hashlib
+import io
+
+from django.core.files.storage import default_storage
+from PIL import Image
+
+HASH_SIZE = 8
+# Images of one product this close are flagged as near-duplicates.
+NEAR_DUPLICATE_BITS = 6
+
+
+def perceptual_hash(img):
+    if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+        # Product images are padded with transparency; judge them on white.
+        rgba = img.convert('RGBA')
+        img = Image.new('RGBA', rgba.size, 'white')
+        img.alpha_composite(rgba)
+    small = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            bits = bits << 1 | (pixels[offset + col] > pixels[offset + col + 1])
+    return f'{bits:0{HASH_SIZE * HASH_SIZE // 4}x}'
+
+
+def fingerprint(data):
+    """(content_hash, perceptual_hash) of the image bytes in `data`."""
+    with Image.open(io.BytesIO(data)) as img:
+        phash = perceptual_hash(img)
+    return hashlib.sha256(data).hexdigest(), phash
+
+
+def fingerprint_file(name, storage=default_storage):
+    with storage.open(name, 'rb') as fp:
+        return fingerprint(fp.read())
+
+
+def hamming(a, b):
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def find_near_duplicate(phash, images, max_bits=NEAR_DUPLICATE_BITS):
+    """The first of `images` whose perceptual hash is within `max_bits` of `phash`."""
+    if not phash:
+        return None
+    for image in images:
+        if image.perceptual_hash and hamming(phash, image.perceptual_hash) <= max_bits:
+            return image
+    return None
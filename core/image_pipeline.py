@@ -0,0 +1,117 @@
+"""
+CPU-bound stage of image imports: decode, fit onto the product canvas and
+encode, run in a process pool.
+
+Producers (the scraper's download threads, or the process_images command
+reading a directory) hand raw bytes to TransformPool.submit(). At most
+`max_pending` images are queued or in flight; submit() blocks beyond that,
+which throttles the producers to the speed of the pool. A bad image fails
+only its own future, and a crashed worker process is replaced and the
+images it took down are retried once.
+"""
+import io
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+CANVAS_SIZE = (580, 760)
+
+
+def transform_image(data):
+    """
+    Fit the image in `data` onto a transparent CANVAS_SIZE canvas and return
+    it PNG-encoded.
+    """
+    with Image.open(io.BytesIO(data)) as src:
+        img = src.convert("RGBA")
+    w, h = img.size
+    target_w, target_h = CANVAS_SIZE
+    if h > w:
+        new_h = target_h
+        new_w = int(w * (new_h / h))
+    else:
+        new_w = target_w
+        new_h = int(h * (new_w / w))
+    img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
+    canvas = Image.new("RGBA", (target_w, target_h), (0, 0, 0, 0))
+    canvas.paste(img, ((target_w - new_w) // 2, (target_h - new_h) // 2))
+    buf = io.BytesIO()
+    canvas.save(buf, "PNG")
+    return buf.getvalue()
+
+
+class TransformPool:
+
+    def __init__(self, workers=None, max_pending=None, transform=transform_image):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.transform = transform
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Wait for the queued images; later submits fail with RuntimeError."""
+        # Shut down outside the lock: the done callbacks of a crashed pool
+        # call _executor(), and shutdown() waits for them.
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._closed = True
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _executor(self, replace=None):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("TransformPool is closed")
+            if self._pool is None or self._pool is replace:
+                if self._pool is not None:
+                    self._pool.shutdown(wait=False)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            return self._pool
+
+    def submit(self, data):
+        """
+        Queue `data` for transformation; blocks while the queue is full.
+        Returns a Future resolving to the transformed bytes.
+        """
+        self._slots.acquire()
+        result = Future()
+        result.add_done_callback(lambda _: self._slots.release())
+        self._dispatch(data, result, retry=True)
+        return result
+
+    def _dispatch(self, data, result, retry, broken=None):
+        # Any failure must end up in `result`: its callback releases the
+        # queue slot, and the caller waits on it.
+        try:
+            executor = self._executor(replace=broken)
+            try:
+                inner = executor.submit(self.transform, data)
+            except BrokenProcessPool:
+                inner = self._executor(replace=executor).submit(self.transform, data)
+        except Exception as exc:
+            result.set_exception(exc)
+            return
+
+        def done(inner):
+            exc = inner.exception()
+            # No retry once close() has taken the pool away.
+            if isinstance(exc, BrokenProcessPool) and retry and not self._closed:
+                self._dispatch(data, result, retry=False, broken=executor)
+            elif exc is not None:
+                result.set_exception(exc)
+            else:
+                result.set_result(inner.result())
+
+        inner.add_done_callback(done)
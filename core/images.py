@@ -0,0 +1,171 @@
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, features
+
+from .image_hashes import find_near_duplicate, fingerprint_file
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+# Widths generated for every product image; widths above the source width
+# are replaced by the source width itself.
+DERIVATIVE_WIDTHS = (320, 640, 960)
+DERIVATIVE_DIR = 'products/derivatives'
+
+# Best format first; AVIF is skipped when Pillow was built without it.
+DERIVATIVE_FORMATS = [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+ENCODER_OPTIONS = {
+    'avif': {'quality': 55},
+    'webp': {'quality': 80, 'method': 4},
+}
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+
+def target_widths(source_width):
+    widths = [w for w in DERIVATIVE_WIDTHS if w < source_width]
+    widths.append(min(source_width, DERIVATIVE_WIDTHS[-1]))
+    return sorted(set(widths))
+
+
+def render_derivatives(fp):
+    """
+    Decode the image in `fp` once and yield (format, width, height, bytes)
+    for every derivative.
+    """
+    with Image.open(fp) as img:
+        img.load()
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        for width in target_widths(img.width):
+            height = max(1, round(img.height * width / img.width))
+            resized = img if width == img.width else img.resize((width, height), Image.Resampling.LANCZOS)
+            for fmt in DERIVATIVE_FORMATS:
+                buf = io.BytesIO()
+                resized.save(buf, fmt.upper(), **ENCODER_OPTIONS[fmt])
+                yield fmt, width, height, buf.getvalue()
+
+
+def derivative_name(source_name, width, fmt):
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+    return f'{DERIVATIVE_DIR}/{stem}-{width}.{fmt}'
+
+
+def build_variants(source_name, storage=default_storage):
+    """
+    Write the derivatives of `source_name` to `storage` and return the
+    value stored in ProductImage.variants.
+    """
+    files = []
+    with storage.open(source_name, 'rb') as fp:
+        for fmt, width, height, data in render_derivatives(fp):
+            name = storage.save(derivative_name(source_name, width, fmt), ContentFile(data))
+            files.append({'format': fmt, 'width': width, 'height': height, 'name': name})
+    return {'source': source_name, 'files': files}
+
+
+def delete_variants(variants, keep=(), storage=default_storage):
+    for item in (variants or {}).get('files', ()):
+        if item['name'] not in keep:
+            storage.delete(item['name'])
+
+
+def variants_are_current(product_image):
+    variants = product_image.variants or {}
+    return bool(variants.get('files')) and variants.get('source') == product_image.image.name
+
+
+def shared_variants(product_image):
+    """
+    Variants of another ProductImage stored under the same file name
+    (ingested images are named by content, so products can share them).
+    """
+    name = product_image.image.name
+    others = ProductImage.objects.filter(image=name).exclude(pk=product_image.pk).values_list('variants', flat=True)
+    for variants in others:
+        if variants and variants.get('source') == name and variants.get('files'):
+            return variants
+    return None
+
+
+def release_variants(product_image):
+    """Delete the derivatives of a removed image unless another image shares them."""
+    if not ProductImage.objects.filter(image=product_image.image.name).exclude(pk=product_image.pk).exists():
+        delete_variants(product_image.variants)
+
+
+def release_image_file(product_image, storage=default_storage):
+    """
+    Delete the file of a removed image once the transaction commits, unless
+    another image uses it by then.
+    """
+    name = product_image.image.name
+    if not name:
+        return
+
+    def delete():
+        if not ProductImage.objects.filter(image=name).exists():
+            storage.delete(name)
+
+    transaction.on_commit(delete, using=product_image._state.db)
+
+
+def generate_derivatives(product_image):
+    """
+    (Re)build the derivatives of a ProductImage and store them on it. A
+    missing or unreadable source is logged and left for the
+    generate_image_derivatives command to retry.
+    """
+    if not product_image.image:
+        return
+    stale = product_image.variants
+    try:
+        variants = shared_variants(product_image) or build_variants(product_image.image.name)
+    except OSError as exc:
+        logger.warning('No derivatives for %s: %s', product_image.image.name, exc)
+        return
+    ProductImage.objects.filter(pk=product_image.pk).update(variants=variants)
+    product_image.variants = variants
+    shared = ProductImage.objects.filter(image=(stale or {}).get('source')).exclude(pk=product_image.pk)
+    if stale and not shared.exists():
+        delete_variants(stale, keep={f['name'] for f in variants['files']})
+
+
+def fingerprint_image(product_image):
+    """
+    Store the content and perceptual hashes of a ProductImage and flag it
+    if it looks like another image of the same product. A missing or
+    unreadable file is logged and left for the dedupe_images command.
+    """
+    if not product_image.image:
+        return
+    try:
+        content_hash, phash = fingerprint_file(product_image.image.name)
+    except OSError as exc:
+        logger.warning('No fingerprint for %s: %s', product_image.image.name, exc)
+        return
+    others = ProductImage.objects.filter(product_id=product_image.product_id).exclude(pk=product_image.pk)
+    similar = find_near_duplicate(phash, others.exclude(perceptual_hash='').only('pk', 'perceptual_hash'))
+    product_image.content_hash = content_hash
+    product_image.perceptual_hash = phash
+    product_image.near_duplicate_of = similar
+    ProductImage.objects.filter(pk=product_image.pk).update(
+        content_hash=content_hash, perceptual_hash=phash, near_duplicate_of=similar)
+
+
+def picture_sources(variants, storage=default_storage):
+    """[{'type': 'image/avif', 'srcset': 'a-320.avif 320w, ...'}, ...]"""
+    files = (variants or {}).get('files', ())
+    sources = []
+    for fmt in DERIVATIVE_FORMATS:
+        items = sorted((f for f in files if f['format'] == fmt), key=lambda f: f['width'])
+        if items:
+            sources.append({
+                'type': MIME_TYPES[fmt],
+                'srcset': ', '.join(f"{storage.url(f['name'])} {f['width']}w" for f in items),
+            })
+    return sources
@@ -0,0 +1,72 @@
+"""
+Store processed product images straight from memory.
+
+Files are named after the SHA-256 of their bytes, so identical images are
+stored once however often they are imported. On the local filesystem the
+bytes are written to a temporary file next to the target and renamed into
+place, so a reader never sees a partial image.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+from .models import ProductImage
+
+INGEST_DIR = ProductImage._meta.get_field('image').upload_to
+
+
+def content_name(data, ext='png'):
+    digest = hashlib.sha256(data).hexdigest()
+    return f'{INGEST_DIR}/{digest[:2]}/{digest}.{ext}'
+
+
+def _write_atomic(storage, name, data):
+    path = storage.path(name)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.ingest-')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.chmod(tmp, storage.file_permissions_mode or 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def store_image(data, ext='png', storage=default_storage):
+    """Write `data` once under its content name and return that name."""
+    name = content_name(data, ext)
+    if storage.exists(name):
+        return name
+    try:
+        storage.path(name)
+    except NotImplementedError:
+        # Remote storages write objects in one request anyway.
+        return storage.save(name, ContentFile(data))
+    _write_atomic(storage, name, data)
+    return name
+
+
+def ingest_image(product, data, source_url='', ext='png'):
+    """
+    Store `data` and attach it to `product`, reusing the product's existing
+    image when it already has these exact bytes. The new image is
+    fingerprinted, and flagged if it is a near-duplicate, by the post_save
+    signal.
+    """
+    name = store_image(data, ext)
+    digest = hashlib.sha256(data).hexdigest()
+    existing = product.images.filter(Q(image=name) | Q(content_hash=digest)).first()
+    if existing is not None:
+        return existing
+    image = ProductImage(product=product, source_url=source_url)
+    image.image.name = name
+    image.save()
+    return image
@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.facets import facet_counts, sync_product_attributes
+from core.models import Category, Product
+
+ATTRIBUTES = {
+    'Lungime': ['600 mm', '800 mm', '1000 mm', '1200 mm', '1400 mm', '1600 mm', '1800 mm', '2000 mm'],
+    'Lățime': ['600 mm', '700 mm', '800 mm'],
+    'Înălțime': ['850 mm', '900 mm'],
+    'Material': ['AISI 304', 'AISI 430', 'AISI 201'],
+    'Putere': ['0.75 kW', '1.1 kW', '1.5 kW', '2.2 kW', '3 kW'],
+    'Tensiune': ['230 V', '400 V'],
+    'Greutate': [f'{w} kg' for w in range(10, 200, 10)],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time facet counts on a synthetic catalog. Everything is created "
+        "inside a transaction and rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        with transaction.atomic():
+            categories = self.seed(rnd, options['products'], options['categories'])
+            products = Product.objects.filter(category__in=categories)
+            one_category = products.filter(category=categories[0])
+            selected = {'material': {'AISI 304'}}
+            for label, queryset, facets in [('all products', products, None),
+                                            ('one category', one_category, None),
+                                            ('category + facet', one_category, selected)]:
+                timing = self.time(lambda: facet_counts(queryset, facets), options['repeat'])
+                self.stdout.write(f"{label:18} {timing * 1000:8.2f} ms")
+            transaction.set_rollback(True)
+
+    def seed(self, rnd, count, category_count):
+        started = time.perf_counter()
+        categories = [
+            Category.objects.create(name=f'Benchmark facets {i}', slug=f'benchmark-facets-{i}')
+            for i in range(category_count)
+        ]
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=f'Produs {i}',
+                slug=f'benchmark-facets-{i}',
+                description='',
+                features=[
+                    {'k': key, 'v': rnd.choice(values)}
+                    for key, values in ATTRIBUTES.items() if rnd.random() < 0.8
+                ],
+                category=rnd.choice(categories),
+            ))
+            if len(batch) == 5000:
+                sync_product_attributes(Product.objects.bulk_create(batch))
+                batch = []
+        sync_product_attributes(Product.objects.bulk_create(batch))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE' if connection.vendor == 'sqlite' else 'ANALYZE core_productattribute')
+        self.stdout.write(f"Seeded {count} products in {time.perf_counter() - started:.1f}s")
+        return categories
+
+    @staticmethod
+    def time(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
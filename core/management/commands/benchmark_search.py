@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from core.models import Category, Product
+from core.search import refresh_search_vectors, search_products, uses_full_text_search
+
+WORDS = [
+    'masa', 'masă', 'inox', 'oțel', 'oţel', 'dulap', 'raft', 'chiuvetă', 'cărucior',
+    'tocător', 'carne', 'mâner', 'înălțime', 'lungime', 'lățime', 'AISI', '304',
+    'profesional', 'bucătărie', 'horeca', 'frigorific', 'ventilat', 'cuptor',
+]
+QUERIES = ['masa inox', 'otel', 'carucior', 'tocator carne', 'aisi 304', 'latime']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare full-text search with the legacy ILIKE search on a synthetic "
+        "catalog. Everything is created inside a transaction and rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not uses_full_text_search():
+            self.stderr.write("Full-text search needs PostgreSQL; only the ILIKE path will be timed.")
+        rnd = random.Random(options['seed'])
+
+        with transaction.atomic():
+            self.seed(rnd, options['products'])
+            for query in QUERIES:
+                ilike = self.time(lambda: list(self.ilike(query)[:50]), options['repeat'])
+                fts = self.time(lambda: list(search_products(Product.objects.all(), query)[:50]), options['repeat'])
+                self.stdout.write(
+                    f"{query!r:18} ilike {ilike * 1000:8.2f} ms   fts {fts * 1000:8.2f} ms"
+                )
+            transaction.set_rollback(True)
+
+    def seed(self, rnd, count):
+        category = Category.objects.create(name='Benchmark', slug='benchmark-search')
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=' '.join(rnd.choices(WORDS, k=4)) + f' {i}',
+                slug=f'benchmark-search-{i}',
+                description=' '.join(rnd.choices(WORDS, k=40)),
+                features=str([f'{rnd.choice(WORDS)}: {rnd.randint(100, 2000)} mm' for _ in range(6)]),
+                category=category,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        refresh_search_vectors(Product.objects.filter(category=category))
+        if uses_full_text_search():
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE core_product')
+        self.stdout.write(f"Seeded {count} products in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def ilike(query):
+        return Product.objects.filter(
+            Q(name__icontains=query) | Q(description__icontains=query) | Q(features__icontains=query)
+        ).order_by('-created_at')
+
+    @staticmethod
+    def time(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
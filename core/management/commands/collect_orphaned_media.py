@@ -0,0 +1,64 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core.media_gc import MIN_AGE, delete_orphans, find_orphans, remove_empty_dirs
+
+
+def megabytes(size):
+    return f'{size / 1024 / 1024:.1f} MB'
+
+
+class Command(BaseCommand):
+    help = (
+        "Find product image files and derivatives that no ProductImage refers "
+        "to, report the space they take and delete them. Use --dry-run to "
+        "only report; -v 2 lists the files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--min-age', type=int, default=MIN_AGE,
+                            help='seconds since a file was written before it may be collected')
+        parser.add_argument('--workers', type=int, default=8, help='threads walking the directories')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            default_storage.path('')
+        except NotImplementedError:
+            raise CommandError('collect_orphaned_media needs a local filesystem storage.')
+
+        started = time.perf_counter()
+        by_dir = {}
+
+        def report(orphans):
+            for name, size in orphans:
+                top = '/'.join(name.split('/')[:2])
+                count, total = by_dir.get(top, (0, 0))
+                by_dir[top] = (count + 1, total + size)
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'  {name} ({size} bytes)')
+                yield name, size
+
+        orphans = report(find_orphans(min_age=options['min_age'], workers=options['workers']))
+        if options['dry_run']:
+            for _ in orphans:
+                pass
+        else:
+            deleted, reclaimed = delete_orphans(orphans, batch_size=options['batch_size'])
+            dirs = remove_empty_dirs()
+
+        for path, (count, total) in sorted(by_dir.items()):
+            self.stdout.write(f'{path}: {count} files, {megabytes(total)}')
+        count = sum(c for c, _ in by_dir.values())
+        total = sum(t for _, t in by_dir.values())
+        elapsed = time.perf_counter() - started
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'{count} orphaned files, {megabytes(total)} reclaimable (dry run, {elapsed:.1f}s).'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {deleted} of {count} orphaned files, {megabytes(reclaimed)} reclaimed, '
+                f'{dirs} empty directories removed in {elapsed:.1f}s.'))
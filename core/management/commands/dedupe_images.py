@@ -0,0 +1,163 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Case, Count, Value, When
+
+from core import page_cache
+from core.image_hashes import NEAR_DUPLICATE_BITS, find_near_duplicate, fingerprint_file
+from core.models import CatalogVersion, Category, Product, ProductImage, SubCategory
+from core.navigation import invalidate_navigation_tree
+
+# Everything that can point at a ProductImage through a main_image key.
+MAIN_IMAGE_MODELS = (Product, Category, SubCategory)
+
+
+def _fingerprint(pk, name):
+    # Runs in a worker process: only touches storage, never the database.
+    try:
+        return pk, fingerprint_file(name), None
+    except Exception as exc:
+        return pk, None, f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    help = (
+        "Fingerprint product images in parallel, delete the copies a product "
+        "has of the same image (repointing main_image keys to the kept copy) "
+        "and flag near-duplicates. Files left unreferenced are removed by "
+        "collect_orphaned_media."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--distance', type=int, default=NEAR_DUPLICATE_BITS,
+                            help='max differing perceptual hash bits of a near-duplicate')
+        parser.add_argument('--rehash', action='store_true', help='fingerprint images that already have hashes')
+        parser.add_argument('--dry-run', action='store_true', help='report duplicates without deleting them')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        hashed = self.fingerprint(options)
+        removed = self.remove_duplicates(options['batch_size'], options['dry_run'])
+        flagged = 0 if options['dry_run'] else self.flag_near_duplicates(options['distance'], options['batch_size'])
+
+        # The main_image updates send no signals.
+        if removed and not options['dry_run']:
+            invalidate_navigation_tree()
+            page_cache.invalidate_all()
+            CatalogVersion.bump()
+
+        verb = 'would be removed' if options['dry_run'] else 'removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{hashed} images fingerprinted, {removed} duplicates {verb}, '
+            f'{flagged} near-duplicates flagged in {time.perf_counter() - started:.1f}s.'
+        ))
+
+    def fingerprint(self, options):
+        images = ProductImage.objects.exclude(image='')
+        if not options['rehash']:
+            images = images.filter(content_hash='')
+        todo = dict(images.values_list('pk', 'image').iterator(chunk_size=2000))
+        if not todo:
+            return 0
+
+        # Forked workers must not share the parent's database sockets.
+        connections.close_all()
+        done = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = [pool.submit(_fingerprint, pk, name) for pk, name in todo.items()]
+            for future in as_completed(futures):
+                pk, hashes, error = future.result()
+                if error:
+                    self.stderr.write(f'image {pk}: {error}')
+                    continue
+                batch.append(ProductImage(pk=pk, content_hash=hashes[0], perceptual_hash=hashes[1]))
+                if len(batch) >= options['batch_size']:
+                    done += self.save_hashes(batch)
+                    batch = []
+            done += self.save_hashes(batch)
+        return done
+
+    def save_hashes(self, batch):
+        ProductImage.objects.bulk_update(batch, ['content_hash', 'perceptual_hash'])
+        return len(batch)
+
+    def remove_duplicates(self, batch_size, dry_run):
+        groups = (
+            ProductImage.objects.exclude(content_hash='')
+            .values('product_id', 'content_hash')
+            .annotate(n=Count('pk'))
+            .filter(n__gt=1)
+            .order_by('product_id')
+        )
+        removed = 0
+        batch = []
+        for group in groups.iterator(chunk_size=2000):
+            batch.append((group['product_id'], group['content_hash']))
+            if len(batch) >= batch_size:
+                removed += self.collapse(batch, dry_run)
+                batch = []
+        return removed + self.collapse(batch, dry_run)
+
+    def collapse(self, groups, dry_run):
+        """Keep one image per (product, content hash) and repoint the rest to it."""
+        if not groups:
+            return 0
+        product_ids = {product_id for product_id, _ in groups}
+        hashes = {content_hash for _, content_hash in groups}
+        main_images = set(
+            Product.objects.filter(pk__in=product_ids, main_image__isnull=False).values_list('main_image_id', flat=True)
+        )
+        copies = {}
+        images = ProductImage.objects.filter(product_id__in=product_ids, content_hash__in=hashes).order_by('pk')
+        for pk, product_id, content_hash in images.values_list('pk', 'product_id', 'content_hash'):
+            copies.setdefault((product_id, content_hash), []).append(pk)
+        keep = {}
+        for key in groups:
+            pks = copies.get(key, [])
+            # Prefer the copy the product shows as its main image.
+            kept = next((pk for pk in pks if pk in main_images), pks[0] if pks else None)
+            keep.update({pk: kept for pk in pks if pk != kept})
+        if dry_run or not keep:
+            return len(keep)
+
+        mapping = Case(*[When(main_image_id=pk, then=Value(kept)) for pk, kept in keep.items()])
+        near = Case(*[When(near_duplicate_of_id=pk, then=Value(kept)) for pk, kept in keep.items()])
+        with transaction.atomic():
+            for model in MAIN_IMAGE_MODELS:
+                model.objects.filter(main_image_id__in=keep).update(main_image_id=mapping)
+            ProductImage.objects.filter(near_duplicate_of_id__in=keep).update(near_duplicate_of_id=near)
+            # Row by row, so the post_delete signals release the derivatives.
+            ProductImage.objects.filter(pk__in=keep).delete()
+        return len(keep)
+
+    def flag_near_duplicates(self, distance, batch_size):
+        images = (
+            ProductImage.objects.exclude(perceptual_hash='')
+            .only('pk', 'product_id', 'perceptual_hash', 'near_duplicate_of_id')
+            .order_by('product_id', 'pk')
+        )
+        changed = []
+        flagged = 0
+        seen, product_id = [], None
+        for image in images.iterator(chunk_size=2000):
+            if image.product_id != product_id:
+                seen, product_id = [], image.product_id
+            match = find_near_duplicate(image.perceptual_hash, seen, distance)
+            seen.append(image)
+            flagged += match is not None
+            match_id = match.pk if match else None
+            if image.near_duplicate_of_id != match_id:
+                image.near_duplicate_of_id = match_id
+                changed.append(image)
+            if len(changed) >= batch_size:
+                ProductImage.objects.bulk_update(changed, ['near_duplicate_of'])
+                changed = []
+        if changed:
+            ProductImage.objects.bulk_update(changed, ['near_duplicate_of'])
+        return flagged
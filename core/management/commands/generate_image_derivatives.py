@@ -0,0 +1,83 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import page_cache
+from core.images import build_variants, delete_variants, variants_are_current
+from core.models import CatalogVersion, ProductImage
+from core.navigation import invalidate_navigation_tree
+
+
+def _build(pk, name):
+    # Runs in a worker process: only touches storage, never the database.
+    try:
+        return pk, build_variants(name), None
+    except Exception as exc:
+        return pk, None, f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the responsive WebP/AVIF derivatives of existing product "
+        "images in parallel. Images whose derivatives are up to date are "
+        "skipped unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--force', action='store_true')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='').only('pk', 'image', 'variants').order_by('pk')
+        todo = {
+            img.pk: img for img in images.iterator(chunk_size=1000)
+            if options['force'] or not variants_are_current(img)
+        }
+        if not todo:
+            self.stdout.write('All derivatives are up to date.')
+            return
+
+        # Forked workers must not share the parent's database sockets.
+        connections.close_all()
+        started = time.perf_counter()
+        done = failed = 0
+        batch = []
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = [pool.submit(_build, pk, img.image.name) for pk, img in todo.items()]
+            for future in as_completed(futures):
+                pk, variants, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'image {pk}: {error}')
+                    continue
+                batch.append((todo[pk], variants))
+                if len(batch) >= options['batch_size']:
+                    done += self.save(batch)
+                    batch = []
+            done += self.save(batch)
+
+        # bulk_update() sends no signals; the rendered pages still point at
+        # the old files.
+        if done:
+            invalidate_navigation_tree()
+            page_cache.invalidate_all()
+            CatalogVersion.bump()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{done} images processed, {failed} failed in {elapsed:.1f}s '
+            f'({done / elapsed if elapsed else 0:.1f} images/s).'
+        ))
+
+    def save(self, batch):
+        stale = [img.variants for img, _ in batch]
+        for img, variants in batch:
+            img.variants = variants
+        ProductImage.objects.bulk_update([img for img, _ in batch], ['variants'])
+        for old, (img, _) in zip(stale, batch):
+            delete_variants(old, keep={f['name'] for f in img.variants['files']})
+        return len(batch)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import page_cache
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss counters of the full-page cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after printing them.")
+        parser.add_argument('--clear', action='store_true', help="Invalidate every cached page.")
+
+    def handle(self, *args, **options):
+        stats = page_cache.stats()
+        self.stdout.write(
+            f"hits {stats['hits']}  misses {stats['misses']}  hit ratio {stats['hit_ratio']:.1%}"
+        )
+        if options['reset']:
+            page_cache.reset_stats()
+        if options['clear']:
+            page_cache.invalidate_all()
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import ImageUploadJob
+from core.upload_jobs import claim_next, requeue_stale, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Work through the images uploaded in the product admin: fit each onto "
+        "the product canvas, store it with its derivatives and attach it to "
+        "the product. Runs until stopped, or until the queue is empty with "
+        "--once. Several workers can run side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+        parser.add_argument('--poll', type=float, default=2.0, help='seconds between checks of an empty queue')
+        parser.add_argument('--stale-after', type=int, default=900,
+                            help='seconds after which a running job is assumed lost and queued again')
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        while True:
+            requeue_stale(options['stale_after'])
+            job = claim_next()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll'])
+                continue
+            started = time.perf_counter()
+            run(job)
+            if job.status == ImageUploadJob.DONE:
+                done += 1
+                self.stdout.write(f'{job.original_name}: done in {time.perf_counter() - started:.1f}s')
+            else:
+                failed += 1
+                self.stderr.write(f'{job.original_name}: {job.error}')
+        self.stdout.write(self.style.SUCCESS(f'{done} images processed, {failed} failed.'))
@@ -0,0 +1,71 @@
+import os
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.image_pipeline import TransformPool
+
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp', '.tif', '.tiff', '.avif')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the import image transform over a local directory of source "
+        "images, e.g. to benchmark the pool offline. Results are written to "
+        "--out when given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='directory of source images (searched recursively)')
+        parser.add_argument('--out', help='directory for the transformed PNGs')
+        parser.add_argument('--workers', type=int, default=None, help='processes (default: CPU count)')
+        parser.add_argument('--queue-size', type=int, default=None, help='images queued or in flight (default: 4 per worker)')
+        parser.add_argument('--limit', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options['source']):
+            raise CommandError(f"{options['source']} is not a directory")
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _dirs, files in os.walk(options['source'])
+            for name in files if name.lower().endswith(EXTENSIONS)
+        )[:options['limit']]
+        if options['out']:
+            os.makedirs(options['out'], exist_ok=True)
+
+        done = failed = 0
+        bytes_in = bytes_out = 0
+        started = time.perf_counter()
+        with TransformPool(workers=options['workers'], max_pending=options['queue_size']) as pool:
+            pending = deque()
+            for path in paths:
+                with open(path, 'rb') as fp:
+                    data = fp.read()
+                bytes_in += len(data)
+                # Blocks while the queue is full.
+                pending.append((path, pool.submit(data)))
+                while pending and pending[0][1].done():
+                    done, failed, bytes_out = self.collect(*pending.popleft(), options, done, failed, bytes_out)
+            while pending:
+                done, failed, bytes_out = self.collect(*pending.popleft(), options, done, failed, bytes_out)
+            workers, queue_size = pool.workers, pool.max_pending
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{done} images transformed, {failed} failed in {elapsed:.2f}s '
+            f'({done / elapsed if elapsed else 0:.1f} images/s, {workers} workers, queue {queue_size}); '
+            f'{bytes_in / 1e6:.1f} MB in, {bytes_out / 1e6:.1f} MB out.'
+        ))
+
+    def collect(self, path, future, options, done, failed, bytes_out):
+        try:
+            data = future.result()
+        except Exception as exc:
+            self.stderr.write(f'{path}: {type(exc).__name__}: {exc}')
+            return done, failed + 1, bytes_out
+        if options['out']:
+            name = os.path.splitext(os.path.relpath(path, options['source']))[0].replace(os.sep, '_')
+            with open(os.path.join(options['out'], f'{name}.png'), 'wb') as fp:
+                fp.write(data)
+        return done + 1, failed, bytes_out + len(data)
@@ -0,0 +1,115 @@
+"""
+Find and delete product media files that no database row refers to.
+
+The referenced names (every ProductImage file and its derivatives) are
+streamed from a values_list() iterator into a set. The media directories
+are then walked a directory at a time on a thread pool, and each
+unreferenced file is yielded as soon as it is found, so the file listing
+is never held in memory.
+
+Deletion is guarded three ways. Files newer than `min_age` are left
+alone, since an import may be about to attach them. Each batch of
+candidates is checked against the database again right before it is
+deleted. Only the directories the models write to are walked.
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.files.storage import default_storage
+
+from .images import DERIVATIVE_DIR
+from .ingest import INGEST_DIR
+from .models import ProductImage
+
+MEDIA_DIRS = (INGEST_DIR, DERIVATIVE_DIR)
+MIN_AGE = 3600
+
+
+def referenced_names(chunk_size=2000):
+    names = set()
+    for image, variants in ProductImage.objects.values_list('image', 'variants').iterator(chunk_size=chunk_size):
+        if image:
+            names.add(image)
+        names.update(f['name'] for f in (variants or {}).get('files', ()))
+    return names
+
+
+def _scan(path):
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+    except FileNotFoundError:
+        pass
+    return files, dirs
+
+
+def walk(roots, workers=8):
+    """Yield (path, size, mtime) for every file below `roots`, scanning directories concurrently."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-walk') as pool:
+        pending = {pool.submit(_scan, root) for root in roots}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                pending.update(pool.submit(_scan, path) for path in dirs)
+                yield from files
+
+
+def find_orphans(storage=default_storage, min_age=MIN_AGE, workers=8):
+    """Yield (name, size) for each unreferenced media file older than `min_age` seconds."""
+    referenced = referenced_names()
+    root = storage.path('')
+    cutoff = time.time() - min_age
+    for path, size, mtime in walk([storage.path(d) for d in MEDIA_DIRS], workers):
+        name = os.path.relpath(path, root).replace(os.sep, '/')
+        if mtime < cutoff and name not in referenced:
+            yield name, size
+
+
+def delete_orphans(orphans, storage=default_storage, batch_size=500):
+    """
+    Delete the (name, size) pairs from find_orphans() in batches, skipping
+    any file a row took up since. Returns (files, bytes) deleted.
+    """
+    deleted = reclaimed = 0
+    batch = []
+
+    def flush():
+        nonlocal deleted, reclaimed
+        taken = set(ProductImage.objects.filter(image__in=[name for name, _ in batch]).values_list('image', flat=True))
+        for name, size in batch:
+            if name not in taken:
+                storage.delete(name)
+                deleted += 1
+                reclaimed += size
+        batch.clear()
+
+    for orphan in orphans:
+        batch.append(orphan)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return deleted, reclaimed
+
+
+def remove_empty_dirs(storage=default_storage):
+    """Remove the directories left empty below the media directories; returns how many."""
+    removed = 0
+    for top in MEDIA_DIRS:
+        top = storage.path(top)
+        for path, dirs, files in os.walk(top, topdown=False):
+            if path != top and not files:
+                try:
+                    os.rmdir(path)
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:09
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from core.search import ASCII_FOLD, DIACRITICS, SEARCH_CONFIG
+
+
+def create_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS "product_search_vector_gin" '
+        'ON "core_product" USING gin ("search_vector")'
+    )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS "product_search_vector_gin"')
+
+
+def backfill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    def weighted(column, weight):
+        return (
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+            f"lower(translate(coalesce({column}, ''), '{DIACRITICS}', '{ASCII_FOLD}'))), '{weight}')"
+        )
+
+    schema_editor.execute(
+        'UPDATE "core_product" SET "search_vector" = '
+        + ' || '.join([weighted('name', 'A'), weighted('features', 'B'), weighted('description', 'C')])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        # GIN only exists on PostgreSQL, so the index is created outside the
+        # model state; SQLite (used in tests) simply skips it.
+        migrations.RunPython(create_gin_index, drop_gin_index),
+        migrations.RunPython(backfill_search_vectors, migrations.RunPython.noop),
+    ]
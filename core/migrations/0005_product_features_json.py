@@ -0,0 +1,56 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+from core.features import features_to_text, parse_features
+
+
+def text_to_json(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    products = Product.objects.using(schema_editor.connection.alias).only('pk', 'features')
+    batch = []
+    for product in products.iterator(chunk_size=1000):
+        product.features_data = parse_features(product.features)
+        batch.append(product)
+        if len(batch) == 1000:
+            Product.objects.bulk_update(batch, ['features_data'])
+            batch = []
+    Product.objects.bulk_update(batch, ['features_data'])
+
+
+def json_to_text(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    products = Product.objects.using(schema_editor.connection.alias).only('pk', 'features_data')
+    batch = []
+    for product in products.iterator(chunk_size=1000):
+        product.features = features_to_text(product.features_data)
+        batch.append(product)
+        if len(batch) == 1000:
+            Product.objects.bulk_update(batch, ['features'])
+            batch = []
+    Product.objects.bulk_update(batch, ['features'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='features_data',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(text_to_json, json_to_text),
+        migrations.RemoveField(
+            model_name='product',
+            name='features',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='features_data',
+            new_name='features',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.facets import iter_attributes
+
+
+def build_attributes(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductAttribute = apps.get_model('core', 'ProductAttribute')
+    db = schema_editor.connection.alias
+    batch = []
+    for product_id, features in Product.objects.using(db).values_list('pk', 'features').iterator(chunk_size=1000):
+        batch.extend(
+            ProductAttribute(product_id=product_id, key=key, label=label, value=value)
+            for key, label, value in iter_attributes(features)
+        )
+        if len(batch) >= 5000:
+            ProductAttribute.objects.using(db).bulk_create(batch)
+            batch = []
+    ProductAttribute.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_product_features_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.SlugField(max_length=100)),
+                ('label', models.CharField(max_length=200)),
+                ('value', models.CharField(max_length=200)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='core.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Product Attributes',
+                'indexes': [models.Index(fields=['key', 'value', 'product'], name='product_attribute_lookup_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'key', 'value'), name='product_attribute_unique')],
+            },
+        ),
+        migrations.RunPython(build_attributes, migrations.RunPython.noop),
+    ]
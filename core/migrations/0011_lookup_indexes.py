@@ -0,0 +1,60 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:51
+
+import django.contrib.postgres.operations
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# Admin search and the image autocomplete filter products with
+# name/description__icontains, i.e. UPPER(col::text) LIKE '%...%'; a
+# trigram index on the same expression serves those without a full scan.
+TRIGRAM_INDEXES = {
+    'product_name_trgm': 'name',
+    'product_description_trgm': 'description',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" '
+            f'ON "core_product" USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_image_upload_job'),
+    ]
+
+    operations = [
+        # Both are no-ops outside PostgreSQL, like the GIN index in 0002.
+        # CREATE EXTENSION pg_trgm needs the CREATE privilege on the
+        # database (PostgreSQL 13+, where pg_trgm is trusted; a superuser
+        # before that). It is skipped when the extension already exists, so
+        # deploys whose role lacks it can have a DBA run
+        # `CREATE EXTENSION pg_trgm;` first.
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(django.db.models.functions.text.Upper('slug'), name='category_slug_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['product', 'id'], name='productimage_product_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subcategory',
+            index=models.Index(django.db.models.functions.text.Upper('slug'), name='subcategory_slug_upper_idx'),
+        ),
+    ]
@@ -1,6 +1,13 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.utils.text import slugify
 
+from .features import has_feature_values
+from .search import refresh_search_vectors
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)
@@ -21,6 +28,11 @@ class Category(models.Model):
 
     class Meta:
         verbose_name_plural = "Categories"
+        # Catalog filters match slugs case-insensitively (slug__iexact),
+        # which PostgreSQL compiles to UPPER(slug::text).
+        indexes = [
+            models.Index(Upper('slug'), name='category_slug_upper_idx'),
+        ]
 
 class SubCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -43,12 +55,16 @@ class SubCategory(models.Model):
 
     class Meta:
         verbose_name_plural = "Sub Categories"
+        indexes = [
+            models.Index(Upper('slug'), name='subcategory_slug_upper_idx'),
+        ]
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True, blank=True)
     description = models.TextField()
-    features = models.TextField(null=True, blank=True)
+    # [{'k': key, 'v': value}, ...], see core.features
+    features = models.JSONField(default=list, blank=True)
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     subcategory = models.ForeignKey(SubCategory, related_name='products', on_delete=models.CASCADE, null=True, blank=True)
     # main_image = models.ImageField(upload_to='products/main/', null=True, blank=True)
@@ -61,27 +77,153 @@ class Product(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by core.search; only populated on PostgreSQL, where it is
+    # GIN-indexed by migration 0002 (the index is kept out of Meta so other
+    # backends never see it).
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Hash of the scraped source content (media/scraping.py); an unchanged
+    # hash means the product is skipped on re-import.
+    source_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        refresh_search_vectors(Product.objects.using(self._state.db).filter(pk=self.pk))
 
     def __str__(self):
         return self.name
 
+    @property
+    def has_feature_values(self):
+        return has_feature_values(self.features)
+
     class Meta:
         verbose_name_plural = "Products"
+        # Keyset pagination walks (created_at, id) newest first, optionally
+        # within a category or subcategory.
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_cat_created_idx'),
+            models.Index(fields=['subcategory', '-created_at', '-id'], name='product_subcat_created_idx'),
+        ]
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/extra')
+    # Responsive derivatives built by core.images:
+    # {'source': image name, 'files': [{'format', 'width', 'height', 'name'}, ...]}
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    # URL the scraper downloaded the image from; blank for uploads.
+    source_url = models.URLField(max_length=500, blank=True, editable=False)
+    # Fingerprints from core.image_hashes. A product never gets two images
+    # with the same content_hash; one that looks like an earlier image of
+    # the same product is flagged with near_duplicate_of for review.
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    perceptual_hash = models.CharField(max_length=16, blank=True, db_index=True, editable=False)
+    near_duplicate_of = models.ForeignKey(
+        'self',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='near_duplicates',
+        editable=False
+    )
 
     def __str__(self):
         return f"Image for {self.product.name}"
 
     class Meta:
         verbose_name_plural = "Product Images"
+        # A product's gallery is read in upload order (product, pk).
+        indexes = [
+            models.Index(fields=['product', 'id'], name='productimage_product_idx'),
+        ]
+
+class ProductAttribute(models.Model):
+    """
+    Inverted index over Product.features: one row per (product, key, value),
+    kept in sync by core.facets on every product save.
+    """
+    product = models.ForeignKey(Product, related_name='attributes', on_delete=models.CASCADE)
+    key = models.SlugField(max_length=100)
+    label = models.CharField(max_length=200)
+    value = models.CharField(max_length=200)
+
+    def __str__(self):
+        return f"{self.label}: {self.value}"
+
+    class Meta:
+        verbose_name_plural = "Product Attributes"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'key', 'value'], name='product_attribute_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['key', 'value', 'product'], name='product_attribute_lookup_idx'),
+        ]
+
+class ImageUploadJob(models.Model):
+    """
+    An image uploaded in the product admin, staged on disk and waiting for
+    the process_image_uploads worker (see core.upload_jobs).
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    product = models.ForeignKey(Product, related_name='upload_jobs', on_delete=models.CASCADE)
+    # Storage name of the staged upload; removed once the job has run.
+    staged_file = models.CharField(max_length=255)
+    original_name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    image = models.ForeignKey(ProductImage, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.original_name} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='upload_job_queue_idx'),
+        ]
+
+class CatalogVersion(models.Model):
+    """
+    Single-row counter bumped on every catalog change. Listing pages use it
+    as their ETag/Last-Modified validator (one primary-key lookup).
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    SINGLETON_ID = 1
+
+    @classmethod
+    def current(cls):
+        obj, _ = cls.objects.get_or_create(pk=cls.SINGLETON_ID)
+        return obj
+
+    @classmethod
+    def bump(cls):
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            version=F('version') + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID, defaults={'version': 1})
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
 
 class ContactSubmission(models.Model):
     fullname = models.CharField(max_length=200)
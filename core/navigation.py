@@ -0,0 +1,109 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Category, SubCategory
+
+NAV_VERSION_KEY = 'core:navigation:version'
+NAV_TREE_KEY = 'core:navigation:tree'
+
+# Process-local copy of the tree, tagged with the version it was built for.
+# Every lookup compares that tag with the shared version in Django's cache,
+# so a save in one worker invalidates the copies held by all the others.
+_local = {'version': None, 'tree': None}
+
+
+def _image_url(image):
+    if image is None or not image.image:
+        return ''
+    return image.image.url
+
+
+def _image_variants(image):
+    if image is None or not image.image:
+        return {}
+    return image.variants
+
+
+def build_navigation_tree():
+    """
+    Categories with their subcategories and resolved main image URLs, as
+    plain dicts so the tree can be pickled into any cache backend.
+    """
+    categories = Category.objects.select_related('main_image').order_by('pk')
+    subcategories = SubCategory.objects.select_related('main_image').order_by('pk')
+
+    tree = []
+    by_id = {}
+    for category in categories:
+        node = {
+            'id': category.pk,
+            'name': category.name,
+            'slug': category.slug,
+            'main_image_url': _image_url(category.main_image),
+            'main_image_variants': _image_variants(category.main_image),
+            'subcategories': [],
+        }
+        by_id[category.pk] = node
+        tree.append(node)
+    for sub in subcategories:
+        parent = by_id.get(sub.category_id)
+        if parent is not None:
+            parent['subcategories'].append({
+                'id': sub.pk,
+                'name': sub.name,
+                'slug': sub.slug,
+                'main_image_url': _image_url(sub.main_image),
+                'main_image_variants': _image_variants(sub.main_image),
+            })
+    return tree
+
+
+def navigation_version():
+    """
+    Opaque token that changes whenever the navigation tree does. Random, so
+    a flushed cache can never bring back an old value.
+    """
+    version = cache.get(NAV_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(NAV_VERSION_KEY, version, timeout=None):
+            version = cache.get(NAV_VERSION_KEY, version)
+    return version
+
+
+def get_navigation_tree():
+    """
+    Return the cached navigation tree. Costs no database queries unless the
+    catalog structure changed since the tree was last built.
+    """
+    version = navigation_version()
+    if _local['version'] == version:
+        return _local['tree']
+
+    cached = cache.get(NAV_TREE_KEY)
+    if cached is not None and cached['version'] == version:
+        tree = cached['tree']
+    else:
+        tree = build_navigation_tree()
+        cache.set(NAV_TREE_KEY, {'version': version, 'tree': tree}, timeout=None)
+
+    _local['version'] = version
+    _local['tree'] = tree
+    return tree
+
+
+def invalidate_navigation_tree():
+    _drop_tree()
+    # A tree rebuilt before the commit was read from the old rows and would
+    # be cached without a timeout under the new version; drop it again.
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(_drop_tree)
+
+
+def _drop_tree():
+    cache.set(NAV_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    cache.delete(NAV_TREE_KEY)
+    _local['version'] = None
+    _local['tree'] = None
@@ -0,0 +1,190 @@
+"""
+Full-page cache for anonymous GETs to the catalog and product pages.
+
+Entries are keyed on the path plus the normalized listing parameters and
+carry the dependency tags they were rendered from (``product:<id>``,
+``category:<id>``, ...). Every invalidation draws a new number from a
+shared sequence and stamps it on the affected tags; an entry is only
+served while all its tags still carry the numbers it was stored with.
+A page whose tags were bumped while it was being rendered is not stored,
+so concurrent edits can never leave a stale page behind. Invalidations
+made inside a transaction are stamped again when it commits: until then
+other requests still read the old rows, and a page they render after the
+first stamp would otherwise be stored as current.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+KEY_PREFIX = 'core:page'
+SEQUENCE_KEY = f'{KEY_PREFIX}:seq'
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+INVALIDATED_AT_KEY = f'{KEY_PREFIX}:invalidated-at'
+
+# Query parameters that change what the listing views render.
+KEY_PARAMS = ('q', 'category', 'subcategory', 'cursor', 'f')
+# Matched exactly by the views (cursors are opaque tokens, facet values
+# are compared case-sensitively), so they key the cache verbatim.
+EXACT_PARAMS = ('cursor', 'f')
+
+# Tag carried by every entry; bumping it empties the whole cache (used when
+# categories change, since the navbar is on every page).
+ALL = 'all'
+HOME = 'home'
+CATALOG = 'catalog'
+
+
+def product_tag(pk):
+    return f'product:{pk}'
+
+
+def category_tag(pk):
+    return f'category:{pk}'
+
+
+def subcategory_tag(pk):
+    return f'subcategory:{pk}'
+
+
+def _timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+def _normalize(param, value):
+    if param in EXACT_PARAMS:
+        return value
+    return ' '.join(value.split()).lower()
+
+
+def cache_key(request):
+    parts = [request.path]
+    for param in KEY_PARAMS:
+        values = sorted({_normalize(param, v) for v in request.GET.getlist(param) if v})
+        parts.extend(f'{param}={value}' for value in values)
+    digest = hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+    return f'{KEY_PREFIX}:entry:{digest}'
+
+
+def is_cacheable(request):
+    return request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # First use, or the counter was evicted.
+        cache.add(key, 0, timeout=None)
+        return cache.incr(key)
+
+
+def _next_sequence():
+    return _incr(SEQUENCE_KEY)
+
+
+def current_sequence():
+    return cache.get(SEQUENCE_KEY, 0)
+
+
+def get(request):
+    """Return a cached response for `request`, or None."""
+    entry = cache.get(cache_key(request))
+    if entry is not None:
+        versions = entry['tags']
+        current = cache.get_many([_tag_key(t) for t in versions])
+        if all(current.get(_tag_key(t), 0) == v for t, v in versions.items()):
+            _incr(HITS_KEY)
+            response = HttpResponse(entry['content'], content_type=entry['content_type'],
+                                    status=entry['status'])
+            for header, value in entry['headers'].items():
+                response[header] = value
+            return response
+    _incr(MISSES_KEY)
+    return None
+
+
+def store(request, response, tags, started_at):
+    """
+    Store a rendered `response` under `tags`. `started_at` is the sequence
+    number read before rendering began; if any tag was invalidated since,
+    the page may already be stale and is not stored.
+    """
+    if response.status_code != 200 or response.has_header('Set-Cookie'):
+        return False
+    tags = set(tags) | {ALL}
+    stored = cache.get_many([_tag_key(t) for t in tags])
+    versions = {t: stored.get(_tag_key(t), 0) for t in tags}
+    if any(v > started_at for v in versions.values()):
+        return False
+    cache.set(cache_key(request), {
+        'content': response.content,
+        'content_type': response['Content-Type'],
+        'status': response.status_code,
+        'headers': {h: response[h] for h in ('ETag', 'Last-Modified') if response.has_header(h)},
+        'tags': versions,
+    }, timeout=_timeout())
+    return True
+
+
+def invalidate(*tags):
+    """Mark every cached page depending on any of `tags` as stale."""
+    if not tags:
+        return
+    _stamp(tags)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _stamp(tags))
+
+
+def _stamp(tags):
+    seq = _next_sequence()
+    versions = {_tag_key(t): seq for t in tags}
+    cache.set_many({**versions, INVALIDATED_AT_KEY: time.time()}, timeout=None)
+
+
+def changed_within(seconds):
+    """Whether any page was invalidated in the last `seconds` seconds."""
+    return time.time() - cache.get(INVALIDATED_AT_KEY, 0) < seconds
+
+
+def invalidate_all():
+    invalidate(ALL)
+
+
+def invalidate_product(product_id, placements):
+    """
+    Purge the pages that show a product: its detail page, the listings of
+    every (category_id, subcategory_id) in `placements` (current and
+    previous, for moved products), the all-products listing and the home
+    page.
+    """
+    tags = {HOME, CATALOG, product_tag(product_id)}
+    for category_id, subcategory_id in placements:
+        if category_id:
+            tags.add(category_tag(category_id))
+        if subcategory_id:
+            tags.add(subcategory_tag(subcategory_id))
+    invalidate(*tags)
+
+
+def stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,138 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over the queryset's own ordering, e.g.
+    ('-created_at', '-id'). The last ordering field must be unique so every
+    row has a distinct position.
+
+    Each page is a single `WHERE (key) < (cursor) ORDER BY key LIMIT n+1`
+    query, so deep pages cost the same as the first one (no OFFSET scan).
+    Cursors are opaque url-safe strings holding the boundary row's key and
+    the direction to move in.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [str(o) for o in queryset.query.order_by]
+        if not self.ordering or self.ordering[-1].lstrip('-') not in ('id', 'pk'):
+            raise ValueError("Keyset pagination needs an ordering ending in 'id'.")
+
+    def page(self, cursor=None):
+        if cursor:
+            values, backwards = self.decode_cursor(cursor)
+        else:
+            values, backwards = None, False
+
+        ordering = [self._flip(o) for o in self.ordering] if backwards else self.ordering
+        qs = self.queryset.order_by(*ordering)
+        if values is not None:
+            qs = qs.filter(self._after(ordering, values))
+        rows = list(qs[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows)
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else values is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], backwards=False) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], backwards=True) if has_previous else None,
+        )
+
+    def encode_cursor(self, obj, backwards=False):
+        values = [self._dump(getattr(obj, o.lstrip('-'))) for o in self.ordering]
+        payload = json.dumps({'k': values, 'b': int(backwards)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            raw = payload['k']
+            if not isinstance(raw, list) or len(raw) != len(self.ordering):
+                raise ValueError("cursor does not match ordering")
+            values = [self._load(o.lstrip('-'), v) for o, v in zip(self.ordering, raw)]
+            return values, bool(payload.get('b'))
+        except (ValueError, TypeError, KeyError, ValidationError) as e:
+            raise InvalidCursor(str(e)) from e
+
+    def _after(self, ordering, values):
+        """
+        Rows strictly after `values` in `ordering`:
+        (a > x) OR (a = x AND b > y) OR ..., with a leading range on the
+        first key so the planner can use the composite index.
+        """
+        names = [o.lstrip('-') for o in ordering]
+        ops = ['lt' if o.startswith('-') else 'gt' for o in ordering]
+        condition = Q()
+        for i in range(len(ordering)):
+            term = Q(**{f'{names[i]}__{ops[i]}': values[i]})
+            for j in range(i):
+                term &= Q(**{names[j]: values[j]})
+            condition |= term
+        return Q(**{f'{names[0]}__{ops[0]}e': values[0]}) & condition
+
+    @staticmethod
+    def _flip(order):
+        return order[1:] if order.startswith('-') else '-' + order
+
+    @staticmethod
+    def _dump(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def _load(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations such as the search rank are stored as-is; the
+            # only ones ordered on are numbers.
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"bad cursor value for {name}")
+            return value
+        value = field.to_python(value)
+        if value is None:
+            raise ValueError(f"bad cursor value for {name}")
+        return value
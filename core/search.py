@@ -0,0 +1,98 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import F, Func, Q, TextField
+from django.db.models.expressions import RawSQL
+
+# Text search configuration used both for the stored vector and for queries.
+# 'simple' does no stemming, so product codes and Romanian words are matched
+# as typed (after diacritics are folded below).
+SEARCH_CONFIG = 'simple'
+
+# Romanian diacritics, including the legacy cedilla forms (ş/ţ) that still
+# show up in scraped text, folded to plain ASCII. The same mapping is applied
+# in Python for queries and in SQL for the stored vector.
+DIACRITICS = 'ăâîșşțţĂÂÎȘŞȚŢ'
+ASCII_FOLD = 'aaissttAAISSTT'
+_FOLD_TABLE = str.maketrans(DIACRITICS, ASCII_FOLD)
+
+_TERM_RE = re.compile(r'\w+')
+
+
+def normalize_search_text(text):
+    """Lowercase `text` and strip Romanian diacritics."""
+    return (text or '').translate(_FOLD_TABLE).lower()
+
+
+class Fold(Func):
+    """SQL counterpart of normalize_search_text()."""
+    template = "lower(translate(%(expressions)s, '" + DIACRITICS + "', '" + ASCII_FOLD + "'))"
+    output_field = TextField()
+
+
+# Keys and values of the JSON feature list as plain text.
+FEATURES_TEXT_SQL = (
+    "(SELECT string_agg(concat_ws(' ', e->>'k', e->>'v'), ' ') "
+    "FROM jsonb_array_elements(CASE WHEN jsonb_typeof(\"core_product\".\"features\") = 'array' "
+    "THEN \"core_product\".\"features\" ELSE '[]'::jsonb END) AS e)"
+)
+
+
+def product_search_vector():
+    """
+    Weighted search vector for Product: name (A) > features (B) > description (C).
+    """
+    return (
+        SearchVector(Fold(F('name')), config=SEARCH_CONFIG, weight='A')
+        + SearchVector(Fold(RawSQL(FEATURES_TEXT_SQL, (), output_field=TextField())),
+                       config=SEARCH_CONFIG, weight='B')
+        + SearchVector(Fold(F('description')), config=SEARCH_CONFIG, weight='C')
+    )
+
+
+def uses_full_text_search(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def refresh_search_vectors(queryset):
+    """
+    Recompute `search_vector` for every product in `queryset` with a single
+    UPDATE. Does nothing on databases without full-text search.
+    """
+    if not uses_full_text_search(queryset.db):
+        return 0
+    return queryset.update(search_vector=product_search_vector())
+
+
+def build_tsquery(query):
+    """
+    Turn free user input into a raw tsquery where every term is a prefix
+    match, e.g. "Masă inox" -> "masa:* & inox:*". Returns '' if no terms.
+    """
+    terms = _TERM_RE.findall(normalize_search_text(query))
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def search_products(queryset, query):
+    """
+    Filter `queryset` to products matching `query`.
+
+    On PostgreSQL this uses the GIN-indexed `search_vector` and orders by
+    rank; on other databases it falls back to case-insensitive substring
+    matching on name, description and features.
+    """
+    if not uses_full_text_search(queryset.db):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query) | Q(features__icontains=query)
+        )
+
+    tsquery = build_tsquery(query)
+    if not tsquery:
+        return queryset.none()
+    search_query = SearchQuery(tsquery, search_type='raw', config=SEARCH_CONFIG)
+    return (
+        queryset.filter(search_vector=search_query)
+        .annotate(search_rank=SearchRank(F('search_vector'), search_query))
+        .order_by('-search_rank', '-created_at', '-id')
+    )
@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import page_cache
+from .facets import sync_product_attributes
+from .images import (
+    fingerprint_image, generate_derivatives, release_image_file, release_variants, variants_are_current,
+)
+from .models import CatalogVersion, Category, Product, ProductImage, SubCategory
+from .navigation import invalidate_navigation_tree
+
+
+# Connected first so the fingerprints and variants are stored before the
+# caches below are invalidated.
+@receiver(post_save, sender=ProductImage)
+def fingerprint_product_image(sender, instance, raw=False, **kwargs):
+    # Stale variants mean the file changed since they were built.
+    if not raw and instance.image and not (instance.content_hash and variants_are_current(instance)):
+        fingerprint_image(instance)
+
+
+@receiver(post_save, sender=ProductImage)
+def build_image_derivatives(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image and not variants_are_current(instance):
+        generate_derivatives(instance)
+
+
+@receiver(post_delete, sender=ProductImage)
+def remove_image_derivatives(sender, instance, **kwargs):
+    release_variants(instance)
+    if settings.DELETE_PRODUCT_IMAGE_FILES:
+        release_image_file(instance)
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=ProductImage)
+def catalog_structure_changed(sender, **kwargs):
+    invalidate_navigation_tree()
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+def category_changed(sender, **kwargs):
+    # Category names are in the navbar on every page.
+    page_cache.invalidate_all()
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_placement(sender, instance, raw=False, **kwargs):
+    instance._previous_placement = ()
+    if instance.pk and not raw:
+        instance._previous_placement = tuple(
+            Product.objects.filter(pk=instance.pk).values_list('category_id', 'subcategory_id')
+        )
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    placements = [(instance.category_id, instance.subcategory_id)]
+    placements += getattr(instance, '_previous_placement', ())
+    page_cache.invalidate_product(instance.pk, placements)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def product_image_changed(sender, instance, **kwargs):
+    placements = Product.objects.filter(pk=instance.product_id).values_list('category_id', 'subcategory_id')
+    page_cache.invalidate_product(instance.product_id, list(placements))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=SubCategory)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductImage)
+def bump_catalog_version(sender, **kwargs):
+    CatalogVersion.bump()
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_product(sender, instance, **kwargs):
+    # Images are part of the product page, so they count as a product change
+    # for its Last-Modified validator.
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def index_product_attributes(sender, instance, raw=False, **kwargs):
+    if not raw:
+        sync_product_attributes([instance])
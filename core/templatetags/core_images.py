@@ -0,0 +1,32 @@
+from django import template
+
+from core.images import picture_sources
+
+register = template.Library()
+
+# Product cards are a third of the content width on desktop and full width
+# on phones.
+DEFAULT_SIZES = '(max-width: 480px) 100vw, (max-width: 1024px) 50vw, 33vw'
+
+
+@register.inclusion_tag('partials/picture.html')
+def picture(url, variants=None, alt='', sizes=DEFAULT_SIZES, css_class='', onclick=''):
+    """
+    Render a <picture> with AVIF/WebP sources from ProductImage.variants,
+    falling back to the original `url`. Usage:
+
+        {% load core_images %}
+        {% picture prod.main_image.image.url prod.main_image.variants alt=prod.name %}
+    """
+    files = (variants or {}).get('files') or ()
+    largest = max(files, key=lambda f: f['width'], default=None)
+    return {
+        'url': url,
+        'sources': picture_sources(variants),
+        'alt': alt,
+        'sizes': sizes,
+        'css_class': css_class,
+        'onclick': onclick,
+        'width': largest['width'] if largest else None,
+        'height': largest['height'] if largest else None,
+    }
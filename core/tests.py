@@ -1,3 +1,1896 @@
-from django.test import TestCase
+import contextlib
+import base64
+import importlib
+import csv
+import email.utils
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import timedelta
 
-# Create your tests here.
+import requests
+
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection, connections, router, transaction
+from django.db.models import FloatField, Value
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import db_router, page_cache, thumbnails
+from .admin import ProductImageInline
+from . import urls as core_urls
+from .catalog_import import CatalogWriter
+from .facets import facet_counts, filter_by_facets, parse_facet_params
+from .features import features_to_text, parse_features
+from .forms import FeaturesField
+from .image_hashes import fingerprint, hamming
+from .image_pipeline import CANVAS_SIZE, TransformPool, transform_image
+from .images import DERIVATIVE_FORMATS, target_widths
+from .ingest import content_name, ingest_image
+from .models import (
+    Category, ContactSubmission, ImageUploadJob, SubCategory, Product, ProductAttribute, ProductImage,
+)
+from .navigation import NAV_VERSION_KEY, get_navigation_tree, invalidate_navigation_tree, navigation_version
+from .pagination import InvalidCursor, KeysetPaginator
+from . import upload_jobs
+from .search import build_tsquery, normalize_search_text, refresh_search_vectors, search_products
+from .views import ProductPageView, attach_subcategory_previews
+
+# seed_catalog() images have no files behind them.
+logging.getLogger('core.images').setLevel(logging.ERROR)
+
+
+def seed_catalog(categories=3, subcategories=3, products=5):
+    """
+    Build a small catalog where every category, subcategory and product has
+    a main image, so templates follow every relation they can.
+    """
+    for c in range(categories):
+        category = Category.objects.create(name=f"Categorie {c}")
+        subs = [
+            SubCategory.objects.create(name=f"Subcategorie {c}-{s}", category=category)
+            for s in range(subcategories)
+        ]
+        for p in range(products):
+            sub = subs[p % len(subs)] if subs else None
+            product = Product.objects.create(
+                name=f"Produs {c}-{p}",
+                description="Masa din inox",
+                features=[{'k': 'Lungime', 'v': '1200 mm'}, {'k': 'Latime', 'v': '600 mm'}],
+                category=category,
+                subcategory=sub,
+            )
+            for i in range(2):
+                ProductImage.objects.create(product=product, image=f"products/extra/{product.pk}-{i}.png")
+            product.main_image = product.images.first()
+            product.save()
+        category.main_image = ProductImage.objects.filter(product__category=category).first()
+        category.save()
+        for sub in subs:
+            sub.main_image = ProductImage.objects.filter(product__subcategory=sub).first()
+            sub.save()
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every URL in core/urls.py has a maximum number of queries. The budgets
+    are independent of catalog size, so an N+1 shows up as a failure here.
+    They are measured in the steady state, with the navigation tree cached
+    but the page cache empty, and include the ETag/Last-Modified lookup.
+    """
+
+    QUERY_BUDGETS = {
+        'index': 1,
+        'catalog_all': 3,
+        'catalog': 6,
+        'product_detail': 5,
+        'contact': 1,
+        'success': 0,
+        'policy': 0,
+        'thumbnail': 1,  # see ThumbnailTests
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(categories=3, subcategories=3, products=8)
+        Category.objects.create(name="Fara Subcategorii")
+        cls.category = Category.objects.get(name="Categorie 0")
+        cls.subcategory = cls.category.subcategories.first()
+        cls.flat_category = Category.objects.get(name="Fara Subcategorii")
+        cls.product = Product.objects.filter(category=cls.category).first()
+
+    def setUp(self):
+        invalidate_navigation_tree()
+        get_navigation_tree()
+        page_cache.invalidate_all()
+
+    def assertQueryBudget(self, name, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        budget = self.QUERY_BUDGETS[name]
+        self.assertLessEqual(
+            len(ctx.captured_queries), budget,
+            "%s ran %d queries (budget %d):\n%s" % (
+                url, len(ctx.captured_queries), budget,
+                "\n".join(q['sql'] for q in ctx.captured_queries),
+            ),
+        )
+        return response
+
+    def test_every_url_has_a_budget(self):
+        names = {p.name for p in core_urls.urlpatterns}
+        self.assertEqual(names - set(self.QUERY_BUDGETS), set())
+
+    def test_index(self):
+        self.assertQueryBudget('index', reverse('core:index'))
+
+    def test_catalog_all(self):
+        self.assertQueryBudget('catalog_all', reverse('core:catalog_all'))
+        self.assertQueryBudget('catalog_all', reverse('core:catalog_all') + '?q=Produs&category=categorie-1')
+
+    def test_catalog_category_with_subcategories(self):
+        response = self.assertQueryBudget('catalog', reverse('core:catalog', args=[self.category.slug]))
+        self.assertIsNone(response.context['products'])
+        self.assertEqual(len(response.context['subcategories']), 3)
+
+    def test_catalog_category_without_subcategories(self):
+        self.assertQueryBudget('catalog', reverse('core:catalog', args=[self.flat_category.slug]))
+
+    def test_catalog_subcategory(self):
+        url = reverse('core:catalog', args=[self.category.slug, self.subcategory.slug])
+        response = self.assertQueryBudget('catalog', url)
+        self.assertTrue(response.context['products'])
+
+    def test_product_detail(self):
+        url = reverse('core:product_detail', args=[self.product.slug])
+        self.assertQueryBudget('product_detail', url)
+        self.assertQueryBudget('product_detail', url + '?category=categorie-1')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+    def test_contact(self):
+        self.assertQueryBudget('contact', reverse('core:contact'))
+
+    def test_static_pages(self):
+        self.assertQueryBudget('success', reverse('core:success'))
+        self.assertQueryBudget('policy', reverse('core:policy'))
+
+
+def seed_large_catalog(categories=40, subcategories=4, products=50):
+    """
+    Bulk-insert a catalog big enough that the planner prefers an index
+    wherever one applies: `products` per subcategory, one image and two
+    attributes per product, plus one category without subcategories.
+    """
+    cats = Category.objects.bulk_create(
+        [Category(name=f"Categorie {c}", slug=f"categorie-{c}") for c in range(categories + 1)]
+    )
+    subs = SubCategory.objects.bulk_create([
+        SubCategory(name=f"Subcategorie {c}-{s}", slug=f"subcategorie-{c}-{s}", category=category)
+        for c, category in enumerate(cats[:-1]) for s in range(subcategories)
+    ])
+    placements = [(sub.category, sub) for sub in subs for _ in range(products)]
+    placements += [(cats[-1], None)] * products
+    items = Product.objects.bulk_create([
+        Product(
+            name=f"Produs {i}", slug=f"produs-{i}", description=f"Masa din inox {i}",
+            features=[{'k': 'Lungime', 'v': f'{i % 7} m'}, {'k': 'Latime', 'v': f'{i % 3} m'}],
+            category=category, subcategory=sub,
+        )
+        for i, (category, sub) in enumerate(placements)
+    ], batch_size=1000)
+    images = ProductImage.objects.bulk_create(
+        [ProductImage(product=p, image=f"products/extra/{p.pk}.png") for p in items], batch_size=1000
+    )
+    for product, image in zip(items, images):
+        product.main_image = image
+    Product.objects.bulk_update(items, ['main_image'], batch_size=1000)
+    ProductAttribute.objects.bulk_create([
+        ProductAttribute(product=p, key=f['k'].lower(), label=f['k'], value=f['v'])
+        for p in items for f in p.features
+    ], batch_size=1000)
+    refresh_search_vectors(Product.objects.all())
+
+
+def seq_scans(plan):
+    """Relations read by a sequential scan anywhere in an EXPLAIN plan."""
+    if plan['Node Type'] == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from seq_scans(child)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'query plans are only checked on PostgreSQL')
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query the catalog views run against a seeded catalog and
+    fail when one reads a table with more than SEQ_SCAN_ROW_LIMIT rows
+    sequentially, i.e. when an access path lost its index.
+
+    Needs PostgreSQL (DB_ENGINE=django.db.backends.postgresql): the plans
+    are PostgreSQL's, and on any other database these tests are skipped.
+    """
+
+    SEQ_SCAN_ROW_LIMIT = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_large_catalog()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.category = Category.objects.get(slug='categorie-3')
+        cls.subcategory = cls.category.subcategories.order_by('pk').first()
+        cls.flat_category = Category.objects.order_by('pk').last()
+        cls.product = Product.objects.filter(subcategory=cls.subcategory).first()
+
+    def setUp(self):
+        invalidate_navigation_tree()
+        page_cache.invalidate_all()
+
+    def table_sizes(self, tables):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s)', [list(tables)])
+            return dict(cursor.fetchall())
+
+    def assertIndexedPlans(self, url, unbounded=None):
+        """
+        `unbounded` is a piece of SQL identifying the one query the view is
+        expected to run over the whole catalog, e.g. the facet aggregate of
+        the unfiltered listing; only that query may scan, and it must be
+        there.
+        """
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects)
+        if unbounded is not None:
+            self.assertEqual(len([sql for sql in selects if unbounded in sql]), 1, unbounded)
+        with connection.cursor() as cursor:
+            for sql in selects:
+                if unbounded is not None and unbounded in sql:
+                    continue
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scanned = set(seq_scans(plan[0]['Plan']))
+                large = {t: n for t, n in self.table_sizes(scanned).items() if n > self.SEQ_SCAN_ROW_LIMIT}
+                if large:
+                    cursor.execute('EXPLAIN ' + sql)
+                    self.fail("%s scans %s sequentially:\n%s\n%s" % (
+                        url, large, sql, "\n".join(row[0] for row in cursor.fetchall())))
+
+    def test_catalog_all(self):
+        url = reverse('core:catalog_all')
+        # Facet counts over every product.
+        self.assertIndexedPlans(url, unbounded='FROM "core_productattribute"')
+        self.assertIndexedPlans(url + '?q=4711')
+        self.assertIndexedPlans(url + f'?category={self.category.slug.upper()}')
+
+    def test_catalog_category(self):
+        self.assertIndexedPlans(reverse('core:catalog', args=[self.category.slug]))
+        self.assertIndexedPlans(reverse('core:catalog', args=[self.flat_category.slug]))
+        self.assertIndexedPlans(
+            reverse('core:catalog', args=[self.category.slug, self.subcategory.slug])
+            + f'?subcategory={self.subcategory.slug}'
+        )
+
+    def test_product_detail(self):
+        url = reverse('core:product_detail', args=[self.product.slug])
+        self.assertIndexedPlans(url)
+        self.assertIndexedPlans(url + f'?category={self.flat_category.slug}')
+
+
+class SubcategoryPreviewTests(TestCase):
+
+    def test_previews_are_newest_products_per_subcategory(self):
+        seed_catalog(categories=1, subcategories=2, products=12)
+        subs = list(SubCategory.objects.order_by('pk'))
+        with self.assertNumQueries(1):
+            attach_subcategory_previews(subs)
+        for sub in subs:
+            expected = list(
+                Product.objects.filter(subcategory=sub).order_by('-created_at', '-id')[:4]
+            )
+            self.assertEqual(sub.products_preview, expected)
+
+
+class SearchTests(TestCase):
+
+    def test_normalize_folds_romanian_diacritics(self):
+        self.assertEqual(normalize_search_text('Masă Oțel Oţel ÎNĂLȚIME Şină'), 'masa otel otel inaltime sina')
+
+    def test_build_tsquery_uses_prefix_terms(self):
+        self.assertEqual(build_tsquery('Masă  inox, 304!'), 'masa:* & inox:* & 304:*')
+        self.assertEqual(build_tsquery(' ,. '), '')
+
+    def test_fallback_matches_name_description_and_features(self):
+        category = Category.objects.create(name="Mese")
+        by_name = Product.objects.create(name="Masa inox", description="", category=category)
+        by_desc = Product.objects.create(name="Raft", description="raft din inox", category=category)
+        by_feature = Product.objects.create(
+            name="Dulap", description="", features=[{'k': 'Material', 'v': 'inox'}], category=category)
+        Product.objects.create(name="Scaun", description="lemn", category=category)
+        found = set(search_products(Product.objects.all(), 'inox'))
+        self.assertEqual(found, {by_name, by_desc, by_feature})
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Mese")
+        for i in range(30):
+            Product.objects.create(name=f"Masa {i}", description="inox", category=category)
+        # Ties on created_at must be broken by id.
+        Product.objects.filter(name__in=["Masa 3", "Masa 4", "Masa 5"]).update(
+            created_at=Product.objects.get(name="Masa 3").created_at)
+        cls.category = category
+        cls.expected = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def walk(self, paginator):
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.append([p.pk for p in page])
+            if not page.has_next():
+                return seen, page
+            cursor = page.next_cursor
+
+    def test_forward_and_backward_walk(self):
+        paginator = KeysetPaginator(Product.objects.order_by('-created_at', '-id'), per_page=5)
+        pages, last = self.walk(paginator)
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual([len(p) for p in pages], [5, 5, 5, 5, 5, 5])
+
+        back, page = [], last
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            back.insert(0, [p.pk for p in page])
+        self.assertEqual(back, pages[:-1])
+
+    def test_each_page_is_one_query(self):
+        paginator = KeysetPaginator(Product.objects.order_by('-created_at', '-id'), per_page=5)
+        cursor = paginator.page().next_cursor
+        with self.assertNumQueries(1):
+            paginator.page(cursor)
+
+    def test_requires_unique_trailing_key(self):
+        with self.assertRaises(ValueError):
+            KeysetPaginator(Product.objects.order_by('-created_at'), per_page=5)
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Product.objects.order_by('-created_at', '-id'), per_page=5)
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+        response = self.client.get(reverse('core:catalog_all') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def forge(self, *values):
+        payload = json.dumps({'k': list(values), 'b': 0}).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    def test_forged_cursor_values(self):
+        paginator = KeysetPaginator(Product.objects.order_by('-created_at', '-id'), per_page=5)
+        for cursor in (self.forge('not-a-date', 1), self.forge(None, 1), self.forge('2025-01-01T00:00:00', 'x')):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+        response = self.client.get(reverse('core:catalog_all'), {'cursor': self.forge('not-a-date', 1)})
+        self.assertEqual(response.status_code, 404)
+
+        ranked = Product.objects.annotate(search_rank=Value(0.5, output_field=FloatField()))
+        paginator = KeysetPaginator(ranked.order_by('-search_rank', '-created_at', '-id'), per_page=5)
+        self.assertEqual(len(paginator.page(self.forge(0.6, '2100-01-01T00:00:00+00:00', 1))), 5)
+        for rank in ('0.5', [1], True, None):
+            with self.subTest(rank=rank), self.assertRaises(InvalidCursor):
+                paginator.page(self.forge(rank, '2100-01-01T00:00:00+00:00', 1))
+
+    def test_catalog_links_keep_filters(self):
+        page_cache.invalidate_all()
+        url = reverse('core:catalog', args=[self.category.slug]) + '?q=Masa'
+        response = self.client.get(url)
+        page = response.context['page']
+        self.assertEqual(len(response.context['products']), ProductPageView.paginate_by)
+        self.assertIn('q=Masa', page.next_url)
+        self.assertIn('cursor=', page.next_url)
+        response = self.client.get(reverse('core:catalog', args=[self.category.slug]) + page.next_url)
+        self.assertEqual(
+            [p.pk for p in response.context['products']],
+            self.expected[ProductPageView.paginate_by:],
+        )
+
+
+class NavigationTreeTests(TestCase):
+
+    def setUp(self):
+        invalidate_navigation_tree()
+        page_cache.invalidate_all()
+        seed_catalog(categories=2, subcategories=2, products=2)
+
+    def test_tree_is_built_once(self):
+        with self.assertNumQueries(2):
+            tree = get_navigation_tree()
+        with self.assertNumQueries(0):
+            self.assertIs(get_navigation_tree(), tree)
+        self.assertEqual([c['name'] for c in tree], ["Categorie 0", "Categorie 1"])
+        self.assertEqual(len(tree[0]['subcategories']), 2)
+        self.assertTrue(tree[0]['main_image_url'].startswith('/media/products/extra/'))
+
+    def test_signals_invalidate_tree(self):
+        get_navigation_tree()
+        Category.objects.create(name="Noua")
+        self.assertIn("Noua", [c['name'] for c in get_navigation_tree()])
+
+        image = Category.objects.get(name="Categorie 0").main_image
+        image.delete()
+        self.assertEqual(get_navigation_tree()[0]['main_image_url'], '')
+
+        sub = SubCategory.objects.first()
+        sub.delete()
+        names = [s['name'] for c in get_navigation_tree() for s in c['subcategories']]
+        self.assertNotIn(sub.name, names)
+
+    def test_tree_built_before_commit_is_dropped_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Category.objects.create(name="Noua")
+                get_navigation_tree()
+                version = navigation_version()
+        self.assertNotEqual(navigation_version(), version)
+        with self.assertNumQueries(2):
+            get_navigation_tree()
+
+    def test_navbar_renders_from_cache(self):
+        get_navigation_tree()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('core:index'))
+        self.assertContains(response, "CATEGORIE 0")
+
+
+class PageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(categories=2, subcategories=2, products=4)
+        cls.category = Category.objects.get(name="Categorie 0")
+        cls.other_category = Category.objects.get(name="Categorie 1")
+        cls.product = Product.objects.filter(category=cls.category, subcategory__isnull=False).first()
+        cls.other_product = Product.objects.filter(category=cls.other_category).first()
+
+    def setUp(self):
+        invalidate_navigation_tree()
+        get_navigation_tree()
+        page_cache.invalidate_all()
+        page_cache.reset_stats()
+        self.urls = {
+            'home': reverse('core:index'),
+            'catalog': reverse('core:catalog_all'),
+            'category': reverse('core:catalog', args=[self.category.slug]),
+            'subcategory': reverse('core:catalog', args=[self.category.slug, self.product.subcategory.slug]),
+            'detail': reverse('core:product_detail', args=[self.product.slug]),
+            'other_category': reverse('core:catalog', args=[self.other_category.slug]),
+            'other_detail': reverse('core:product_detail', args=[self.other_product.slug]),
+        }
+        for url in self.urls.values():
+            self.client.get(url)
+
+    def cached(self, name):
+        return self.client.get(self.urls[name])['X-Page-Cache'] == 'HIT'
+
+    def test_hits_and_counters(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.urls['detail'])
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, self.product.name)
+        self.assertEqual(page_cache.stats()['hits'], 1)
+        self.assertEqual(page_cache.stats()['misses'], len(self.urls))
+
+    def test_key_normalizes_listing_params(self):
+        self.client.get(self.urls['catalog'] + '?q=Masa%20%20Inox&utm_source=x')
+        response = self.client.get(self.urls['catalog'] + '?q=masa+inox')
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        response = self.client.get(self.urls['catalog'] + '?q=raft')
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+
+    def test_key_keeps_facet_values_verbatim(self):
+        url = self.urls['catalog']
+        wrong = self.client.get(url, {'f': 'lungime:1200 MM'})
+        self.assertEqual(wrong['X-Page-Cache'], 'MISS')
+        self.assertFalse(wrong.context['products'])
+        response = self.client.get(url, {'f': 'lungime:1200 mm'})
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertTrue(response.context['products'])
+        self.assertEqual(self.client.get(url, {'f': 'lungime:1200 MM'})['X-Page-Cache'], 'HIT')
+
+    def test_product_save_purges_only_dependent_pages(self):
+        self.product.name = "Produs redenumit"
+        self.product.save()
+        for name in ('home', 'catalog', 'category', 'subcategory', 'detail'):
+            self.assertFalse(self.cached(name), name)
+        for name in ('other_category', 'other_detail'):
+            self.assertTrue(self.cached(name), name)
+        self.assertContains(self.client.get(self.urls['detail']), "Produs redenumit")
+
+    def test_sibling_change_purges_detail_page(self):
+        sibling = Product.objects.filter(category=self.category).exclude(pk=self.product.pk).first()
+        sibling.name = "Vecin redenumit"
+        sibling.save()
+        self.assertFalse(self.cached('detail'))
+        self.assertTrue(self.cached('other_detail'))
+
+    def test_moved_product_purges_previous_listing(self):
+        self.other_product.category = self.category
+        self.other_product.subcategory = None
+        self.other_product.save()
+        self.assertFalse(self.cached('other_category'))
+        self.assertFalse(self.cached('category'))
+
+    def test_category_change_purges_everything(self):
+        self.other_category.name = "Alta"
+        self.other_category.save()
+        for name in self.urls:
+            self.assertFalse(self.cached(name), name)
+
+    def test_page_invalidated_while_rendering_is_not_stored(self):
+        started_at = page_cache.current_sequence()
+        page_cache.invalidate(page_cache.product_tag(self.product.pk))
+        request = RequestFactory().get('/stale/')
+        request.user = AnonymousUser()
+        response = HttpResponse("stale")
+        self.assertFalse(page_cache.store(request, response, {page_cache.product_tag(self.product.pk)}, started_at))
+        self.assertTrue(page_cache.store(request, response, {page_cache.product_tag(self.other_product.pk)}, started_at))
+
+    def test_page_rendered_before_commit_is_purged_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.product.name = "Produs redenumit"
+                self.product.save()
+                # Rendered between the save and the commit: another request
+                # would still see the old row here.
+                self.assertFalse(self.cached('detail'))
+                self.assertTrue(self.cached('detail'))
+        self.assertFalse(self.cached('detail'))
+
+    def test_authenticated_users_bypass_cache(self):
+        user = User.objects.create_user('admin', password='x')
+        self.client.force_login(user)
+        response = self.client.get(self.urls['detail'])
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(categories=1, subcategories=1, products=2)
+        cls.product = Product.objects.first()
+        cls.detail_url = reverse('core:product_detail', args=[cls.product.slug])
+
+    def setUp(self):
+        page_cache.invalidate_all()
+
+    def assertNotModified(self, url, queries, **headers):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.content)
+        return response
+
+    def test_detail_revalidates_with_one_query(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        page_cache.invalidate_all()
+        with self.assertTemplateNotUsed('core/product_detail.html'):
+            self.assertNotModified(self.detail_url, 1, if_none_match=etag)
+
+    def test_cached_detail_revalidates_without_queries(self):
+        response = self.client.get(self.detail_url)
+        self.assertNotModified(self.detail_url, 0, if_none_match=response['ETag'])
+        self.assertNotModified(self.detail_url, 0, if_modified_since=response['Last-Modified'])
+
+    def test_detail_etag_changes_with_images(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        ProductImage.objects.create(product=self.product, image='products/extra/new.png')
+        response = self.client.get(self.detail_url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_etag_changes_with_related_products(self):
+        sibling = Product.objects.filter(category=self.product.category).exclude(pk=self.product.pk).first()
+        other = Category.objects.create(name="Alta")
+        stranger = Product.objects.create(name="Raft", description="", category=other)
+        for url in (self.detail_url, self.detail_url + f'?category={other.slug}'):
+            etag = self.client.get(url)['ETag']
+            page_cache.invalidate_all()
+            self.assertNotModified(url, 1, if_none_match=etag)
+        etag = self.client.get(self.detail_url)['ETag']
+        sibling.name = "Vecin redenumit"
+        sibling.save()
+        response = self.client.get(self.detail_url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Vecin redenumit")
+
+        url = self.detail_url + f'?category={other.slug}'
+        etag = self.client.get(url)['ETag']
+        stranger.name = "Raft redenumit"
+        stranger.save()
+        self.assertEqual(self.client.get(url, headers={'if_none_match': etag}).status_code, 200)
+
+    def test_listing_etag_follows_catalog_version(self):
+        url = reverse('core:catalog_all')
+        etag = self.client.get(url)['ETag']
+        page_cache.invalidate_all()
+        self.assertNotModified(url, 1, if_none_match=etag)
+        Product.objects.filter(pk=self.product.pk).first().delete()
+        response = self.client.get(url, headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_unknown_product_is_404(self):
+        response = self.client.get(reverse('core:product_detail', args=['nu-exista']))
+        self.assertEqual(response.status_code, 404)
+
+
+class FeaturesTests(TestCase):
+
+    def test_parses_legacy_scraper_text(self):
+        self.assertEqual(
+            parse_features("['Lungime: 1200 mm', 'Material: AISI 304', 'Roți']"),
+            [{'k': 'Lungime', 'v': '1200 mm'}, {'k': 'Material', 'v': 'AISI 304'}, {'k': 'Roți', 'v': ''}],
+        )
+        self.assertEqual(parse_features("Lungime: 1200\nLatime: 600"),
+                         [{'k': 'Lungime', 'v': '1200'}, {'k': 'Latime', 'v': '600'}])
+        self.assertEqual(parse_features("Lungime: 1200, Latime: 600"),
+                         [{'k': 'Lungime', 'v': '1200'}, {'k': 'Latime', 'v': '600'}])
+        self.assertEqual(parse_features(None), [])
+
+    def test_admin_field_round_trip(self):
+        field = FeaturesField(required=False)
+        features = [{'k': 'Dimensiuni', 'v': '1200, 600 mm'}, {'k': 'Inox', 'v': ''}]
+        text = field.prepare_value(features)
+        self.assertEqual(text, features_to_text(features))
+        self.assertEqual(field.clean(text), features)
+        self.assertEqual(field.clean(''), [])
+
+    def test_detail_renders_stored_features(self):
+        category = Category.objects.create(name="Mese")
+        product = Product.objects.create(
+            name="Masa", description="", category=category,
+            features=[{'k': 'Lungime', 'v': '1200 mm'}, {'k': 'Roți', 'v': ''}],
+        )
+        self.assertTrue(product.has_feature_values)
+        response = self.client.get(reverse('core:product_detail', args=[product.slug]))
+        self.assertContains(response, '<th class="text-left">Lungime</th>', html=False)
+        self.assertContains(response, '<td class="text-center">-</td>', html=False)
+
+
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Mese")
+        specs = [
+            ('Masa 1', '1200 mm', 'AISI 304'),
+            ('Masa 2', '1200 mm', 'AISI 430'),
+            ('Masa 3', '1400 mm', 'AISI 304'),
+            ('Masa 4', '1400 mm', 'AISI 304'),
+        ]
+        for name, length, steel in specs:
+            Product.objects.create(
+                name=name, description="", category=cls.category,
+                features=[{'k': 'Lungime', 'v': length}, {'k': 'Oțel', 'v': steel}, {'k': 'Roți', 'v': ''}],
+            )
+
+    def setUp(self):
+        page_cache.invalidate_all()
+
+    def test_attributes_follow_product_saves(self):
+        product = Product.objects.get(name="Masa 1")
+        self.assertEqual(
+            set(product.attributes.values_list('key', 'value')),
+            {('lungime', '1200 mm'), ('otel', 'AISI 304')},
+        )
+        product.features = [{'k': 'Lungime', 'v': '1600 mm'}]
+        product.save()
+        self.assertEqual(set(product.attributes.values_list('key', 'value')), {('lungime', '1600 mm')})
+        product.delete()
+        self.assertFalse(ProductAttribute.objects.filter(product_id=product.pk).exists())
+
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = facet_counts(Product.objects.all())
+        by_key = {f['key']: {v['value']: v['count'] for v in f['values']} for f in facets}
+        self.assertEqual(by_key, {
+            'lungime': {'1200 mm': 2, '1400 mm': 2},
+            'otel': {'AISI 304': 3, 'AISI 430': 1},
+        })
+
+    def test_selected_key_counts_ignore_its_own_selection(self):
+        selected = {'otel': {'AISI 304'}}
+        with self.assertNumQueries(2):
+            facets = facet_counts(Product.objects.all(), selected)
+        by_key = {f['key']: {v['value']: v['count'] for v in f['values']} for f in facets}
+        self.assertEqual(by_key, {
+            'lungime': {'1200 mm': 1, '1400 mm': 2},
+            'otel': {'AISI 304': 3, 'AISI 430': 1},
+        })
+
+        selected['lungime'] = {'1200 mm'}
+        by_key = {f['key']: {v['value']: v['count'] for v in f['values']}
+                  for f in facet_counts(Product.objects.all(), selected)}
+        self.assertEqual(by_key, {
+            'lungime': {'1200 mm': 1, '1400 mm': 2},
+            'otel': {'AISI 304': 1, 'AISI 430': 1},
+        })
+
+    def test_filtering_combines_keys(self):
+        selected = parse_facet_params(['otel:AISI 304', 'lungime:1200 mm', 'lungime:1400 mm', 'junk'])
+        self.assertEqual(selected, {'otel': {'AISI 304'}, 'lungime': {'1200 mm', '1400 mm'}})
+        names = set(filter_by_facets(Product.objects.all(), selected).values_list('name', flat=True))
+        self.assertEqual(names, {'Masa 1', 'Masa 3', 'Masa 4'})
+
+    def test_catalog_applies_facets_with_search(self):
+        url = reverse('core:catalog', args=[self.category.slug])
+        response = self.client.get(url + '?q=Masa&f=otel:AISI%20304&f=lungime:1400%20mm')
+        self.assertEqual({p.name for p in response.context['products']}, {'Masa 3', 'Masa 4'})
+        lungime = next(f for f in response.context['facets'] if f['key'] == 'lungime')
+        selected = next(v for v in lungime['values'] if v['selected'])
+        self.assertNotIn('1400', selected['url'])
+        self.assertIn('q=Masa', selected['url'])
+
+
+def png_bytes(width=1200, height=800):
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        invalidate_navigation_tree()
+        page_cache.invalidate_all()
+        self.category = Category.objects.create(name="Mese")
+        self.product = Product.objects.create(name="Masa", description="", category=self.category)
+
+    def add_image(self, width=1200, height=800):
+        image = ProductImage(product=self.product)
+        image.image.save('masa.png', ContentFile(png_bytes(width, height)), save=False)
+        image.save()
+        return image
+
+    def test_target_widths(self):
+        self.assertEqual(target_widths(2000), [320, 640, 960])
+        self.assertEqual(target_widths(500), [320, 500])
+        self.assertEqual(target_widths(200), [200])
+
+    def test_derivatives_generated_on_save(self):
+        image = self.add_image()
+        image.refresh_from_db()
+        files = image.variants['files']
+        self.assertEqual(image.variants['source'], image.image.name)
+        self.assertEqual(len(files), 3 * len(DERIVATIVE_FORMATS))
+        for f in files:
+            self.assertEqual(f['height'], round(f['width'] * 2 / 3))
+            with default_storage.open(f['name']) as fp, Image.open(fp) as img:
+                self.assertEqual((img.width, img.height, img.format.lower()), (f['width'], f['height'], f['format']))
+
+        image.delete()
+        self.assertFalse(any(default_storage.exists(f['name']) for f in files))
+
+    def test_small_image_is_not_upscaled(self):
+        image = self.add_image(200, 100)
+        self.assertEqual({f['width'] for f in image.variants['files']}, {200})
+
+    def test_catalog_renders_picture_sources(self):
+        self.product.main_image = self.add_image()
+        self.product.save()
+        response = self.client.get(reverse('core:catalog', args=[self.category.slug]))
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '640w')
+        self.assertContains(response, 'width="960" height="640"')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_backfill_command(self):
+        image = self.add_image()
+        ProductImage.objects.filter(pk=image.pk).update(variants={})
+        out = io.StringIO()
+        call_command('generate_image_derivatives', workers=1, stdout=out)
+        self.assertIn('1 images processed', out.getvalue())
+        image.refresh_from_db()
+        self.assertEqual(len(image.variants['files']), 3 * len(DERIVATIVE_FORMATS))
+
+        out = io.StringIO()
+        call_command('generate_image_derivatives', workers=1, stdout=out)
+        self.assertIn('up to date', out.getvalue())
+
+
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            THUMBNAIL_CACHE_DIR=f'{self.media_root}/thumbs',
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        thumbnails.reset_stats()
+        self.addCleanup(thumbnails.reset_stats)
+        product = Product.objects.create(name="Masa", description="", category=Category.objects.create(name="Mese"))
+        self.image = ProductImage(product=product)
+        self.image.image.save('masa.png', ContentFile(png_bytes(1200, 800)), save=False)
+        self.image.save()
+
+    def test_endpoint_serves_cached_thumbnail(self):
+        url = thumbnails.thumbnail_url(self.image, 'small')
+        with self.assertNumQueries(QueryBudgetTests.QUERY_BUDGETS['thumbnail']):
+            response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        with Image.open(io.BytesIO(b''.join(response.streaming_content))) as img:
+            self.assertEqual(img.size, (100, 67))
+        self.client.get(url)
+        self.assertEqual(thumbnails.stats()['generated'], 1)
+        self.assertEqual(thumbnails.stats()['hits'], 1)
+
+    def test_thumbnail_evicted_before_open(self):
+        get_thumbnail = thumbnails.get_thumbnail
+
+        def evicted(name, preset):
+            path = get_thumbnail(name, preset)
+            os.unlink(path)
+            return path
+
+        url = thumbnails.thumbnail_url(self.image, 'small')
+        calls = iter([evicted, get_thumbnail])
+        with mock.patch.object(thumbnails, 'get_thumbnail', side_effect=lambda *args: next(calls)(*args)) as patched:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(patched.call_count, 2)
+        with mock.patch.object(thumbnails, 'get_thumbnail', side_effect=evicted):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_unknown_preset_or_image(self):
+        self.assertEqual(self.client.get(reverse('core:thumbnail', args=[self.image.pk, 'huge'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('core:thumbnail', args=[0, 'small'])).status_code, 404)
+
+    def test_concurrent_first_requests_render_once(self):
+        barrier = threading.Barrier(8)
+        paths = []
+
+        def fetch():
+            barrier.wait()
+            paths.append(thumbnails.get_thumbnail(self.image.image.name, 'large'))
+
+        workers = [threading.Thread(target=fetch) for _ in range(8)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        self.assertEqual(len(set(paths)), 1)
+        self.assertEqual(thumbnails.stats()['generated'], 1)
+
+    def test_lru_eviction(self):
+        name = self.image.image.name
+        paths = {preset: thumbnails.get_thumbnail(name, preset) for preset in ('small', 'medium', 'large')}
+        os.utime(paths['small'], (1, 1))
+        os.utime(paths['large'], (2, 2))
+        thumbnails.get_thumbnail(name, 'small')  # hit: now the most recent
+        sizes = {preset: os.path.getsize(path) for preset, path in paths.items()}
+        removed = thumbnails.evict(max_bytes=int((sizes['small'] + sizes['medium']) / thumbnails.EVICT_TO) + 1)
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(paths['large']))
+        self.assertTrue(os.path.exists(paths['small']))
+
+    def test_admin_inline_uses_thumbnail(self):
+        html = ProductImageInline(Product, admin.site).thumbnail(self.image)
+        self.assertIn(f'/thumbnail/{self.image.pk}/small/', html)
+        self.assertNotIn(self.image.image.url, html)
+
+
+class ImagePipelineTests(TestCase):
+
+    def test_transform_fits_canvas(self):
+        with Image.open(io.BytesIO(transform_image(png_bytes(1200, 800)))) as img:
+            self.assertEqual((img.size, img.mode, img.format), (CANVAS_SIZE, 'RGBA', 'PNG'))
+            self.assertEqual(img.getpixel((0, 0))[3], 0)
+            self.assertEqual(img.getpixel((290, 380))[3], 255)
+
+    def test_command_isolates_failures(self):
+        source = tempfile.mkdtemp()
+        out = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, out)
+        for i in range(3):
+            with open(f'{source}/{i}.png', 'wb') as fp:
+                fp.write(png_bytes(300, 200))
+        with open(f'{source}/broken.png', 'wb') as fp:
+            fp.write(b'not an image')
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('process_images', source, out=out, workers=1, queue_size=2, stdout=stdout, stderr=stderr)
+        self.assertIn('3 images transformed, 1 failed', stdout.getvalue())
+        self.assertIn('broken.png', stderr.getvalue())
+        self.assertEqual(sorted(os.listdir(out)), ['0.png', '1.png', '2.png'])
+
+    def test_close_while_worker_crashes(self):
+        pool = TransformPool(workers=1, transform=crash_worker)
+        result = pool.submit(b'')
+        closer = threading.Thread(target=pool.close, daemon=True)
+        closer.start()
+        closer.join(30)
+        self.assertFalse(closer.is_alive(), 'close() deadlocked')
+        self.assertIsNotNone(result.exception(30))
+        self.assertIsNone(pool._pool)
+
+
+    def test_submit_after_close_fails_the_future(self):
+        pool = TransformPool(workers=1, max_pending=1)
+        pool.close()
+        for _ in range(2):
+            result = pool.submit(png_bytes(300, 200))
+            with self.assertRaises(RuntimeError):
+                result.result(timeout=30)
+        self.assertTrue(pool._slots.acquire(timeout=5), 'queue slot leaked')
+        pool._slots.release()
+
+
+def crash_worker(data):
+    os._exit(1)
+
+
+class IngestTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.category = Category.objects.create(name="Mese")
+        self.product = Product.objects.create(name="Masa", description="", category=self.category)
+
+    def test_same_bytes_stored_once(self):
+        data = png_bytes(300, 200)
+        first = ingest_image(self.product, data, source_url='https://example.com/a.png')
+        again = ingest_image(self.product, data)
+        other = ingest_image(Product.objects.create(name="Alta", description="", category=self.category), data)
+
+        self.assertEqual(first.pk, again.pk)
+        self.assertNotEqual(first.pk, other.pk)
+        self.assertEqual(first.image.name, other.image.name)
+        self.assertEqual(first.image.name, content_name(data))
+        self.assertEqual(first.source_url, 'https://example.com/a.png')
+        directory = os.path.dirname(default_storage.path(first.image.name))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first.image.name)])
+        with default_storage.open(first.image.name) as fp:
+            self.assertEqual(fp.read(), data)
+
+    def test_shared_file_shares_derivatives(self):
+        data = png_bytes(300, 200)
+        first = ingest_image(self.product, data)
+        other = ingest_image(Product.objects.create(name="Alta", description="", category=self.category), data)
+        self.assertEqual(first.variants, other.variants)
+        files = [f['name'] for f in first.variants['files']]
+        first.delete()
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+        other.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+
+
+
+def pattern_bytes(seed, size=(400, 300), fmt='PNG', **options):
+    img = Image.new('RGB', (400, 300), 'white')
+    draw = ImageDraw.Draw(img)
+    for i in range(6):
+        x, y = (seed * 37 + i * 61) % 300, (seed * 53 + i * 29) % 200
+        draw.rectangle([x, y, x + 90, y + 80], fill=((seed * 40 + i * 50) % 256, i * 40, 255 - i * 40))
+    buf = io.BytesIO()
+    img.resize(size).save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+class ImageDedupeTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.category = Category.objects.create(name="Mese")
+        self.sub = SubCategory.objects.create(name="Mese Inox", category=self.category)
+        self.product = Product.objects.create(name="Masa", description="", category=self.category)
+
+    def test_perceptual_hash(self):
+        _, original = fingerprint(pattern_bytes(1))
+        _, resized = fingerprint(pattern_bytes(1, (200, 150), 'JPEG', quality=60))
+        _, other = fingerprint(pattern_bytes(2))
+        self.assertLessEqual(hamming(original, resized), 6)
+        self.assertGreater(hamming(original, other), 6)
+
+    def test_writer_skips_copies_and_flags_similar(self):
+        writer = CatalogWriter()
+        data = pattern_bytes(1)
+        new = writer.write_images([(self.product, [
+            ('https://example.com/a.png', data),
+            ('https://example.com/a-copy.png', data),
+            ('https://example.com/a-small.png', pattern_bytes(1, (200, 150))),
+            ('https://example.com/b.png', pattern_bytes(2)),
+        ])])
+        self.assertEqual([image.source_url.rsplit('/', 1)[1] for image in new], ['a.png', 'a-small.png', 'b.png'])
+        self.assertEqual(new[0].content_hash, fingerprint(data)[0])
+        self.assertEqual(new[1].near_duplicate_of_id, new[0].pk)
+        self.assertIsNone(new[2].near_duplicate_of_id)
+        self.assertEqual(writer.diff['images_similar'], 1)
+        self.assertEqual(writer.write_images([(self.product, [('https://example.com/again.png', data)])]), [])
+
+    def add_legacy(self, name, data):
+        image = ProductImage.objects.create(product=self.product, image=default_storage.save(name, ContentFile(data)))
+        ProductImage.objects.filter(pk=image.pk).update(content_hash='', perceptual_hash='', near_duplicate_of=None)
+        return image
+
+    def test_dedupe_command(self):
+        data = pattern_bytes(1)
+        first = self.add_legacy('products/extra/1_1.png', data)
+        copy = self.add_legacy('products/extra/1_2.png', data)
+        similar = self.add_legacy('products/extra/1_3.jpg', pattern_bytes(1, (200, 150), 'JPEG', quality=60))
+        Product.objects.filter(pk=self.product.pk).update(main_image=copy)
+        Category.objects.filter(pk=self.category.pk).update(main_image=first)
+        SubCategory.objects.filter(pk=self.sub.pk).update(main_image=first)
+
+        out = io.StringIO()
+        call_command('dedupe_images', workers=1, dry_run=True, stdout=out)
+        self.assertIn('3 images fingerprinted, 1 duplicates would be removed', out.getvalue())
+        self.assertEqual(self.product.images.count(), 3)
+
+        out = io.StringIO()
+        call_command('dedupe_images', workers=1, stdout=out)
+        self.assertIn('0 images fingerprinted, 1 duplicates removed, 1 near-duplicates flagged', out.getvalue())
+        # The product's main image is the copy that is kept.
+        self.assertEqual(list(self.product.images.order_by('pk')), [copy, similar])
+        self.category.refresh_from_db()
+        self.sub.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.category.main_image, self.sub.main_image, self.product.main_image), (copy, copy, copy))
+        similar.refresh_from_db()
+        self.assertEqual(similar.near_duplicate_of, copy)
+
+
+class CatalogWriterTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.writer = CatalogWriter()
+        self.category = self.writer.category("Mese")
+        self.sub = self.writer.subcategory("Mese Inox", self.category)
+
+    def pdata(self, title, length='1200 mm'):
+        return {"title": title, "description": f"Desc {title}", "features": [f"Lungime: {length}"], "images": []}
+
+    def test_page_written_in_constant_queries(self):
+        for size in (5, 20):
+            items = [(self.pdata(f"Masa {size}-{i}"), self.category, self.sub) for i in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                result = self.writer.write_products(items)
+            self.assertTrue(all(changed for _, changed in result))
+            queries = len(ctx.captured_queries)
+        self.assertLessEqual(queries, 12)
+        product = Product.objects.get(name="Masa 20-3")
+        self.assertEqual(product.slug, 'masa-20-3')
+        self.assertEqual(product.subcategory, self.sub)
+        self.assertEqual(list(product.attributes.values_list('value', flat=True)), ['1200 mm'])
+
+    def test_upsert_and_unchanged(self):
+        legacy = Product.objects.create(name="Masa", description="veche", category=self.category)
+        [(product, changed)] = self.writer.write_products([(self.pdata("Masa"), self.category, None)])
+        self.assertEqual(product.pk, legacy.pk)
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.description, "Desc Masa")
+
+        writer = CatalogWriter()
+        with self.assertNumQueries(1):
+            [(_, changed)] = writer.write_products([(self.pdata("Masa"), self.category, None)])
+        self.assertFalse(changed)
+        self.assertEqual(writer.diff["unchanged"], 1)
+
+        [(_, changed)] = writer.write_products([(self.pdata("Masa", '1400 mm'), self.category, None)])
+        self.assertTrue(changed)
+        self.assertEqual(writer.diff["updated"], [("Masa", ["features"])])
+
+    def test_products_matched_on_slug(self):
+        legacy = Product.objects.create(name="Masă inox", description="veche", category=self.category)
+        result = self.writer.write_products([
+            (self.pdata("Masa Inox"), self.category, None),
+            (self.pdata("Masa inox", '1400 mm'), self.category, None),
+            (self.pdata("Masa noua"), self.category, None),
+            (self.pdata("Masa Noua", '1400 mm'), self.category, None),
+        ])
+        self.assertEqual([product.pk for product, _ in result][:2], [legacy.pk, legacy.pk])
+        self.assertEqual(result[2][0].pk, result[3][0].pk)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(self.writer.diff["created"], ["Masa noua"])
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.name, legacy.features), ("Masa inox", parse_features(["Lungime: 1400 mm"])))
+        self.assertEqual(Product.objects.get(slug="masa-noua").name, "Masa Noua")
+
+    def test_missing_derivatives_are_logged(self):
+        [(product, _)] = self.writer.write_products([(self.pdata("Masa"), self.category, None)])
+        with mock.patch('core.catalog_import.build_variants', side_effect=OSError("disc plin")), \
+                self.assertLogs('core.catalog_import', 'WARNING') as logs:
+            [image] = self.writer.write_images([(product, [('https://example.com/a.png', png_bytes(300, 200))])])
+        self.assertEqual(image.variants, {})
+        self.assertIn('disc plin', logs.output[0])
+
+    def test_images_set_main_image(self):
+        [(product, _)] = self.writer.write_products([(self.pdata("Masa"), self.category, None)])
+        data = png_bytes(300, 200)
+        new = self.writer.write_images([(product, [('https://example.com/a.png', data), ('https://example.com/b.png', data)])])
+        self.assertEqual(len(new), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.main_image, new[0])
+        self.assertTrue(new[0].variants['files'])
+        self.assertEqual(self.writer.plan_images(product, ['https://example.com/a.png', 'https://example.com/c.png']),
+                         ['https://example.com/c.png'])
+
+
+def media_script(name):
+    """Import one of the flat script modules in media/ (they import each other by name)."""
+    scripts = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'media')
+    if scripts not in sys.path:
+        sys.path.append(scripts)
+    return importlib.import_module(name)
+
+
+class ProductParserTests(SimpleTestCase):
+    EDGE_CASES = """
+<section class="x  elementor-section\tfoo">
+ <h4 class="elementor-heading-title"> Masa <!-- nota --> <b>inox</b> &amp; raft<script>var x</script></h4>
+ <div class="elementor-widget-text-editor"><div><p>  </p><p>al doilea</p></div></div>
+ <div class="elementor-widget-image"><img alt="fara src"><img src="b.jpg"></div>
+ <div class="elementor-widget-toggle"><div class="elementor-tab-content">
+  <ul><li>Lungime<ul><li>1200 mm</li></ul></li><li> Material <ruby>x<rt>r</rt></ruby></li></ul><ol><li>nu</li></ol>
+ </div></div>
+ <div class="elementor-carousel-image" style="background-image: url('c.jpg')"></div>
+ <div class="elementor-carousel-image"></div>
+ <section class="elementor-section"><h4 class="elementor-heading-title">Interior</h4>
+  <div class="elementor-widget-image-carousel"><img src="d.jpg"></div></section>
+</section>
+<section class="elementor-section"><h3>Fara titlu</h3></section>
+<section class="elementor-section"><div class="elementor-widget-image"><img src=""></div>
+ <h4 class="elementor-heading-title"></h4><template><p>t</p></template></section>
+<section class="elementor-section"><h4 class="elementor-heading-title">Ș&nbsp;ț</h4></section>
+"""
+
+    def test_lxml_matches_soup_on_fixture_pages(self):
+        parsers = media_script('parsers')
+        fixtures = media_script('fixtures')
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        archive = fixtures.build_fixture_archive(path, categories=2, subcategories=1, products=3, images=2)
+        pages = [archive.get(url)[2].decode() for url, entry in sorted(archive.entries.items())
+                 if entry['headers']['Content-Type'].startswith('text/html')]
+        self.assertEqual(len(pages), 5)
+        for html in pages + [self.EDGE_CASES, '', '<p>fara produse</p>']:
+            expected = parsers.parse_products_soup(html)
+            self.assertEqual(parsers.parse_products_lxml(html), expected)
+        self.assertEqual(sum(len(parsers.parse_products_lxml(html)) for html in pages), 12)
+        self.assertEqual(parsers.parse_products_lxml(self.EDGE_CASES)[0], {
+            'title': 'Masainox& raft', 'description': '',
+            'features': ['Lungime1200 mm', '1200 mm', 'Materialx'], 'images': ['c.jpg'],
+        })
+
+
+class FrontierTests(SimpleTestCase):
+
+    def test_resume_skips_finished_work(self):
+        Frontier = media_script('frontier').Frontier
+        path = os.path.join(tempfile.mkdtemp(), 'frontier.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        with Frontier(path) as frontier:
+            self.assertFalse(frontier.begin())
+            frontier.add_categories(['/a/', '/b/'])
+            frontier.expand('/a/', ['/a-1/', '/a-2/'])
+            frontier.page_done('/a/', [('Masa', ['1.jpg', '2.jpg'])])
+            frontier.images_done([('Masa', ['1.jpg'])])
+
+        with Frontier(path) as frontier:
+            self.assertTrue(frontier.begin())
+            self.assertEqual(frontier.categories(), [('/a/', 1), ('/b/', 0)])
+            self.assertEqual(frontier.pages(), [('/a/', '/a-1/'), ('/a/', '/a-2/'), ('/b/', '/b/')])
+            self.assertEqual(frontier.queued_images(), [('Masa', ['2.jpg'])])
+            frontier.finish()
+            # A finished crawl starts over; images still owed stay queued.
+            self.assertFalse(frontier.begin())
+            self.assertEqual(frontier.categories(), [])
+            self.assertEqual(frontier.queued_images(), [('Masa', ['2.jpg'])])
+            # So does a crawl with another scope.
+            frontier.add_categories(['/a/'])
+            self.assertFalse(frontier.begin('a'))
+            self.assertEqual(frontier.pages(), [])
+
+
+class FakeClock:
+    """Stands in for the time module in crawler.py: sleep() only moves the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class StubSession:
+    """requests.Session stand-in answering from a list of responses or exceptions."""
+
+    def __init__(self, *answers, hold=0):
+        self.answers = list(answers)
+        self.hold = hold
+        self.requests = []
+        self.lock = threading.Lock()
+        self.active = {}
+        self.max_active = {}
+
+    def get(self, url, headers=None, timeout=None, **kwargs):
+        host = url.split('/')[2]
+        with self.lock:
+            self.requests.append((url, dict(headers or {})))
+            self.active[host] = self.active.get(host, 0) + 1
+            self.max_active[host] = max(self.max_active.get(host, 0), self.active[host])
+            answer = self.answers.pop(0) if self.answers else stub_response(200)
+        threading.Event().wait(self.hold)
+        with self.lock:
+            self.active[host] -= 1
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def stub_response(status, body=b'', headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body
+    resp.raw = io.BytesIO(body)
+    resp.headers.update(headers or {})
+    resp.url = 'https://casters.ro/'
+    return resp
+
+
+class CrawlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.crawler_module = media_script('crawler')
+        self.clock = FakeClock()
+        for patcher in (mock.patch.object(self.crawler_module, 'time', self.clock),
+                        mock.patch.object(self.crawler_module.random, 'random', return_value=0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def crawler(self, session, **options):
+        return self.crawler_module.Crawler(session=session, **{'delay': 0, 'backoff': 0.5, **options})
+
+    def test_retries_with_exponential_backoff(self):
+        session = StubSession(stub_response(503), requests.ConnectionError(), stub_response(500),
+                              stub_response(200, b'ok'))
+        with self.crawler(session) as crawler:
+            self.assertEqual(crawler.get('https://casters.ro/a/').content, b'ok')
+        self.assertEqual(self.clock.sleeps, [0.5, 1.0, 2.0])
+        self.assertEqual((crawler.stats.retries, crawler.stats.errors, crawler.stats.pages), (3, 0, 1))
+
+        session = StubSession(*[stub_response(502)] * 3)
+        self.clock.sleeps.clear()
+        with self.crawler(session, retries=2) as crawler, self.assertRaises(requests.HTTPError):
+            crawler.get('https://casters.ro/a/')
+        self.assertEqual(self.clock.sleeps, [0.5, 1.0])
+        self.assertEqual((len(session.requests), crawler.stats.errors), (3, 1))
+
+    def test_honours_retry_after(self):
+        retry_at = email.utils.formatdate(self.clock.now + 30, usegmt=True)
+        session = StubSession(stub_response(429, headers={'Retry-After': '7'}),
+                              stub_response(503, headers={'Retry-After': retry_at}),
+                              stub_response(200))
+        with self.crawler(session) as crawler:
+            crawler.get('https://casters.ro/a/')
+        # The date is 30s after the first request, so 23s after the first wait.
+        self.assertEqual(self.clock.sleeps[0], 7)
+        self.assertAlmostEqual(self.clock.sleeps[1], 23, delta=1)
+
+    def test_politeness_delay_per_host(self):
+        session = StubSession()
+        with self.crawler(session, delay=2) as crawler:
+            for url in ('https://casters.ro/a/', 'https://casters.ro/b/', 'https://cdn.casters.ro/1.jpg',
+                        'https://casters.ro/c/'):
+                crawler.get(url)
+            self.assertEqual(self.clock.sleeps, [2, 2])
+            self.clock.now += 10
+            crawler.get('https://casters.ro/d/')
+        self.assertEqual(self.clock.sleeps, [2, 2])
+
+    def test_concurrency_capped_per_host(self):
+        session = StubSession(hold=0.05)
+        urls = [f'https://{host}/{i}/' for host in ('casters.ro', 'cdn.casters.ro') for i in range(4)]
+        with self.crawler(session, workers=8, per_host=2) as crawler:
+            crawler.map(crawler.get, urls)
+        self.assertEqual(session.max_active, {'casters.ro': 2, 'cdn.casters.ro': 2})
+
+
+class HttpCacheTests(SimpleTestCase):
+
+    def test_not_modified_served_from_stored_body(self):
+        crawler_module = media_script('crawler')
+        path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        validators = {'ETag': '"v1"', 'Last-Modified': 'Wed, 01 Jan 2025 00:00:00 GMT'}
+        session = StubSession(stub_response(200, b'<p>pagina</p>', validators), stub_response(200, b'img', validators),
+                              stub_response(304), stub_response(304), stub_response(200, b'<p>pagina</p>'))
+        with crawler_module.Crawler(session=session, delay=0, cache=crawler_module.HttpCache(path)) as crawler:
+            crawler.get('https://casters.ro/a/')
+            crawler.get('https://casters.ro/1.jpg', kind='images', keep_body=False)
+            page = crawler.get('https://casters.ro/a/')
+            image = crawler.get('https://casters.ro/1.jpg', kind='images')
+            crawler.get('https://casters.ro/a/', conditional=False)
+        self.assertTrue(page.not_modified)
+        self.assertEqual(page.content, b'<p>pagina</p>')
+        self.assertEqual((image.not_modified, image.content), (True, b''))
+        sent = [headers for _, headers in session.requests]
+        self.assertEqual(sent[2], {'If-None-Match': '"v1"', 'If-Modified-Since': validators['Last-Modified']})
+        self.assertNotIn('If-None-Match', sent[4])
+        self.assertEqual((crawler.stats.not_modified, crawler.stats.bytes), (2, 2 * len(b'<p>pagina</p>') + 3))
+
+
+class ScrapeRerunTests(TestCase):
+    """Runs scraping.py's crawl against the fixture site, served by a ReplayServer."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.scraping = media_script('scraping')
+        replay = media_script('replay')
+        self.archive = os.path.join(self.media_root, 'archive')
+        media_script('fixtures').build_fixture_archive(self.archive, categories=1, subcategories=1, products=2,
+                                                       images=2)
+        self.server = replay.ReplayServer(self.archive)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.session = replay.replay_session(self.server)
+
+    def scrape(self, *argv):
+        args = self.scraping.parse_args(['--replay', self.archive, '--image-workers', '1',
+                                         '--http-cache', os.path.join(self.media_root, 'cache.sqlite3'), *argv])
+        crawler = self.scraping.build_crawler(args, self.session)
+        with CaptureQueriesContext(connection) as ctx, contextlib.redirect_stdout(io.StringIO()):
+            diff = self.scraping.main(crawler, full=args.full, transforms=TransformPool(workers=1))
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        return crawler.stats, diff, writes
+
+    def test_unchanged_site_writes_nothing(self):
+        stats, diff, writes = self.scrape()
+        self.assertEqual((len(diff['created']), diff['images_added']), (4, 8))
+
+        stats, diff, writes = self.scrape()
+        self.assertEqual(writes, [])
+        self.assertEqual((diff['created'], diff['updated'], diff['unchanged'], diff['images_added']), ([], [], 4, 0))
+        self.assertEqual((stats.not_modified, stats.images), (stats.pages, 0))
+
+        stats, diff, writes = self.scrape('--full')
+        self.assertEqual((len(diff['updated']), diff['unchanged']), (4, 0))
+        self.assertEqual(stats.not_modified, 0)
+        self.assertTrue(writes)
+        self.assertEqual(ProductImage.objects.count(), 8)
+
+
+class ReplayTests(SimpleTestCase):
+
+    def setUp(self):
+        self.replay = media_script('replay')
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+
+    def serve(self, archive):
+        server = self.replay.ReplayServer(archive)
+        server.start()
+        self.addCleanup(server.stop)
+        return self.replay.replay_session(server)
+
+    def test_record_and_replay_round_trip(self):
+        fixtures = media_script('fixtures')
+        source = fixtures.build_fixture_archive(os.path.join(self.path, 'site'), categories=1, subcategories=1,
+                                                products=1, images=1)
+        again = fixtures.build_fixture_archive(os.path.join(self.path, 'again'), categories=1, subcategories=1,
+                                               products=1, images=1)
+        self.assertEqual(again.entries, source.entries)
+        urls = sorted(source.entries)
+        self.assertEqual(len(urls), 5)
+
+        copy = os.path.join(self.path, 'copy')
+        crawler = media_script('crawler').Crawler(session=self.serve(source), delay=0,
+                                                  recorder=self.replay.ArchiveRecorder(copy))
+        with crawler:
+            crawler.map(crawler.get, urls)
+            with self.assertRaises(requests.HTTPError):
+                crawler.get(fixtures.SITE + '/lipsa/')
+
+        session = self.serve(copy)
+        for url in urls:
+            status, headers, body = source.get(url)
+            resp = session.get(url)
+            self.assertEqual((resp.status_code, resp.content, resp.url), (status, body, url))
+            self.assertEqual({k: resp.headers[k] for k in headers}, headers)
+        self.assertEqual(session.get(fixtures.SITE + '/lipsa/').status_code, 404)
+
+    def test_conditional_requests(self):
+        archive = self.replay.Archive(self.path)
+        last_modified = 'Wed, 01 Jan 2025 10:00:00 GMT'
+        archive.add('https://casters.ro/a/', 200, {'ETag': '"v1"', 'Last-Modified': last_modified}, b'pagina')
+        session = self.serve(archive)
+        for headers, status in [
+            ({'If-None-Match': '"v1"'}, 304),
+            ({'If-None-Match': '"v0", "v1"'}, 304),
+            ({'If-None-Match': '"v0"'}, 200),
+            ({'If-Modified-Since': last_modified}, 304),
+            ({'If-Modified-Since': 'Thu, 02 Jan 2025 00:00:00 GMT'}, 304),
+            ({'If-Modified-Since': 'Tue, 31 Dec 2024 00:00:00 GMT'}, 200),
+            ({'If-Modified-Since': 'ieri'}, 200),
+            # If-None-Match decides when both are sent.
+            ({'If-None-Match': '"v0"', 'If-Modified-Since': last_modified}, 200),
+        ]:
+            with self.subTest(headers=headers):
+                resp = session.get('https://casters.ro/a/', headers=headers)
+                self.assertEqual(resp.status_code, status)
+                self.assertEqual(resp.content, b'' if status == 304 else b'pagina')
+                self.assertEqual(resp.headers['ETag'], '"v1"')
+
+
+class BenchmarkTests(TestCase):
+
+    def test_runs_offline_and_rolls_back(self):
+        benchmark = media_script('benchmark')
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            benchmark.main(['--categories', '1', '--subcategories', '1', '--products', '2', '--images', '1',
+                            '--workers', '2', '--image-workers', '1'])
+            self.assertTrue(benchmark.main(['--categories', '1', '--subcategories', '1', '--products', '2',
+                                            '--images', '1', '--parsers', '--repeat', '1']))
+        output = out.getvalue()
+        self.assertIn('Fetch: 3 pages', output)
+        self.assertIn('Images: 4 downloaded and transformed', output)
+        self.assertIn('DB products: 4 rows', output)
+        self.assertIn('Parse products (lxml)', output)
+        self.assertFalse(Product.objects.exists())
+
+
+class SqlAlchemyLayerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.models = media_script('models')
+        self.addCleanup(self.reset_engine)
+
+    def reset_engine(self):
+        if self.models._engine is not None:
+            self.models._engine.dispose()
+        self.models._engine = self.models._session_factory = None
+
+    def test_engine_is_created_on_first_use(self):
+        path = os.path.join(tempfile.mkdtemp(), 'catalog.sqlite3')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), ignore_errors=True)
+        with mock.patch.dict(os.environ, {'DB_ENGINE': 'django.db.backends.sqlite3', 'DB_NAME': path}):
+            self.assertIsNone(self.models._engine)
+            self.assertFalse(os.path.exists(path))
+            self.models.create_tables()
+            session = self.models.SessionLocal()
+            session.add(self.models.Category("Mese inox"))
+            session.commit()
+            self.assertEqual(session.query(self.models.Category).one().slug, "mese-inox")
+            session.close()
+            self.assertIs(self.models.engine, self.models.get_engine())
+
+    def test_settings_come_from_django_env(self):
+        env = {
+            'DB_ENGINE': 'django.db.backends.postgresql', 'DB_NAME': 'castersinox', 'DB_USER': 'site',
+            'DB_PASSWORD': 'p@ss', 'DB_HOST': 'db', 'DB_PORT': '5433', 'DB_POOL_SIZE': '3', 'DB_CONN_MAX_AGE': '0',
+        }
+        with mock.patch.dict(os.environ, env):
+            url = self.models.database_url()
+            options = self.models.engine_options(url)
+        self.assertEqual(url.render_as_string(hide_password=False), 'postgresql+psycopg2://site:p%40ss@db:5433/castersinox')
+        self.assertEqual(options['pool_size'], 3)
+        self.assertEqual(options['pool_recycle'], -1)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertIsNone(self.models._engine)
+
+    def test_copy_streams(self):
+        catalog_copy = media_script('catalog_copy')
+        rows = [
+            {'id': 1, 'name': 'Masa "X"', 'description': '', 'features': [{'k': 'a', 'v': 'b\\c'}], 'subcategory_id': None},
+            {'id': 2, 'name': 'Raft\ninox', 'description': 'd', 'features': [], 'subcategory_id': 3},
+        ]
+        columns = list(rows[0])
+        source = catalog_copy.LineReader(catalog_copy.jsonl_to_csv([json.dumps(r) + '\n' for r in rows], columns))
+        parsed = list(csv.reader(io.StringIO(source.read().decode())))
+        self.assertEqual(parsed[0], ['1', 'Masa "X"', '', '[{"k": "a", "v": "b\\\\c"}]', ''])
+        self.assertEqual(parsed[1][1], 'Raft\ninox')
+
+        # COPY ... TO STDOUT escapes backslashes, and may split rows across writes.
+        out = io.StringIO()
+        writer = catalog_copy.JsonlWriter(out)
+        writer.write(b'{"v":"b\\\\\\\\c"}\n{"id"')
+        writer.write(b':2}\n')
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], [{'v': 'b\\c'}, {'id': 2}])
+
+    def test_copy_needs_postgresql(self):
+        catalog_copy = media_script('catalog_copy')
+        engine = self.models.create_engine('sqlite://')
+        self.addCleanup(engine.dispose)
+        directory = os.path.join(tempfile.gettempdir(), 'catalog-copy-test')
+        with self.assertRaises(SystemExit):
+            catalog_copy.export(directory, engine=engine)
+        self.assertFalse(os.path.exists(directory))
+
+    def test_load_invalidates_caches(self):
+        catalog_copy = media_script('catalog_copy')
+        sequence = page_cache.current_sequence()
+        cache.set(NAV_VERSION_KEY, 'before', timeout=None)
+        catalog_copy.invalidate_caches()
+        self.assertNotEqual(cache.get(NAV_VERSION_KEY), 'before')
+        self.assertGreater(page_cache.current_sequence(), sequence)
+        self.assertTrue(page_cache.changed_within(60))
+
+
+class MediaGCTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.category = Category.objects.create(name="Mese")
+        self.product = Product.objects.create(name="Masa", description="", category=self.category)
+
+    def write(self, name, size=100, age=7200):
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            fp.write(b'x' * size)
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+        return name
+
+    def test_collects_unreferenced_files(self):
+        image = ingest_image(self.product, png_bytes(300, 200))
+        kept = [image.image.name] + [f['name'] for f in image.variants['files']]
+        for name in kept:
+            os.utime(default_storage.path(name), (0, 0))
+        orphans = [
+            self.write('products/extra/12/12-1.png', 1000),
+            self.write('products/extra/ab/.ingest-tmp', 500),
+            self.write('products/derivatives/gone-320.webp', 200),
+        ]
+        recent = self.write('products/extra/new.png', age=0)
+
+        out = io.StringIO()
+        call_command('collect_orphaned_media', dry_run=True, stdout=out)
+        self.assertIn('products/extra: 2 files', out.getvalue())
+        self.assertIn('3 orphaned files', out.getvalue())
+        self.assertTrue(all(default_storage.exists(name) for name in orphans))
+
+        out = io.StringIO()
+        call_command('collect_orphaned_media', stdout=out)
+        self.assertIn('Deleted 3 of 3 orphaned files', out.getvalue())
+        self.assertFalse(any(default_storage.exists(name) for name in orphans))
+        self.assertTrue(all(default_storage.exists(name) for name in kept + [recent]))
+        self.assertFalse(os.path.exists(default_storage.path('products/extra/12')))
+
+    @override_settings(DELETE_PRODUCT_IMAGE_FILES=True)
+    def test_delete_hook_keeps_shared_files(self):
+        data = png_bytes(300, 200)
+        first = ingest_image(self.product, data)
+        other = ingest_image(Product.objects.create(name="Alta", description="", category=self.category), data)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(other.image.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.product.delete()
+        self.assertFalse(default_storage.exists(other.image.name))
+
+
+class AdminQueryBudgetTests(TestCase):
+    """
+    Every registered admin has a query budget for its changelist and change
+    view, measured over a catalog large enough that a per-row query would
+    exceed it.
+    """
+
+    QUERY_BUDGETS = {
+        # model label: (changelist, change view)
+        'auth.Group': (7, 8),
+        'auth.User': (6, 10),
+        'core.Category': (5, 8),
+        'core.SubCategory': (6, 8),
+        'core.Product': (7, 11),
+        'core.ContactSubmission': (6, 7),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(categories=3, subcategories=3, products=8)
+        Group.objects.create(name="Editori")
+        for i in range(5):
+            submission = ContactSubmission.objects.create(fullname=f"Client {i}", email=f"c{i}@example.com")
+            submission.features.set(Category.objects.all())
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'parola')
+        cls.product = Product.objects.first()
+        for i in range(6):
+            ProductImage.objects.create(product=cls.product, image=f"products/extra/more-{i}.png")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertQueries(self, budget, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx.captured_queries), budget,
+            "%s ran %d queries (budget %d):\n%s" % (
+                url, len(ctx.captured_queries), budget,
+                "\n".join(q['sql'] for q in ctx.captured_queries),
+            ),
+        )
+        return response
+
+    def test_every_admin_has_a_budget(self):
+        self.assertEqual({model._meta.label for model in admin.site._registry}, set(self.QUERY_BUDGETS))
+
+    def test_admin_views(self):
+        for model in admin.site._registry:
+            opts = model._meta
+            changelist, change = self.QUERY_BUDGETS[opts.label]
+            with self.subTest(model=opts.label):
+                self.assertQueries(changelist, reverse(f'admin:{opts.app_label}_{opts.model_name}_changelist'))
+                obj = model.objects.order_by('pk').first()
+                self.assertQueries(change, reverse(f'admin:{opts.app_label}_{opts.model_name}_change', args=[obj.pk]))
+
+    def test_main_image_picker_renders_selected_image_only(self):
+        category = Category.objects.get(name="Categorie 0")
+        response = self.client.get(reverse('admin:core_category_change', args=[category.pk]))
+        field = response.context['adminform'].form['main_image']
+        html = str(field)
+        self.assertIn('admin-image-autocomplete', html)
+        self.assertIn(f'?category={category.pk}', html)
+        self.assertEqual(html.count('<option'), 2)
+        self.assertIn(f'value="{category.main_image_id}" selected', html)
+
+    def test_image_autocomplete(self):
+        url = reverse('admin:core_image_autocomplete')
+        with self.assertNumQueries(4):
+            data = self.client.get(url, {'product': self.product.pk}).json()
+        self.assertEqual(len(data['results']), 8)
+        self.assertFalse(data['pagination']['more'])
+        self.assertIn('/thumbnail/', data['results'][0]['thumbnail'])
+
+        category = self.product.category
+        first = self.client.get(url, {'category': category.pk}).json()
+        self.assertEqual(len(first['results']), 20)
+        self.assertTrue(first['pagination']['more'])
+        second = self.client.get(url, {'category': category.pk, 'page': 2}).json()
+        self.assertEqual(len(second['results']), 8 * 2 + 6 - 20)
+        self.assertFalse(second['pagination']['more'])
+        self.assertEqual(self.client.get(url, {'category': category.pk, 'term': 'nimic'}).json()['results'], [])
+        self.assertEqual(self.client.get(url).json()['results'], [])
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url, {'product': self.product.pk}).status_code, 302)
+
+
+class UploadJobTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.category = Category.objects.create(name="Mese")
+        self.product = Product.objects.create(name="Masa", description="", category=self.category)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'parola'))
+        self.upload_url = reverse('admin:core_product_upload_images', args=[self.product.pk])
+
+    def test_upload_is_queued_then_processed(self):
+        change = self.client.get(reverse('admin:core_product_change', args=[self.product.pk]))
+        self.assertContains(change, f'data-upload-url="{self.upload_url}"')
+        self.assertContains(change, 'js/admin-image-upload.js')
+        files = [
+            SimpleUploadedFile('masa.png', png_bytes(600, 400), content_type='image/png'),
+            SimpleUploadedFile('notes.txt', b'nu', content_type='text/plain'),
+        ]
+        response = self.client.post(self.upload_url, {'images': files})
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual([job['status'] for job in data['jobs']], ['queued'])
+        self.assertEqual([error['name'] for error in data['errors']], ['notes.txt'])
+        self.assertFalse(self.product.images.exists())
+        job = ImageUploadJob.objects.get()
+        self.assertTrue(default_storage.exists(job.staged_file))
+
+        out = io.StringIO()
+        call_command('process_image_uploads', once=True, stdout=out)
+        self.assertIn('1 images processed, 0 failed', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageUploadJob.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.image.product, self.product)
+        self.assertTrue(job.image.variants['files'])
+        self.assertFalse(default_storage.exists(job.staged_file))
+
+        status_url = reverse('admin:core_product_upload_status', args=[self.product.pk])
+        jobs = self.client.get(status_url, {'ids': f'{job.pk},x'}).json()['jobs']
+        self.assertEqual(jobs[0]['status'], 'done')
+        self.assertIn('/thumbnail/', jobs[0]['thumbnail'])
+        for object_id in ('abc', self.product.pk + 1):
+            url = reverse('admin:core_product_upload_status', args=[object_id])
+            self.assertEqual(self.client.get(url, {'ids': job.pk}).status_code, 404)
+
+    def test_inline_takes_no_uploads(self):
+        ingest_image(self.product, png_bytes(300, 200))
+        change = self.client.get(reverse('admin:core_product_change', args=[self.product.pk]))
+        self.assertContains(change, '/thumbnail/')
+        self.assertNotContains(change, 'name="images-0-image"')
+        self.assertNotContains(change, 'name="images-__prefix__-image"')
+
+    def test_rejects_non_images_and_get(self):
+        response = self.client.post(self.upload_url, {'images': SimpleUploadedFile('a.pdf', b'%PDF')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(self.upload_url).status_code, 405)
+        self.assertFalse(ImageUploadJob.objects.exists())
+
+    def test_upload_requires_csrf_token(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(User.objects.get())
+        response = client.post(self.upload_url, {'images': SimpleUploadedFile('masa.png', png_bytes())})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(ImageUploadJob.objects.exists())
+
+    def test_broken_image_fails(self):
+        job = upload_jobs.enqueue(self.product, SimpleUploadedFile('masa.jpg', b'not a jpeg'))
+        upload_jobs.run(upload_jobs.claim_next())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageUploadJob.FAILED)
+        self.assertTrue(job.error)
+        self.assertIsNone(upload_jobs.claim_next())
+
+    def test_stale_jobs_are_requeued(self):
+        job = upload_jobs.enqueue(self.product, SimpleUploadedFile('masa.png', png_bytes()))
+        self.assertEqual(upload_jobs.claim_next().pk, job.pk)
+        self.assertIsNone(upload_jobs.claim_next())
+        self.assertEqual(upload_jobs.requeue_stale(stale_after=60), 0)
+        ImageUploadJob.objects.update(started_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(upload_jobs.requeue_stale(stale_after=60), 1)
+        self.assertEqual(upload_jobs.claim_next().attempts, 2)
+
+        ImageUploadJob.objects.update(started_at=timezone.now() - timedelta(minutes=5),
+                                      attempts=upload_jobs.MAX_ATTEMPTS)
+        self.assertTrue(default_storage.exists(job.staged_file))
+        self.assertEqual(upload_jobs.requeue_stale(stale_after=60), 1)
+        self.assertEqual(ImageUploadJob.objects.get().status, ImageUploadJob.FAILED)
+        self.assertFalse(default_storage.exists(job.staged_file))
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The replica is a second in-memory SQLite database registered for each
+    test. replicate() copies the primary into it with SQLite's backup API,
+    so whatever is written afterwards is missing from the replica, as on
+    one that lags behind.
+    """
+
+    def setUp(self):
+        connections.settings[db_router.REPLICA] = {**connection.settings_dict, 'NAME': ':memory:'}
+        self.addCleanup(self.remove_replica)
+        # connect() rather than ensure_connection(): the test case only
+        # allows connections to the aliases it declares.
+        connections[db_router.REPLICA].connect()
+        self.category = Category.objects.create(name="Mese")
+        self.product = Product.objects.create(name="Masa", description="", category=self.category)
+        self.url = reverse('core:product_detail', args=[self.product.slug])
+        self.replicate()
+
+    def remove_replica(self):
+        # In-memory SQLite connections ignore close().
+        connections[db_router.REPLICA].connection.close()
+        del connections[db_router.REPLICA]
+        del connections.settings[db_router.REPLICA]
+
+    def replicate(self):
+        connection.ensure_connection()
+        connection.connection.backup(connections[db_router.REPLICA].connection)
+        # Also forgets the catalog changes made so far.
+        cache.clear()
+
+    def product_name(self):
+        cache.clear()
+        return self.client.get(self.url).context['product'].name
+
+    def test_catalog_reads_use_replica(self):
+        Product.objects.filter(pk=self.product.pk).update(name="Masa noua")
+        self.assertEqual(self.product_name(), "Masa")
+        self.client.cookies[db_router.STICKY_COOKIE] = '1'
+        self.assertEqual(self.product_name(), "Masa noua")
+
+    def test_recent_catalog_change_reads_primary(self):
+        Product.objects.filter(pk=self.product.pk).update(name="Masa noua")
+        page_cache.invalidate(page_cache.product_tag(self.product.pk))
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['product'].name, "Masa noua")
+
+    def test_admin_save_writes_primary_and_sticks(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'parola'))
+        self.replicate()
+        response = self.client.post(
+            reverse('admin:core_product_change', args=[self.product.pk]),
+            {
+                'name': "Masa noua", 'slug': self.product.slug, 'description': "Masa din inox", 'features': '',
+                'category': self.category.pk, 'subcategory': '', 'main_image': '',
+                'images-TOTAL_FORMS': 0, 'images-INITIAL_FORMS': 0,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(db_router.STICKY_COOKIE, response.cookies)
+        self.assertEqual(Product.objects.get().name, "Masa noua")
+        self.assertEqual(Product.objects.using(db_router.REPLICA).get().name, "Masa")
+        self.assertEqual(self.product_name(), "Masa noua")
+
+    def test_contact_writes_primary(self):
+        response = self.client.post(reverse('core:contact'), {
+            'fullname': "Ion", 'email': "ion@example.com",
+            'features_used': [self.category.pk], 'testimonial_consent': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ContactSubmission.objects.count(), 1)
+        self.assertEqual(ContactSubmission.objects.using(db_router.REPLICA).count(), 0)
+        self.assertIn(db_router.STICKY_COOKIE, response.cookies)
+
+    def test_primary_outside_requests(self):
+        self.assertEqual(Product.objects.all().db, 'default')
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertTrue(router.allow_migrate('default', 'core'))
+        self.assertFalse(router.allow_migrate(db_router.REPLICA, 'core'))
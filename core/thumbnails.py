@@ -0,0 +1,205 @@
+"""
+Lazily generated thumbnails of product images, kept in an on-disk cache.
+
+Files live under ``THUMBNAIL_CACHE_DIR``, named after a hash of the source
+image name and the size preset, so replacing an image never serves an old
+thumbnail. Every hit refreshes the file's mtime; once the cache grows past
+``THUMBNAIL_CACHE_MAX_BYTES`` the least recently used files are removed
+until it is back under ``EVICT_TO`` of the limit.
+
+Within a process, concurrent first requests for the same thumbnail are
+serialized on a per-file lock, so the image is decoded once and the other
+threads reuse the result. The lock is per process: separate workers may
+each render the same thumbnail once, but files are written to a
+temporary name and renamed into place, so they only ever see complete
+thumbnails.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image
+
+# Bounding boxes; thumbnails keep the aspect ratio of the source.
+PRESETS = {
+    'small': (100, 100),
+    'medium': (150, 150),
+    'large': (300, 300),
+}
+FORMAT = 'webp'
+CONTENT_TYPE = 'image/webp'
+EVICT_TO = 0.9
+
+_locks = {}
+_locks_guard = threading.Lock()
+# Approximate size of the cache directory as seen by this process; None
+# until the first write triggers a scan.
+_usage = {'bytes': None}
+_stats = {'hits': 0, 'generated': 0, 'evicted': 0}
+_stats_guard = threading.Lock()
+
+
+def cache_dir():
+    return str(settings.THUMBNAIL_CACHE_DIR)
+
+
+def thumbnail_key(source_name, preset):
+    return hashlib.sha1(f'{source_name}|{preset}'.encode()).hexdigest()
+
+
+def thumbnail_path(source_name, preset):
+    key = thumbnail_key(source_name, preset)
+    return os.path.join(cache_dir(), key[:2], f'{key}.{FORMAT}')
+
+
+def thumbnail_url(product_image, preset='small'):
+    """URL of the thumbnail endpoint, versioned on the source file name."""
+    url = reverse('core:thumbnail', args=[product_image.pk, preset])
+    return f'{url}?v={thumbnail_key(product_image.image.name, preset)[:12]}'
+
+
+def render_thumbnail(fp, preset):
+    with Image.open(fp) as img:
+        img.draft('RGB', PRESETS[preset])
+        img.thumbnail(PRESETS[preset], Image.Resampling.LANCZOS)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        buf = io.BytesIO()
+        img.save(buf, FORMAT.upper(), quality=80)
+        return buf.getvalue()
+
+
+def _count(name, n=1):
+    with _stats_guard:
+        _stats[name] += n
+
+
+@contextmanager
+def _key_lock(key):
+    with _locks_guard:
+        entry = _locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _locks[key]
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def get_thumbnail(source_name, preset):
+    """
+    Return the path of the cached thumbnail of `source_name`, generating it
+    on first use. Raises KeyError for unknown presets and OSError when the
+    source cannot be read.
+    """
+    if preset not in PRESETS:
+        raise KeyError(preset)
+    path = thumbnail_path(source_name, preset)
+    if _touch(path):
+        _count('hits')
+        return path
+
+    with _key_lock(path):
+        # Another thread may have generated it while we waited.
+        if _touch(path):
+            _count('hits')
+            return path
+        with default_storage.open(source_name, 'rb') as fp:
+            data = render_thumbnail(fp, preset)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        _count('generated')
+
+    _record_write(len(data))
+    return path
+
+
+def _scan():
+    """[(mtime, size, path), ...] for every cached thumbnail."""
+    entries = []
+    for root, _dirs, files in os.walk(cache_dir()):
+        for name in files:
+            if not name.endswith(f'.{FORMAT}'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def _record_write(size):
+    with _locks_guard:
+        if _usage['bytes'] is None:
+            _usage['bytes'] = sum(e[1] for e in _scan())
+        else:
+            _usage['bytes'] += size
+        over = _usage['bytes'] > settings.THUMBNAIL_CACHE_MAX_BYTES
+    if over:
+        evict()
+
+
+def evict(max_bytes=None):
+    """
+    Remove least recently used thumbnails until the cache is under
+    EVICT_TO of `max_bytes` (THUMBNAIL_CACHE_MAX_BYTES by default). Returns
+    the number of files removed.
+    """
+    if max_bytes is None:
+        max_bytes = settings.THUMBNAIL_CACHE_MAX_BYTES
+    entries = sorted(_scan())
+    total = sum(e[1] for e in entries)
+    target = max_bytes * EVICT_TO if total > max_bytes else total
+    removed = 0
+    for _mtime, size, path in entries:
+        if total <= target:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    with _locks_guard:
+        _usage['bytes'] = total
+    _count('evicted', removed)
+    return removed
+
+
+def stats():
+    with _stats_guard:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_guard:
+        for name in _stats:
+            _stats[name] = 0
+    with _locks_guard:
+        _usage['bytes'] = None
@@ -0,0 +1,85 @@
+"""
+Background processing of images uploaded in the product admin.
+
+The upload view only streams each file to UPLOAD_DIR and records an
+ImageUploadJob, so request workers never decode an image. The
+process_image_uploads command claims queued jobs one at a time with a
+conditional UPDATE, so several workers can share the queue. Each job
+fits the image onto the product canvas, stores it through
+core.ingest (the post_save signals fingerprint it and build its
+derivatives) and removes the staged file. A job whose worker died is
+queued again once it has been running longer than `stale_after`
+seconds, up to MAX_ATTEMPTS times.
+"""
+import os
+import uuid
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from .image_pipeline import transform_image
+from .ingest import ingest_image
+from .models import ImageUploadJob
+
+UPLOAD_DIR = 'uploads/pending'
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.avif', '.gif', '.bmp', '.tif', '.tiff'}
+MAX_ATTEMPTS = 3
+
+
+def enqueue(product, uploaded_file, storage=default_storage):
+    """Stage an UploadedFile for `product` and queue it. Raises ValueError for non-images."""
+    ext = os.path.splitext(uploaded_file.name)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise ValueError(f'Unsupported file type: {ext or uploaded_file.name}')
+    # storage.save() copies the upload chunk by chunk.
+    name = storage.save(f'{UPLOAD_DIR}/{uuid.uuid4().hex}{ext}', uploaded_file)
+    return ImageUploadJob.objects.create(
+        product=product,
+        staged_file=name,
+        original_name=os.path.basename(uploaded_file.name)[:255],
+        size=uploaded_file.size or 0,
+    )
+
+
+def requeue_stale(stale_after, storage=default_storage):
+    """Queue again the jobs left running by a worker that died; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = ImageUploadJob.objects.filter(status=ImageUploadJob.RUNNING, started_at__lt=cutoff)
+    failed = 0
+    for pk, staged_file in stale.filter(attempts__gte=MAX_ATTEMPTS).values_list('pk', 'staged_file'):
+        # Given up on for good: nothing will read the staged upload again.
+        if stale.filter(pk=pk).update(status=ImageUploadJob.FAILED, error='Worker stopped while processing',
+                                      finished_at=timezone.now()):
+            storage.delete(staged_file)
+            failed += 1
+    return failed + stale.update(status=ImageUploadJob.QUEUED)
+
+
+def claim_next():
+    """Mark the oldest queued job as running and return it, or None."""
+    queued = ImageUploadJob.objects.filter(status=ImageUploadJob.QUEUED).order_by('pk')
+    for pk in queued.values_list('pk', flat=True)[:10]:
+        claimed = ImageUploadJob.objects.filter(pk=pk, status=ImageUploadJob.QUEUED).update(
+            status=ImageUploadJob.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1)
+        if claimed:
+            return ImageUploadJob.objects.select_related('product').get(pk=pk)
+    return None
+
+
+def run(job, storage=default_storage):
+    """Process a claimed job and record the outcome."""
+    try:
+        with storage.open(job.staged_file, 'rb') as fp:
+            data = transform_image(fp.read())
+        job.image = ingest_image(job.product, data)
+        job.status = ImageUploadJob.DONE
+        job.error = ''
+    except Exception as exc:
+        job.status = ImageUploadJob.FAILED
+        job.error = f'{type(exc).__name__}: {exc}'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['image', 'status', 'error', 'finished_at'])
+    storage.delete(job.staged_file)
+    return job
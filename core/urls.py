@@ -14,5 +14,6 @@ urlpatterns = [
     path('contact/', contact_view, name='contact'),
     path('success/', SuccessView.as_view(), name='success'),
     path('policy/', PolicyView, name='policy'),
+    path('thumbnail/<int:pk>/<slug:preset>/', views.thumbnail_view, name='thumbnail'),
 
 ]
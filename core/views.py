@@ -1,20 +1,125 @@
 import os
-from django.http import FileResponse
+from django.http import FileResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
 from django.shortcuts import get_object_or_404, reverse, render, redirect
 from django.contrib import messages
 from django.views.generic import TemplateView, DetailView, FormView
 from  django.template.response import TemplateResponse
 from django.conf import settings
-from .models import Product, Category, SubCategory, ProductImage, ContactSubmission
-from django.db.models import Q
+from .models import Product, Category, SubCategory, ProductImage, ContactSubmission, CatalogVersion
+from .navigation import navigation_version
+from django.db.models import Count, F, Max, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber
+from .facets import FACET_PARAM, facet_counts, filter_by_facets, parse_facet_params
 from .forms import ContactForm
+from . import page_cache, thumbnails
+from .db_router import replica_reads
+from .pagination import InvalidCursor, KeysetPaginator
+from .search import search_products
+
+PREVIEW_SIZE = 4
+
+
+def attach_subcategory_previews(subcategories, size=PREVIEW_SIZE):
+    """
+    Attach `products_preview` (newest `size` products) to each subcategory
+    using a single windowed query instead of one query per subcategory.
+    """
+    previews = {sub.pk: [] for sub in subcategories}
+    if not previews:
+        return subcategories
+    ranked = (
+        Product.objects.filter(subcategory__in=list(previews))
+        .select_related('main_image')
+        .annotate(preview_rank=Window(
+            RowNumber(),
+            partition_by=[F('subcategory_id')],
+            order_by=[F('created_at').desc(), F('id').desc()],
+        ))
+        .filter(preview_rank__lte=size)
+        .order_by('subcategory_id', 'preview_rank')
+    )
+    for prod in ranked:
+        previews[prod.subcategory_id].append(prod)
+    for sub in subcategories:
+        sub.products_preview = previews[sub.pk]
+    return subcategories
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs with 304 before any template is rendered.
+    Views implement `get_validators()` returning (etag, last_modified) from
+    at most one cheap query.
+    """
+
+    def get_validators(self):
+        return None, None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        etag, last_modified = self.get_validators()
+        if etag is not None:
+            etag = quote_etag(etag)
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+        if etag and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if timestamp and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+
+class CachedPageMixin:
+    """
+    Serve anonymous GETs from core.page_cache. Views add the dependency tags
+    of what they render to `self.cache_tags`. Cached pages keep their
+    validators, so revalidating a cached page costs no queries at all.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.cache_tags = set()
+        if not page_cache.is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        response = page_cache.get(request)
+        if response is not None:
+            response['X-Page-Cache'] = 'HIT'
+            last_modified = response.get('Last-Modified')
+            return get_conditional_response(
+                request,
+                etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+                response=response,
+            )
+
+        started_at = page_cache.current_sequence()
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        page_cache.store(request, response, self.cache_tags, started_at)
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+
+class CatalogValidatorsMixin(ConditionalGetMixin):
+    """Listing pages change whenever anything in the catalog does."""
+
+    def get_validators(self):
+        catalog = CatalogVersion.current()
+        return f'catalog-{catalog.version}', catalog.updated_at
+
 
-class MainView(TemplateView):
+@replica_reads
+class MainView(CachedPageMixin, CatalogValidatorsMixin, TemplateView):
     template_name = 'core/home_content.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
+        self.cache_tags.add(page_cache.HOME)
         context['current_category'] = None
         return context
 
@@ -24,8 +129,10 @@ class MainView(TemplateView):
 
 
 # Catalog view with filtering and search
-class ProductPageView(TemplateView):
+@replica_reads
+class ProductPageView(CachedPageMixin, CatalogValidatorsMixin, TemplateView):
     template_name = 'core/catalog.html'
+    paginate_by = 24
 
     FILTER_MAPPING = {
         'category': lambda queryset, value: queryset.filter(category__slug__iexact=value),
@@ -37,16 +144,18 @@ class ProductPageView(TemplateView):
         category_slug = kwargs.get('category_slug') or kwargs.get('slug')
         subcategory_slug = kwargs.get('subcategory_slug')
 
-        categories = Category.objects.all()
-        products = Product.objects.all().order_by('-created_at')
+        products = Product.objects.select_related('main_image').order_by('-created_at', '-id')
 
         current_category = None
         current_subcategory = None
-        category_subcategories = SubCategory.objects.none()
+        category_subcategories = []
 
         if category_slug:
             current_category = get_object_or_404(Category, slug=category_slug)
-            category_subcategories = SubCategory.objects.filter(category=current_category)
+            self.cache_tags.add(page_cache.category_tag(current_category.pk))
+            category_subcategories = list(
+                SubCategory.objects.filter(category=current_category).select_related('main_image')
+            )
 
             # If a subcategory is selected, show products for it.
             if subcategory_slug:
@@ -55,27 +164,26 @@ class ProductPageView(TemplateView):
                     slug=subcategory_slug,
                     category=current_category
                 )
+                self.cache_tags.add(page_cache.subcategory_tag(current_subcategory.pk))
                 products = products.filter(category=current_category, subcategory=current_subcategory)
             else:
                 # If the category has subcategories and no subcategory selected,
                 # hide category-level products so template shows subcategories first.
-                if category_subcategories.exists():
+                if category_subcategories:
                     products = None
                 else:
                     products = products.filter(category=current_category)
 
-            # Attach a small preview queryset to each subcategory
-            for sub in category_subcategories:
-                sub.products_preview = Product.objects.filter(
-                    subcategory=sub
-                ).order_by('-created_at')[:4]
+            # Attach a small preview list to each subcategory
+            if not current_subcategory:
+                attach_subcategory_previews(category_subcategories)
+        else:
+            self.cache_tags.add(page_cache.CATALOG)
 
         # Search only when products is not None
         query = self.request.GET.get('q')
         if query and products is not None:
-            products = products.filter(
-                Q(name__icontains=query) | Q(description__icontains=query) | Q(features__icontains=query)
-            )
+            products = search_products(products, query)
 
         filter_params = {}
         for param, filter_func in self.FILTER_MAPPING.items():
@@ -87,10 +195,22 @@ class ProductPageView(TemplateView):
                 filter_params[param] = 'None'
         filter_params['q'] = query or ''
 
+        selected_facets = parse_facet_params(self.request.GET.getlist(FACET_PARAM))
+        facets = []
+        if products is not None:
+            facets = list(self.facets(products, selected_facets))
+            products = filter_by_facets(products, selected_facets)
+
+        page = None
+        if products is not None:
+            page = self.paginate(products)
+            products = page.object_list
+
         context.update({
-            'categories': categories,
             'subcategories': category_subcategories,
             'products': products,
+            'page': page,
+            'facets': facets,
             'current_category': current_category,
             'current_subcategory': current_subcategory,
             'filter_params': filter_params,
@@ -104,6 +224,41 @@ class ProductPageView(TemplateView):
 
         return context
 
+    def facets(self, products, selected):
+        for facet in facet_counts(products, selected):
+            for value in facet['values']:
+                value['url'] = self.facet_url(facet['key'], value['value'])
+            yield facet
+
+    def facet_url(self, key, value):
+        """Current URL with the `key:value` facet toggled, back on page one."""
+        params = self.request.GET.copy()
+        params.pop('cursor', None)
+        token = f'{key}:{value}'
+        current = params.getlist(FACET_PARAM)
+        if token in current:
+            current.remove(token)
+        else:
+            current.append(token)
+        params.setlist(FACET_PARAM, current)
+        return '?' + params.urlencode()
+
+    def paginate(self, products):
+        try:
+            page = KeysetPaginator(products, self.paginate_by).page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+        page.next_url = self.cursor_url(page.next_cursor)
+        page.previous_url = self.cursor_url(page.previous_cursor)
+        return page
+
+    def cursor_url(self, cursor):
+        if cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params['cursor'] = cursor
+        return '?' + params.urlencode()
+
     def get(self, request, *args, **kwargs):
         context = self.get_context_data(**kwargs)
         return TemplateResponse(request, self.template_name, context)
@@ -111,34 +266,78 @@ class ProductPageView(TemplateView):
 
 
 
-class ProductDetailView(DetailView):
+@replica_reads
+class ProductDetailView(CachedPageMixin, ConditionalGetMixin, DetailView):
     model = Product
     template_name = 'core/product_detail.html'
     slug_field = 'slug'
     slug_url_kwarg = 'slug'
 
+    def current_category_slug(self):
+        return self.kwargs.get('category_slug') or self.request.GET.get('category')
+
+    def get_validators(self):
+        # Product row, a summary of its images and of the products of the
+        # current category (the related cards) in one query; the navigation
+        # version covers the navbar and category names. Image edits also
+        # touch `updated_at` (see core.signals).
+        category_slug = self.current_category_slug()
+        if category_slug:
+            siblings = Product.objects.filter(category__slug=category_slug)
+        else:
+            siblings = Product.objects.filter(category=OuterRef('category_id'))
+        siblings = siblings.order_by().values('category_id')
+        row = (
+            Product.objects.filter(slug=self.kwargs.get(self.slug_url_kwarg))
+            .annotate(
+                image_count=Count('images'), last_image=Max('images__id'),
+                sibling_count=Subquery(siblings.annotate(n=Count('pk')).values('n')),
+                siblings_updated=Subquery(siblings.annotate(last=Max('updated_at')).values('last')),
+            )
+            .values_list('pk', 'updated_at', 'image_count', 'last_image', 'sibling_count', 'siblings_updated')
+            .first()
+        )
+        if row is None:
+            return None, None
+        pk, updated_at, image_count, last_image, sibling_count, siblings_updated = row
+        last_modified = max(updated_at, siblings_updated or updated_at)
+        etag = (f'product-{pk}-{updated_at.timestamp():.6f}-{image_count}-{last_image}'
+                f'-{sibling_count}-{last_modified.timestamp():.6f}-{navigation_version()[:12]}')
+        return etag, last_modified
+
+    def get_queryset(self):
+        return Product.objects.select_related('main_image', 'category')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = self.get_object()
+        product = self.object
+        self.cache_tags.add(page_cache.product_tag(product.pk))
 
         # Determine the category the user is "on":
         # 1. Try a category slug passed in URL kwargs (common for nested routes)
         # 2. Try a `category` GET param
         # 3. Fall back to the product's own category
-        category_slug = kwargs.get('category_slug') or self.kwargs.get('category_slug') or self.request.GET.get('category')
+        category_slug = kwargs.get('category_slug') or self.current_category_slug()
         if category_slug:
             current_category = get_object_or_404(Category, slug=category_slug)
         else:
             current_category = product.category
+        if current_category:
+            # The related product cards come from this category.
+            self.cache_tags.add(page_cache.category_tag(current_category.pk))
 
         # Related products come from the resolved current_category
         related_products = Product.objects.none()
         if current_category:
-            related_products = Product.objects.filter(category=current_category).exclude(id=product.id)[:2]
+            related_products = (
+                Product.objects.filter(category=current_category)
+                .exclude(id=product.id)
+                .select_related('main_image')[:2]
+            )
 
         context.update({
             'product': product,
-            'categories': Category.objects.all(),
+            'product_images': list(product.images.order_by('pk')),
             'related_products': related_products,
             'current_category': current_category,
         })
@@ -179,3 +378,26 @@ def contact_view(request):
 def PolicyView(request):
     return render(request, 'core/policy.html')
 
+
+@replica_reads
+def thumbnail_view(request, pk, preset):
+    if preset not in thumbnails.PRESETS:
+        raise Http404
+    image = get_object_or_404(ProductImage.objects.only('image'), pk=pk)
+    if not image.image:
+        raise Http404
+    try:
+        try:
+            fp = open(thumbnails.get_thumbnail(image.image.name, preset), 'rb')
+        except FileNotFoundError:
+            # Evicted between generation and open: generate it once more.
+            fp = open(thumbnails.get_thumbnail(image.image.name, preset), 'rb')
+    except OSError:
+        raise Http404
+    response = FileResponse(fp, content_type=thumbnails.CONTENT_TYPE)
+    if request.GET.get('v') == thumbnails.thumbnail_key(image.image.name, preset)[:12]:
+        # Versioned URL: a new image gets a new URL.
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=300'
+    return response
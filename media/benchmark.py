@@ -0,0 +1,196 @@
+"""
+Offline benchmark of the scraper, stage by stage, against a replay archive
+(a recorded crawl, or the synthetic fixture site built on the fly).
+
+    python media/benchmark.py                       # synthetic site
+    python media/benchmark.py --archive var/crawl   # recorded crawl
+    python media/benchmark.py --parsers             # parse cost per backend
+
+Stages: page fetch and parse (parse time per page), image download and
+transform (images/s), and database writes through CatalogWriter (rows/s).
+Writes happen in a transaction that is rolled back and files go to a
+temporary MEDIA_ROOT, unless --keep is given.
+
+--parsers only parses the archive's pages with every product parser in
+parsers.py, checks that they agree, and reports the cost per page.
+"""
+import argparse
+import contextlib
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.db import transaction
+from django.test.utils import override_settings
+
+import scraping
+from crawler import Crawler
+from core.catalog_import import CatalogWriter
+from core.image_pipeline import TransformPool
+from fixtures import START_PATH, SITE, build_fixture_archive
+from parsers import PRODUCT_PARSERS
+from replay import Archive, ReplayServer, replay_session
+
+
+class Rollback(Exception):
+    pass
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def describe(label, seconds):
+    ms = [s * 1000 for s in seconds]
+    return (f"{label}: {len(ms)} pages, mean {statistics.mean(ms):.2f} ms, "
+            f"median {statistics.median(ms):.2f} ms, max {max(ms):.2f} ms")
+
+
+def compare_parsers(archive, repeat):
+    """
+    Parse every HTML page of `archive` with each product parser, keeping the
+    best of `repeat` runs per page. Returns False if the parsers disagree.
+    """
+    pages = []
+    for url in sorted(archive.entries):
+        status, headers, body = archive.get(url)
+        if status == 200 and headers.get("Content-Type", "").startswith("text/html"):
+            pages.append((url, body.decode("utf-8", "replace")))
+    results, means = {}, {}
+    for name, parse in sorted(PRODUCT_PARSERS.items()):
+        seconds = []
+        for url, html in pages:
+            runs = [timed(parse, html) for _ in range(repeat)]
+            results.setdefault(url, {})[name] = runs[0][0]
+            seconds.append(min(t for _, t in runs))
+        means[name] = statistics.mean(seconds)
+        products = sum(len(by_parser[name]) for by_parser in results.values())
+        print(describe(f"Parse products ({name})", seconds) + f", {products} products")
+    mismatched = [url for url, by_parser in results.items()
+                  if any(p != by_parser["bs4"] for p in by_parser.values())]
+    for url in mismatched:
+        print(f"Parsers disagree on {url}")
+    print(f"lxml: {means['bs4'] / means['lxml']:.1f}x faster than bs4 per page")
+    return not mismatched
+
+
+def crawl_pages(crawler, start_url):
+    """Fetch every page, then parse them; returns [(main_url, url, products)] and timings."""
+    started = time.perf_counter()
+    start_html = crawler.get(start_url).text
+    main_links, t = timed(scraping.parse_links, start_html, scraping.MAIN_SELECTOR)
+    link_times, product_times = [t], []
+
+    main_pages = crawler.map(lambda url: crawler.get(url).text, main_links)
+    sub_links = []
+    for html in main_pages:
+        links, t = timed(scraping.parse_links, html, scraping.SUB_SELECTOR)
+        sub_links.append(links)
+        link_times.append(t)
+    sub_urls = [url for links in sub_links for url in links]
+    sub_pages = dict(zip(sub_urls, crawler.map(lambda url: crawler.get(url).text, sub_urls)))
+    fetch_seconds = time.perf_counter() - started - sum(link_times)
+
+    pages = []
+    for main_url, html, links in zip(main_links, main_pages, sub_links):
+        for url, page_html in [(main_url, html)] + [(u, sub_pages[u]) for u in links]:
+            products, t = timed(scraping.parse_products, page_html)
+            product_times.append(t)
+            pages.append((main_url, url, products))
+    return pages, fetch_seconds, link_times, product_times
+
+
+def run(args, server):
+    crawler = Crawler(workers=args.workers, per_host=args.workers, delay=0, session=replay_session(server),
+                      headers=scraping.headers)
+    with crawler, TransformPool(workers=args.image_workers) as transforms:
+        pages, fetch_seconds, link_times, product_times = crawl_pages(crawler, args.start_url)
+        print(f"Fetch: {crawler.stats.pages} pages in {fetch_seconds:.2f}s "
+              f"({crawler.stats.pages / fetch_seconds:.1f} pages/s)")
+        print(describe("Parse links", link_times))
+        print(describe("Parse products", product_times))
+
+        urls = [url for _, _, products in pages for p in products for url in p["images"]]
+        started = time.perf_counter()
+        futures = [crawler.submit(scraping.download_image, url, crawler, transforms) for url in urls]
+        images = {}
+        for url, future in zip(urls, futures):
+            try:
+                images[url] = future.result().result()
+            except Exception as e:
+                print(f"Error processing image {url}: {e}")
+        elapsed = time.perf_counter() - started
+        print(f"Images: {len(images)} downloaded and transformed in {elapsed:.2f}s "
+              f"({len(images) / elapsed:.1f} images/s, {crawler.stats.bytes / 1e6:.1f} MB fetched)")
+
+    writer = CatalogWriter(full=True)
+    product_seconds = image_seconds = 0.0
+    product_rows = image_rows = 0
+    file_seconds = 0.0
+    for main_url, url, products in pages:
+        category = writer.category(scraping.get_category_name(main_url))
+        sub = writer.subcategory(scraping.get_category_name(url), category) if url != main_url else None
+        rows = writer.rows
+        written, t = timed(writer.write_products, [(p, category, sub) for p in products])
+        product_seconds += t
+        product_rows += writer.rows - rows
+        groups = [(product, [(u, images[u]) for u in p["images"] if u in images])
+                  for p, (product, _) in zip(products, written)]
+        rows, files = writer.rows, writer.file_seconds
+        _, t = timed(writer.write_images, groups)
+        file_seconds += writer.file_seconds - files
+        image_seconds += t - (writer.file_seconds - files)
+        image_rows += writer.rows - rows
+    print(f"DB products: {product_rows} rows in {product_seconds:.2f}s "
+          f"({product_rows / product_seconds if product_seconds else 0:.0f} rows/s)")
+    print(f"DB images: {image_rows} rows in {image_seconds:.2f}s "
+          f"({image_rows / image_seconds if image_seconds else 0:.0f} rows/s)")
+    print(f"Image files and derivatives: {len(images)} images in {file_seconds:.2f}s "
+          f"({len(images) / file_seconds if file_seconds else 0:.1f} images/s)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scraper offline.")
+    parser.add_argument("--archive", help="replay archive to crawl (default: build the synthetic site)")
+    parser.add_argument("--start-url", default=SITE + START_PATH)
+    parser.add_argument("--categories", type=int, default=4)
+    parser.add_argument("--subcategories", type=int, default=3)
+    parser.add_argument("--products", type=int, default=8)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--image-workers", type=int, default=None)
+    parser.add_argument("--keep", action="store_true", help="commit the imported rows and keep the files")
+    parser.add_argument("--parsers", action="store_true", help="only compare the product page parsers")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per page with --parsers")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with contextlib.ExitStack() as stack:
+        archive = args.archive
+        if archive is None:
+            archive = tempfile.mkdtemp(prefix="fixture-archive-")
+            stack.callback(shutil.rmtree, archive, ignore_errors=True)
+            build_fixture_archive(archive, args.categories, args.subcategories, args.products, args.images)
+        if args.parsers:
+            return compare_parsers(Archive(archive), args.repeat)
+        if not args.keep:
+            media_root = tempfile.mkdtemp(prefix="benchmark-media-")
+            stack.callback(shutil.rmtree, media_root, ignore_errors=True)
+            stack.enter_context(override_settings(MEDIA_ROOT=media_root))
+        server = stack.enter_context(ReplayServer(archive))
+        try:
+            with transaction.atomic():
+                run(args, server)
+                if not args.keep:
+                    raise Rollback
+        except Rollback:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Bulk export and load of the catalog tables with PostgreSQL COPY.
+
+`export` streams categories, subcategories, products, their images and
+their facet attributes to one file per table in DIR, as JSON lines or
+CSV; `load` streams such a directory back in one transaction, so a full
+catalog of 100k products is re-seeded in seconds instead of going
+through the ORM row by row. Every column is copied, including derived
+ones (search vectors, image variants and fingerprints), so a load needs
+no post-processing. The catalog version is bumped in the same
+transaction so conditional GETs see the change, and after the commit
+the navigation tree and the cached pages are invalidated through
+Django's cache, as the admin and the importer do. Foreign keys are
+checked at commit, which lets the main image columns point at images
+loaded after them.
+
+    python media/catalog_copy.py export var/catalog --format csv
+    python media/catalog_copy.py load var/catalog --replace
+
+--replace empties the catalog first with TRUNCATE ... CASCADE, which
+also empties the tables pointing into it (upload jobs and the categories
+of contact submissions).
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import time
+
+from models import get_engine
+
+# In foreign key order.
+TABLES = ("core_category", "core_subcategory", "core_product", "core_productimage", "core_productattribute")
+FORMATS = ("jsonl", "csv")
+
+_TEXT_ESCAPE = re.compile(r"\\(.)")
+_TEXT_ESCAPES = {"n": "\n", "r": "\r", "t": "\t"}
+
+
+def _unescape_text(line):
+    """Undo COPY text-format escaping of a single column."""
+    return _TEXT_ESCAPE.sub(lambda m: _TEXT_ESCAPES.get(m.group(1), m.group(1)), line)
+
+
+def _csv_field(value):
+    # Unquoted empty is NULL in COPY's CSV format; anything else is quoted
+    # so that empty strings stay empty strings.
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    elif isinstance(value, bool):
+        value = "t" if value else "f"
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def jsonl_to_csv(lines, columns):
+    """Turn JSON lines into COPY CSV rows with `columns` in that order."""
+    for line in lines:
+        if line.strip():
+            row = json.loads(line)
+            yield ",".join(_csv_field(row.get(column)) for column in columns) + "\n"
+
+
+class LineReader(io.RawIOBase):
+    """Read-only file over an iterator of str chunks, as copy_expert() expects."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = chunk.encode()
+        n = min(len(b), len(self._buffer))
+        b[:n], self._buffer = self._buffer[:n], self._buffer[n:]
+        return n
+
+
+class JsonlWriter:
+    """Write end of COPY ... TO STDOUT for one row_to_json column per line."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.pending = ""
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+        *lines, self.pending = (self.pending + data).split("\n")
+        for line in lines:
+            self.fp.write(_unescape_text(line) + "\n")
+
+
+def _path(directory, table, fmt):
+    return os.path.join(directory, f"{table}.{fmt}")
+
+
+def _raw_connection(engine):
+    if engine.dialect.name != "postgresql":
+        raise SystemExit(f"COPY needs PostgreSQL, not {engine.dialect.name}.")
+    return engine.raw_connection()
+
+
+def export(directory, fmt="jsonl", engine=None):
+    """Write every catalog table to DIR/<table>.<fmt>; returns {table: rows}."""
+    conn = _raw_connection(engine or get_engine())
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    try:
+        with conn.cursor() as cursor:
+            # One snapshot for all tables, so the files agree with each other.
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            for table in TABLES:
+                with open(_path(directory, table, fmt), "w", encoding="utf-8", newline="") as fp:
+                    if fmt == "csv":
+                        cursor.copy_expert(f"COPY (SELECT * FROM {table} ORDER BY id) TO STDOUT "
+                                           "WITH (FORMAT csv, HEADER true)", fp)
+                    else:
+                        cursor.copy_expert(f"COPY (SELECT row_to_json(t) FROM {table} t ORDER BY id) TO STDOUT",
+                                           JsonlWriter(fp))
+                counts[table] = cursor.rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+def _copy_in(cursor, table, path):
+    with open(path, encoding="utf-8", newline="") as fp:
+        if path.endswith(".csv"):
+            header = next(csv.reader(fp))
+            fp.seek(0)
+            source = fp
+            options = "FORMAT csv, HEADER true"
+        else:
+            first = fp.readline()
+            if not first.strip():
+                return 0
+            header = list(json.loads(first))
+            fp.seek(0)
+            source = LineReader(jsonl_to_csv(fp, header))
+            options = "FORMAT csv"
+        columns = ", ".join(f'"{column}"' for column in header)
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH ({options})", source)
+        return cursor.rowcount
+
+
+def invalidate_caches():
+    """Drop the cached navigation tree and pages after a load."""
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "castersinox.settings")
+    django.setup()
+    from core import page_cache
+    from core.navigation import invalidate_navigation_tree
+
+    invalidate_navigation_tree()
+    page_cache.invalidate_all()
+
+
+def load(directory, replace=False, engine=None):
+    """Load DIR/<table>.jsonl or .csv into every catalog table found; returns {table: rows}."""
+    files = {}
+    for table in TABLES:
+        found = [p for p in (_path(directory, table, fmt) for fmt in FORMATS) if os.path.exists(p)]
+        if found:
+            files[table] = found[0]
+    if not files:
+        raise SystemExit(f"No catalog files in {directory}.")
+
+    counts = {}
+    conn = _raw_connection(engine or get_engine())
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+            if replace:
+                cursor.execute(f"TRUNCATE {', '.join(TABLES)} CASCADE")
+            for table, path in files.items():
+                counts[table] = _copy_in(cursor, table, path)
+                # Rows keep their ids; move the identity past them.
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 1), max(id) IS NOT NULL) "
+                    f"FROM {table}"
+                )
+            cursor.execute("UPDATE core_catalogversion SET version = version + 1, updated_at = now()")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    invalidate_caches()
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export or load the catalog tables with PostgreSQL COPY.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="write one file per catalog table")
+    export_cmd.add_argument("directory")
+    export_cmd.add_argument("--format", choices=FORMATS, default="jsonl")
+    load_cmd = commands.add_parser("load", help="load the files written by export")
+    load_cmd.add_argument("directory")
+    load_cmd.add_argument("--replace", action="store_true",
+                          help="empty the catalog (and the tables referencing it) first")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    started = time.perf_counter()
+    if args.command == "export":
+        counts = export(args.directory, args.format)
+    else:
+        counts = load(args.directory, args.replace)
+    for table, rows in counts.items():
+        print(f"{table}: {rows} rows")
+    print(f"{args.command} finished in {time.perf_counter() - started:.1f}s")
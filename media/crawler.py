@@ -0,0 +1,240 @@
+"""
+Thread-pool crawl engine used by scraping.py.
+
+Requests go through one shared requests.Session. Each host gets at most
+`per_host` requests in flight, and request starts to the same host are
+spaced by at least `delay` seconds. Connection errors, timeouts, 429 and
+5xx responses are retried with exponential backoff (honouring
+Retry-After). Work that should overlap with the caller, such as image
+downloads, is handed to the same pool through submit().
+
+With an HttpCache, GETs carry If-None-Match/If-Modified-Since from the
+previous run and a 304 is answered from the stored body. A recorder (see
+replay.py) is called with every successful response.
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostPolicy:
+    """Concurrency limit and politeness delay for a single host."""
+
+    def __init__(self, concurrency, delay):
+        self.delay = delay
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    @contextmanager
+    def slot(self):
+        with self._slots:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_start)
+                self._next_start = start + self.delay
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+class HttpCache:
+    """ETag/Last-Modified validators (and optionally bodies) in a SQLite file."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS http_cache ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, body BLOB)"
+        )
+
+    def lookup(self, url):
+        """(etag, last_modified, body) or None."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT etag, last_modified, body FROM http_cache WHERE url = ?", (url,)
+            ).fetchone()
+
+    def store(self, url, resp, keep_body=True):
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO http_cache (url, etag, last_modified, body) VALUES (?, ?, ?, ?)",
+                (url, etag, last_modified, resp.content if keep_body else None),
+            )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CrawlStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.pages = 0
+        self.images = 0
+        self.bytes = 0
+        self.retries = 0
+        self.errors = 0
+        self.not_modified = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"Crawled {self.pages} pages ({self.pages / elapsed:.2f} pages/s) and "
+            f"{self.images} images ({self.images / elapsed:.2f} images/s) in {elapsed:.1f}s; "
+            f"{self.bytes / 1e6:.1f} MB, {self.not_modified} not modified, "
+            f"{self.retries} retries, {self.errors} errors"
+        )
+
+
+def _retry_after(resp):
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Crawler:
+
+    def __init__(self, workers=8, per_host=2, delay=1.0, retries=3, backoff=0.5,
+                 timeout=30, headers=None, session=None, cache=None, recorder=None):
+        self.workers = workers
+        self.per_host = per_host
+        self.delay = delay
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = headers or {}
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.cache = cache
+        self.recorder = recorder
+        self.stats = CrawlStats()
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        if self.cache is not None:
+            self.cache.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def host_policy(self, url):
+        host = urlparse(url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = HostPolicy(self.per_host, self.delay)
+            return self._hosts[host]
+
+    def get(self, url, kind="pages", conditional=True, keep_body=True, **kwargs):
+        """
+        GET `url` under the host's limits, retrying transient failures.
+        `kind` is the stats counter to increment ("pages" or "images").
+        Raises requests.HTTPError for a final non-2xx response.
+
+        The response has a `not_modified` attribute. It is True when the
+        cache validated the previous copy, in which case the cached body
+        (if `keep_body` was set when it was stored) is in resp.content.
+        """
+        policy = self.host_policy(url)
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        cached = self.cache.lookup(url) if self.cache is not None and conditional else None
+        if cached:
+            etag, last_modified, _body = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        for attempt in range(self.retries + 1):
+            wait = self.backoff * 2 ** attempt * (1 + random.random() / 2)
+            try:
+                with policy.slot():
+                    resp = self.session.get(url, headers=headers, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    self.stats.add(errors=1)
+                    raise
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    if not resp.ok:
+                        self.stats.add(errors=1)
+                    resp.raise_for_status()
+                    return self._finish(url, resp, kind, cached, keep_body)
+                wait = _retry_after(resp) or wait
+                resp.close()
+            self.stats.add(retries=1)
+            time.sleep(wait)
+
+    def _finish(self, url, resp, kind, cached, keep_body):
+        resp.not_modified = resp.status_code == 304 and cached is not None
+        if resp.not_modified:
+            resp._content = cached[2] or b""
+            self.stats.add(**{kind: 1, "not_modified": 1})
+            if self.recorder is not None and cached[2] is not None:
+                self.recorder(url, resp)
+            return resp
+        self.stats.add(**{kind: 1, "bytes": len(resp.content)})
+        if self.cache is not None:
+            self.cache.store(url, resp, keep_body)
+        if self.recorder is not None:
+            self.recorder(url, resp)
+        return resp
+
+    def submit(self, fn, *args, **kwargs):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawl")
+        return self._pool.submit(fn, *args, **kwargs)
+
+    def map(self, fn, iterable):
+        """
+        Like Executor.map: results in input order, computed concurrently.
+        Call it from the main thread only; a pool thread waiting on the pool
+        can deadlock it.
+        """
+        futures = [self.submit(fn, item) for item in iterable]
+        return [f.result() for f in futures]
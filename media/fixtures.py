@@ -0,0 +1,190 @@
+"""
+Synthetic Elementor-style copy of the catalog, written as a replay archive.
+
+The pages use the markup scraping.py looks for (start page containers,
+call-to-action subcategory links, product sections with heading, text,
+toggle features, image widget and carousel) wrapped in the kind of
+header, menu, script and footer noise real Elementor pages carry. The
+output is deterministic for a given seed.
+
+    python media/fixtures.py var/fixture-archive --categories 6 --products 20
+"""
+import argparse
+import hashlib
+import io
+import random
+import sys
+from html import escape
+
+from PIL import Image, ImageDraw
+
+from replay import Archive
+
+SITE = "https://casters.ro"
+START_PATH = "/produse/utilaje-carmangerie/"
+
+WORDS = ["masa", "inox", "cuter", "malaxor", "feliator", "tocator", "cuptor", "raft", "carucior",
+         "chiuveta", "dulap", "vitrina", "frigorifica", "profesional", "industrial", "compact"]
+FEATURES = {
+    "Lungime": ["600 mm", "800 mm", "1000 mm", "1200 mm", "1400 mm"],
+    "Lățime": ["600 mm", "700 mm"],
+    "Material": ["AISI 304", "AISI 430"],
+    "Putere": ["0.75 kW", "1.1 kW", "2.2 kW"],
+    "Tensiune": ["230 V", "400 V"],
+}
+
+HEAD = """<!DOCTYPE html><html lang="ro-RO"><head><meta charset="UTF-8">
+<title>{title} &#8211; Casters</title>
+<link rel='stylesheet' href='{site}/wp-content/plugins/elementor/assets/css/frontend.min.css' media='all' />
+<style id='elementor-frontend-inline-css'>{css}</style>
+<script>var elementorFrontendConfig = {config};</script>
+</head><body class="page-template elementor-default elementor-kit-5 elementor-page">
+<header class="elementor elementor-location-header"><nav class="elementor-nav-menu--main">
+<ul class="elementor-nav-menu">{menu}</ul></nav></header>
+<div data-elementor-type="wp-page" class="elementor elementor-{page_id}">
+"""
+FOOT = """</div><footer class="elementor elementor-location-footer">
+<div class="elementor-widget-container"><p>&copy; Casters SRL</p></div></footer>
+<script src='{site}/wp-includes/js/jquery/jquery.min.js'></script>
+<script>/* {padding} */</script></body></html>
+"""
+
+
+def slug(words):
+    return "-".join(words)
+
+
+def title(words):
+    return " ".join(words).title()
+
+
+def image_bytes(rnd, width=900, height=700):
+    img = Image.new("RGB", (width, height), tuple(rnd.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rnd.randrange(width), rnd.randrange(height)
+        draw.rectangle([x0, y0, x0 + rnd.randrange(40, 300), y0 + rnd.randrange(40, 300)],
+                       fill=tuple(rnd.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+def page(rnd, name, body, menu):
+    return (
+        HEAD.format(
+            title=escape(name), site=SITE, page_id=rnd.randrange(1000, 9999),
+            css="".join(f".elementor-element-{rnd.randrange(16**7):07x}{{margin:{rnd.randrange(40)}px}}"
+                        for _ in range(150)),
+            config='{"environmentMode":{"edit":false},"version":"3.21.0"}',
+            menu=menu,
+        )
+        + body
+        + FOOT.format(site=SITE, padding="x" * rnd.randrange(2000, 6000))
+    )
+
+
+def product_section(rnd, name, image_urls):
+    features = "".join(
+        f"<li>{escape(key)}: {escape(rnd.choice(values))}</li>"
+        for key, values in rnd.sample(sorted(FEATURES.items()), rnd.randrange(2, len(FEATURES) + 1))
+    )
+    main, *slides = image_urls
+    carousel = "".join(
+        f'<div class="swiper-slide"><div class="elementor-carousel-image" role="img" '
+        f'style="background-image: url(&quot;{url}&quot;)"></div></div>'
+        for url in slides
+    )
+    element = f"{rnd.randrange(16**7):07x}"
+    return f"""
+<section class="elementor-section elementor-top-section elementor-element elementor-element-{element}">
+ <div class="elementor-container elementor-column-gap-default"><div class="elementor-column elementor-col-50">
+  <div class="elementor-widget-wrap elementor-element-populated">
+   <div class="elementor-element elementor-widget elementor-widget-image"><div class="elementor-widget-container">
+    <img width="580" height="760" src="{main}" class="attachment-large size-large" alt="" loading="lazy" /></div></div>
+   <div class="elementor-element elementor-widget elementor-widget-image-carousel"><div class="elementor-widget-container">
+    <div class="elementor-image-carousel-wrapper swiper"><div class="elementor-image-carousel swiper-wrapper">{carousel}</div></div></div></div>
+  </div></div>
+  <div class="elementor-column elementor-col-50"><div class="elementor-widget-wrap elementor-element-populated">
+   <div class="elementor-element elementor-widget elementor-widget-heading"><div class="elementor-widget-container">
+    <h4 class="elementor-heading-title elementor-size-default">{escape(name)}</h4></div></div>
+   <div class="elementor-element elementor-widget elementor-widget-text-editor"><div class="elementor-widget-container">
+    <p>{escape(name)} din inox, pentru uz profesional. {" ".join(rnd.choices(WORDS, k=30))}.</p></div></div>
+   <div class="elementor-element elementor-widget elementor-widget-toggle"><div class="elementor-widget-container">
+    <div class="elementor-toggle"><div class="elementor-toggle-item">
+     <div class="elementor-tab-title"><a class="elementor-toggle-title">Specificații</a></div>
+     <div class="elementor-tab-content elementor-clearfix"><ul>{features}</ul></div></div></div></div></div>
+  </div></div></div>
+</section>"""
+
+
+def build_fixture_archive(path, categories=4, subcategories=3, products=8, images=3, seed=0):
+    """
+    Write the synthetic site to an archive at `path`. Each category page and
+    subcategory page lists `products` products with `images` images each.
+    Returns the Archive.
+    """
+    rnd = random.Random(seed)
+    archive = Archive(path)
+    html_headers = {"Content-Type": "text/html; charset=UTF-8"}
+
+    def add_html(url, text):
+        body = text.encode()
+        archive.add(url, 200, {**html_headers, "ETag": f'"{hashlib.md5(body).hexdigest()}"'}, body)
+
+    def add_products(page_slug):
+        sections = []
+        for p in range(products):
+            name = title(rnd.sample(WORDS, 3)) + f" {page_slug[:3].upper()}{p}"
+            urls = [f"{SITE}/wp-content/uploads/2024/{rnd.randrange(1, 13):02d}/{slug(name.lower().split())}-{i}.jpg"
+                    for i in range(images)]
+            for url in urls:
+                body = image_bytes(rnd)
+                archive.add(url, 200, {"Content-Type": "image/jpeg", "ETag": f'"{hashlib.md5(body).hexdigest()}"'}, body)
+            sections.append(product_section(rnd, name, urls))
+        return "".join(sections)
+
+    cat_slugs = [slug(rnd.sample(WORDS, 2)) + f"-{c}" for c in range(categories)]
+    menu = "".join(f'<li class="menu-item"><a href="{SITE}/produse/{s}/">{title(s.split("-"))}</a></li>'
+                   for s in cat_slugs)
+
+    start_body = '<div class="e-con-inner">' + "".join(
+        f'<div class="elementor-element elementor-element-{rnd.randrange(16**7):07x} e-con-full e-flex e-con e-child">'
+        f'<div class="elementor-widget-container"><a href="{SITE}/produse/{s}/">'
+        f'<h3>{title(s.split("-"))}</h3></a></div></div>'
+        for s in cat_slugs
+    ) + "</div>"
+    add_html(SITE + START_PATH, page(rnd, "Utilaje carmangerie", start_body, menu))
+
+    for cat_slug in cat_slugs:
+        sub_slugs = [f"{cat_slug}-{slug(rnd.sample(WORDS, 1))}-{s}" for s in range(subcategories)]
+        ctas = "".join(
+            f'<div class="elementor-element elementor-widget elementor-widget-call-to-action">'
+            f'<div class="elementor-widget-container"><a class="elementor-cta" href="{SITE}/produse/{s}/">'
+            f'<div class="elementor-cta__content"><h2>{title(s.split("-"))}</h2></div></a></div></div>'
+            for s in sub_slugs
+        )
+        add_html(f"{SITE}/produse/{cat_slug}/", page(rnd, title(cat_slug.split("-")), ctas + add_products(cat_slug), menu))
+        for sub_slug in sub_slugs:
+            add_html(f"{SITE}/produse/{sub_slug}/", page(rnd, title(sub_slug.split("-")), add_products(sub_slug), menu))
+
+    archive.save()
+    return archive
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Write the synthetic fixture site as a replay archive.")
+    parser.add_argument("path")
+    parser.add_argument("--categories", type=int, default=4)
+    parser.add_argument("--subcategories", type=int, default=3)
+    parser.add_argument("--products", type=int, default=8, help="products per category/subcategory page")
+    parser.add_argument("--images", type=int, default=3, help="images per product")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    archive = build_fixture_archive(args.path, args.categories, args.subcategories,
+                                    args.products, args.images, args.seed)
+    print(f"Wrote {len(archive.entries)} responses to {args.path}", file=sys.stderr)
@@ -0,0 +1,121 @@
+"""
+Crawl frontier and checkpoints for scraping.py, in a SQLite file.
+
+The frontier holds the category pages found on the start page and the
+subcategory pages found on each category page, in crawl order. A page is
+checkpointed once its products are written, together with the images
+those products still need; each image leaves the queue once it is
+attached. A crawl that dies halfway is resumed by the next run with the
+same scope: finished pages are skipped, listings are not fetched again,
+and queued images are downloaded first. Images that failed stay queued
+for the next run even after the crawl finishes.
+"""
+import os
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS crawl (
+    id INTEGER PRIMARY KEY CHECK (id = 1), scope TEXT NOT NULL,
+    started REAL NOT NULL, finished REAL);
+CREATE TABLE IF NOT EXISTS crawl_page (
+    url TEXT PRIMARY KEY, category_url TEXT NOT NULL,
+    category_pos INTEGER NOT NULL, sub_pos INTEGER NOT NULL,
+    expanded INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS image_queue (
+    product TEXT NOT NULL, url TEXT NOT NULL, pos INTEGER NOT NULL,
+    PRIMARY KEY (product, url));
+"""
+
+
+class Frontier:
+
+    def __init__(self, path):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def begin(self, scope="", restart=False):
+        """
+        Resume the unfinished crawl of `scope` and return True, or start a
+        new one (dropping any other unfinished crawl) and return False.
+        """
+        row = self._db.execute("SELECT scope, finished FROM crawl").fetchone()
+        if row and row[0] == scope and row[1] is None and not restart:
+            return True
+        with self._db:
+            self._db.execute("DELETE FROM crawl_page")
+            self._db.execute("INSERT OR REPLACE INTO crawl (id, scope, started, finished) VALUES (1, ?, ?, NULL)",
+                             (scope, time.time()))
+        return False
+
+    def finish(self):
+        with self._db:
+            self._db.execute("UPDATE crawl SET finished = ?", (time.time(),))
+
+    def categories(self):
+        """[(url, expanded)] in crawl order."""
+        return self._db.execute(
+            "SELECT url, expanded FROM crawl_page WHERE sub_pos = 0 ORDER BY category_pos").fetchall()
+
+    def add_categories(self, urls):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO crawl_page (url, category_url, category_pos, sub_pos) VALUES (?, ?, ?, 0)",
+                [(url, url, pos) for pos, url in enumerate(urls)])
+
+    def expand(self, category_url, sub_urls):
+        """Add the subcategory pages found on a category page."""
+        with self._db:
+            (pos,) = self._db.execute(
+                "SELECT category_pos FROM crawl_page WHERE url = ?", (category_url,)).fetchone()
+            self._db.executemany(
+                "INSERT OR IGNORE INTO crawl_page (url, category_url, category_pos, sub_pos) VALUES (?, ?, ?, ?)",
+                [(url, category_url, pos, i) for i, url in enumerate(sub_urls, 1)])
+            self._db.execute("UPDATE crawl_page SET expanded = 1 WHERE url = ?", (category_url,))
+
+    def pages(self):
+        """[(category_url, url)] not done yet, in crawl order."""
+        return self._db.execute(
+            "SELECT category_url, url FROM crawl_page WHERE NOT done ORDER BY category_pos, sub_pos").fetchall()
+
+    def done_count(self):
+        return self._db.execute("SELECT COUNT(*) FROM crawl_page WHERE done").fetchone()[0]
+
+    def page_done(self, url, images):
+        """Checkpoint page `url` and queue `images`, [(product name, [image urls])]."""
+        with self._db:
+            self._queue(images)
+            self._db.execute("UPDATE crawl_page SET done = 1 WHERE url = ?", (url,))
+
+    def _queue(self, images):
+        (pos,) = self._db.execute("SELECT COALESCE(MAX(pos), 0) FROM image_queue").fetchone()
+        rows = []
+        for product, urls in images:
+            for url in urls:
+                pos += 1
+                rows.append((product, url, pos))
+        self._db.executemany("INSERT OR IGNORE INTO image_queue (product, url, pos) VALUES (?, ?, ?)", rows)
+
+    def queued_images(self):
+        """[(product name, [image urls])] in queue order."""
+        queued = {}
+        for product, url in self._db.execute("SELECT product, url FROM image_queue ORDER BY pos"):
+            queued.setdefault(product, []).append(url)
+        return list(queued.items())
+
+    def images_done(self, images):
+        """Drop `images`, [(product name, [image urls])], from the queue."""
+        with self._db:
+            self._db.executemany("DELETE FROM image_queue WHERE product = ? AND url = ?",
+                                 [(product, url) for product, urls in images for url in urls])
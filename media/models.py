@@ -1,11 +1,25 @@
+"""
+SQLAlchemy layer over the catalog database.
+
+Nothing touches the database at import time: the engine is created on
+first use by get_engine() (or the module attributes `engine` and
+`SessionLocal`), from the same DB_* environment variables as
+castersinox/settings.py, read from .env the same way, and the tables
+below are only created by an explicit create_tables().
+"""
+import os
 from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.engine import URL
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from sqlalchemy.types import TypeDecorator, TEXT
 import json
 from datetime import datetime
 import re
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 # Define the base for declarative models
 Base = declarative_base()
 
@@ -109,14 +123,80 @@ class ProductImage(Base):
     def __repr__(self):
         return f"<ProductImage(id={self.id}, path='{self.image_path}')>"
 
-DB_USER = "postgres"  # e.g., postgres
-DB_PASSWORD = "asd2asd2A"
-DB_HOST = "localhost"
-DB_PORT = "5432"
-DB_NAME = "castersinox" # The database you created
-
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base.metadata.create_all(bind=engine)
\ No newline at end of file
+DRIVERS = {
+    "django.db.backends.postgresql": "postgresql+psycopg2",
+    "django.db.backends.sqlite3": "sqlite",
+}
+
+_engine = None
+_session_factory = None
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def database_url():
+    """The DATABASES['default'] connection of castersinox/settings.py, as a SQLAlchemy URL."""
+    engine = os.getenv("DB_ENGINE", "django.db.backends.postgresql")
+    if engine not in DRIVERS:
+        raise ValueError(f"Unsupported DB_ENGINE for SQLAlchemy: {engine}")
+    port = os.getenv("DB_PORT")
+    return URL.create(
+        DRIVERS[engine],
+        username=os.getenv("DB_USER") or None,
+        password=os.getenv("DB_PASSWORD") or None,
+        host=os.getenv("DB_HOST") or None,
+        port=int(port) if port else None,
+        database=os.getenv("DB_NAME") or None,
+    )
+
+
+def engine_options(url):
+    """
+    Pool configuration. Connections are checked before use like Django's
+    CONN_HEALTH_CHECKS and recycled after DB_CONN_MAX_AGE seconds; the
+    pool holds DB_POOL_SIZE connections plus DB_POOL_MAX_OVERFLOW extra
+    ones under load.
+    """
+    options = {"pool_pre_ping": _env_flag("DB_CONN_HEALTH_CHECKS", "true")}
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+            max_overflow=int(os.getenv("DB_POOL_MAX_OVERFLOW", 5)),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 30)),
+            pool_recycle=int(os.getenv("DB_CONN_MAX_AGE", 60)) or -1,
+        )
+    return options
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        url = database_url()
+        _engine = create_engine(url, **engine_options(url))
+    return _engine
+
+
+def session_factory():
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    return _session_factory
+
+
+def get_session():
+    return session_factory()()
+
+
+def create_tables(engine=None):
+    Base.metadata.create_all(bind=engine or get_engine())
+
+
+def __getattr__(name):
+    # `engine` and `SessionLocal` used to be created at import time.
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
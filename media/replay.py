@@ -0,0 +1,197 @@
+"""
+Record a crawl to a local archive and serve it back offline.
+
+An archive is a directory with an ``index.json`` mapping each URL to its
+status, a few response headers and a body file under ``bodies/``.
+ArchiveRecorder plugs into Crawler(recorder=...) and writes one entry per
+fetched URL. ReplayServer serves an archive over HTTP on localhost, and
+replay_session() returns a requests.Session whose requests for any host
+are answered by that server, so the scraper runs unchanged against it:
+
+    with ReplayServer("var/crawl-archive") as server:
+        crawler = Crawler(session=replay_session(server), delay=0)
+
+Like the live site, the server answers 304 when the If-None-Match or
+If-Modified-Since validators match the recorded ETag or Last-Modified.
+"""
+import hashlib
+import json
+import os
+import threading
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+INDEX = "index.json"
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def normalize(url):
+    """The URL as requests sends it, so lookups match however it was written."""
+    prepared = requests.PreparedRequest()
+    prepared.prepare_url(url, None)
+    return prepared.url
+
+
+def body_name(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+
+class Archive:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(os.path.join(path, INDEX), encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def add(self, url, status, headers, body):
+        url = normalize(url)
+        name = body_name(url)
+        os.makedirs(os.path.join(self.path, "bodies"), exist_ok=True)
+        with open(os.path.join(self.path, "bodies", name), "wb") as f:
+            f.write(body)
+        entry = {"status": status, "body": name,
+                 "headers": {k: headers[k] for k in KEPT_HEADERS if headers.get(k)}}
+        with self._lock:
+            self.entries[url] = entry
+
+    def get(self, url):
+        """(status, headers, body) or None."""
+        entry = self.entries.get(normalize(url))
+        if entry is None:
+            return None
+        with open(os.path.join(self.path, "bodies", entry["body"]), "rb") as f:
+            return entry["status"], entry["headers"], f.read()
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+        tmp = os.path.join(self.path, INDEX + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.path, INDEX))
+
+
+class ArchiveRecorder:
+    """Crawler recorder writing every fetched response to an Archive."""
+
+    def __init__(self, path):
+        self.archive = Archive(path)
+
+    def __call__(self, url, resp):
+        self.archive.add(url, 200, resp.headers, resp.content)
+
+    def close(self):
+        self.archive.save()
+
+
+def _not_modified(stored, request):
+    """Whether the request's validators match the `stored` headers; If-None-Match takes precedence."""
+    if "If-None-Match" in request:
+        etag = stored.get("ETag")
+        return bool(etag) and etag in [tag.strip() for tag in request["If-None-Match"].split(",")]
+    since, last_modified = request.get("If-Modified-Since"), stored.get("Last-Modified")
+    if not since or not last_modified:
+        return False
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(since)
+    except (TypeError, ValueError):
+        return False
+
+
+def _handler(archive):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            # Paths are /<scheme>/<host>/<original path>, see ReplayAdapter.
+            scheme, _, rest = self.path.lstrip("/").partition("/")
+            found = archive.get(f"{scheme}://{unquote(rest)}")
+            if found is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status, headers, body = found
+            if _not_modified(headers, self.headers):
+                self.send_response(304)
+                for name in ("ETag", "Last-Modified"):
+                    if name in headers:
+                        self.send_header(name, headers[name])
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+class ReplayServer:
+    """Serves an archive on localhost from a background thread."""
+
+    def __init__(self, path, port=0):
+        self.archive = path if isinstance(path, Archive) else Archive(path)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self.archive))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Sends every request to a ReplayServer instead of the original host."""
+
+    def __init__(self, base_url, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        original = request.url
+        parts = urlsplit(original)
+        path = quote(parts.netloc + parts.path + (f"?{parts.query}" if parts.query else ""), safe="")
+        request.url = f"{self.base_url}/{parts.scheme}/{path}"
+        resp = super().send(request, **kwargs)
+        resp.url = original
+        return resp
+
+
+def replay_session(server):
+    session = requests.Session()
+    adapter = ReplayAdapter(server.base_url)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
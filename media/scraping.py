@@ -1,139 +1,250 @@
 
+import argparse
+import contextlib
 import os
 import django
-import requests
 from bs4 import BeautifulSoup
-from time import sleep
-import re
 from urllib.parse import urlparse
-from PIL import Image
-import random
-import string
-from django.core.files import File
+from django.conf import settings
 
 # 1. Setup Django environment
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "castersinox.settings")
 django.setup()
 
 # 2. Import Django models
-from core.models import Category, SubCategory, Product, ProductImage
+from core.catalog_import import CatalogWriter
+from core.image_pipeline import TransformPool
+from core.models import Product
+
+from crawler import Crawler, HttpCache
+from frontier import Frontier
+from parsers import PRODUCT_PARSERS
+from replay import ArchiveRecorder, ReplayServer, replay_session
 
 headers = {"User-Agent": "Mozilla/5.0"}
-session_requests = requests.Session()
-URL_IN_STYLE = re.compile(r"url\(['\"]?(.*?)['\"]?\)")
-
-def fetch_links(page_url, selector, pause=1):
-    resp = session_requests.get(page_url, headers=headers)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "lxml")
-    sleep(pause)
+
+START_URL = "https://casters.ro/produse/utilaje-carmangerie/"
+MAIN_SELECTOR = 'div[class*="elementor-element-"].e-con-full.e-flex.e-con.e-child'
+SUB_SELECTOR = "div.elementor-widget-call-to-action"
+
+parse_products = PRODUCT_PARSERS["lxml"]
+
+def parse_links(html, selector):
+    soup = BeautifulSoup(html, "lxml")
     return [a["href"] for el in soup.select(selector) if (a := el.find("a", href=True))]
 
-def fetch_products(page_url, pause=1):
-    resp = session_requests.get(page_url, headers=headers)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "lxml")
-    sleep(pause)
-    products = []
-    for sec in soup.select("section.elementor-section"):
-        title_el = sec.select_one("h4.elementor-heading-title")
-        if not title_el:
-            continue
-        desc = sec.select_one("div.elementor-widget-text-editor p")
-        features = [li.get_text(strip=True)
-                    for li in sec.select("div.elementor-widget-toggle .elementor-tab-content ul li")]
-        imgs = []
-        if (img := sec.select_one("div.elementor-widget-image img")) and img.get("src"):
-            imgs.append(img["src"])
-        for slide in sec.select("div.elementor-carousel-image"):
-            if m := URL_IN_STYLE.search(slide.get("style", "")):
-                imgs.append(m.group(1))
-        products.append({
-            "title": title_el.get_text(strip=True),
-            "description": desc.get_text(strip=True) if desc else "",
-            "features": features,
-            "images": imgs
-        })
-    return products
+def fetch_links(page_url, selector, crawler):
+    return parse_links(crawler.get(page_url).text, selector)
+
+def fetch_products(page_url, crawler, parse=parse_products):
+    return parse(crawler.get(page_url).text)
 
 def get_category_name(url: str) -> str:
     segment = urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
     return segment.replace("-", " ").title()
 
-def generate_random_digits(length=8):
-    return ''.join(random.choices(string.digits, k=length))
-
-def process_and_save_image(image_url: str, product_id: int, image_index: int) -> str:
-    products_dir = "products"
-    extra_dir = os.path.join(products_dir, "extra")
-    product_folder = os.path.join(extra_dir, str(product_id))
-    os.makedirs(product_folder, exist_ok=True)
-    try:
-        resp = requests.get(image_url, stream=True)
-        resp.raise_for_status()
-        img = Image.open(resp.raw)
-        img = img.convert("RGBA")
-        w, h = img.size
-        target_w, target_h = 580, 760
-        if h > w:
-            new_h = target_h
-            new_w = int(w * (new_h / h))
-        else:
-            new_w = target_w
-            new_h = int(h * (new_w / w))
-        img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        canvas = Image.new("RGBA", (target_w, target_h), (0, 0, 0, 0))
-        canvas.paste(img, ((target_w - new_w)//2, (target_h - new_h)//2))
-        filename = f"{generate_random_digits()}-{image_index}.png"
-        path = os.path.join(product_folder, filename)
-        canvas.save(path, "PNG")
-        return path
-    except Exception as e:
-        print(f"Error processing image {image_url}: {e}")
-        return None
-
-def main():
-    main_links = fetch_links(
-        "https://casters.ro/produse/utilaje-carmangerie/",
-        'div[class*="elementor-element-"].e-con-full.e-flex.e-con.e-child'
-    )
-    for main_url in main_links:
-        cat_name = get_category_name(main_url)
-        category, _ = Category.objects.get_or_create(name=cat_name)
-
-        sub_links = fetch_links(main_url, "div.elementor-widget-call-to-action")
-        urls_to_scrape = [main_url] + sub_links
-
-        for url in urls_to_scrape:
+def download_image(image_url: str, crawler: Crawler, transforms: TransformPool):
+    """
+    Runs on a crawler thread: download the image and queue it for the
+    transform pool (blocking while the pool is backed up). Returns the
+    pool's future.
+    """
+    resp = crawler.get(image_url, kind="images", conditional=False, keep_body=False)
+    return transforms.submit(resp.content)
+
+def collect_images(pending):
+    """
+    Pop the products at the head of `pending` whose images are all done and
+    return them as write_images() groups; failed images are reported and
+    left out.
+    """
+    groups = []
+    while pending and all(image_ready(f) for _, f in pending[0][1]):
+        product, downloads = pending.pop(0)
+        images = []
+        for url, future in downloads:
+            try:
+                images.append((url, future.result().result()))
+            except Exception as e:
+                print(f"Error processing image {url}: {e}")
+        groups.append((product, images))
+    return groups
+
+def image_ready(download):
+    return download.done() and (download.exception() is not None or download.result().done())
+
+def print_diff(diff):
+    print(f"Products: {len(diff['created'])} created, {len(diff['updated'])} updated, "
+          f"{diff['unchanged']} unchanged")
+    print(f"Images: {diff['images_added']} added, {diff['images_removed']} removed, "
+          f"{diff['images_similar']} flagged as near-duplicates")
+    for name in diff["created"]:
+        print(f"  + {name}")
+    for name, fields in diff["updated"]:
+        print(f"  ~ {name}: {', '.join(fields) or 'images'}")
+
+def select_categories(links, selectors):
+    """The category links matching any of `selectors`, by slug or by name."""
+    wanted = {s.strip().lower() for s in selectors}
+    chosen = [url for url in links
+              if {get_category_name(url).lower(), urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]} & wanted]
+    if not chosen:
+        names = ", ".join(get_category_name(url) for url in links)
+        raise SystemExit(f"No category matches {', '.join(selectors)}; found: {names}")
+    return chosen
+
+def missing_images(product, urls):
+    attached = set(product.images.values_list("source_url", flat=True))
+    return [url for url in urls if url not in attached]
+
+def main(crawler=None, full=False, transforms=None, parser="lxml", frontier=None,
+         only_categories=(), restart=False):
+    """
+    Crawl the catalog concurrently. Pages are fetched on the crawler's pool
+    while earlier pages are written to the database, and every product's
+    images download in the background; database writes stay on this thread
+    and happen in the same order as a sequential crawl.
+
+    Products whose content hash is unchanged are skipped and images are
+    only downloaded for URLs the product doesn't have yet, so a re-run
+    against an unchanged site writes nothing. `full` rewrites every product.
+
+    Downloaded images are decoded and resized by `transforms`, a process
+    pool, so the CPU work overlaps with crawling. Each page's products, and
+    each set of finished images, is written in one batch by CatalogWriter.
+
+    `parser` picks the product page parser from parsers.PRODUCT_PARSERS;
+    both return the same products.
+
+    Progress is checkpointed in `frontier` (see frontier.py), so a crawl
+    that dies is resumed by the next run with the same `only_categories`
+    instead of starting over; `restart` discards it.
+    """
+    crawler = crawler or Crawler(headers=headers)
+    transforms = transforms or TransformPool()
+    frontier = frontier or Frontier(":memory:")
+    writer = CatalogWriter(full=full)
+    with crawler, transforms, frontier:
+        resumed = frontier.begin(",".join(sorted(only_categories)), restart=restart)
+        if resumed:
+            print(f"Resuming crawl: {frontier.done_count()} pages already done")
+        if not frontier.categories():
+            main_links = fetch_links(START_URL, MAIN_SELECTOR, crawler)
+            if only_categories:
+                main_links = select_categories(main_links, only_categories)
+            frontier.add_categories(main_links)
+        listings = [url for url, expanded in frontier.categories() if not expanded]
+        for url, subs in zip(listings, crawler.map(lambda url: fetch_links(url, SUB_SELECTOR, crawler), listings)):
+            frontier.expand(url, subs)
+
+        pages = frontier.pages()
+        page_futures = [crawler.submit(fetch_products, url, crawler, PRODUCT_PARSERS[parser]) for _, url in pages]
+
+        # (product, image futures) in creation order; written as soon as the
+        # head of the queue has finished downloading.
+        pending = []
+
+        def download(product, urls):
+            pending.append((product, [
+                (img_url, crawler.submit(download_image, img_url, crawler, transforms)) for img_url in urls
+            ]))
+
+        def write_finished():
+            groups = collect_images(pending)
+            writer.write_images(groups)
+            frontier.images_done([(product.name, [url for url, _ in images]) for product, images in groups])
+
+        # Images queued by an earlier run that did not get to them.
+        queued = frontier.queued_images()
+        products = {p.name: p for p in Product.objects.filter(name__in=[name for name, _ in queued])}
+        for name, urls in queued:
+            product = products.get(name)
+            todo = missing_images(product, urls) if product else []
+            frontier.images_done([(name, [url for url in urls if url not in todo])])
+            if todo:
+                download(product, todo)
+
+        for (main_url, url), page in zip(pages, page_futures):
+            category = writer.category(get_category_name(main_url))
             sub = None
             if url != main_url:
-                sub_name = get_category_name(url)
-                sub, _ = SubCategory.objects.get_or_create(
-                    name=sub_name, defaults={"category": category})
-            for pdata in fetch_products(url):
-                product, created = Product.objects.get_or_create(
-                    name=pdata["title"],
-                    defaults={
-                        "description": pdata["description"],
-                        "features": pdata["features"],
-                        "category": category,
-                        "subcategory": sub
-                    }
-                )
-                if not created:
-                    product.description = pdata["description"]
-                    product.features = pdata["features"]
-                    product.category = category
-                    product.subcategory = sub
-                    product.save()
-
-                for idx, img_url in enumerate(pdata["images"], 1):
-                    img_path = process_and_save_image(img_url, product.id, idx)
-                    if img_path:
-                        with open(img_path, "rb") as f:
-                            django_file = File(f)
-                            pi = ProductImage(product=product)
-                            pi.image.save(os.path.basename(img_path), django_file, save=True)
+                sub = writer.subcategory(get_category_name(url), category)
+            items = [(pdata, category, sub) for pdata in page.result()]
+            planned = []
+            for (pdata, _, _), (product, changed) in zip(items, writer.write_products(items)):
+                # On a resumed crawl this page may have been written before
+                # its checkpoint, so its products can look unchanged.
+                if changed or resumed:
+                    urls = writer.plan_images(product, pdata["images"])
+                    if urls:
+                        planned.append((product, urls))
+            frontier.page_done(url, [(product.name, urls) for product, urls in planned])
+            for product, urls in planned:
+                download(product, urls)
+            write_finished()
+        # Wait for the remaining images; failures are reported by
+        # collect_images() and stay queued for the next run.
+        for _, downloads in pending:
+            for _, future in downloads:
+                try:
+                    future.result().result()
+                except Exception:
+                    pass
+        write_finished()
+        frontier.finish()
+        left = sum(len(urls) for _, urls in frontier.queued_images())
+        if left:
+            print(f"{left} images left queued for the next run")
+
+    print(crawler.stats.summary())
+    print(writer.summary())
+    print_diff(writer.diff)
+    return writer.diff
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import the casters.ro catalog.")
+    parser.add_argument("--workers", type=int, default=8, help="threads shared by page and image downloads")
+    parser.add_argument("--per-host", type=int, default=2, help="concurrent requests per host")
+    parser.add_argument("--delay", type=float, default=None,
+                        help="seconds between request starts to one host (default: 1, or 0 with --replay)")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.5, help="first retry delay in seconds, doubled each time")
+    parser.add_argument("--http-cache", default=str(settings.BASE_DIR / "var" / "scrape-cache.sqlite3"),
+                        help="SQLite file with ETag/Last-Modified validators of the previous run")
+    parser.add_argument("--frontier", default=str(settings.BASE_DIR / "var" / "scrape-frontier.sqlite3"),
+                        help="SQLite file with the crawl frontier and checkpoints")
+    parser.add_argument("--restart", action="store_true", help="start over instead of resuming an unfinished crawl")
+    parser.add_argument("--only-category", action="append", default=[], metavar="NAME",
+                        help="crawl only this category, by slug or name (repeatable)")
+    parser.add_argument("--image-workers", type=int, default=None,
+                        help="processes transforming images (default: CPU count)")
+    parser.add_argument("--image-queue", type=int, default=None,
+                        help="images waiting for or in the transform pool before downloads block")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the HTTP cache and content hashes and rewrite every product")
+    parser.add_argument("--parser", choices=sorted(PRODUCT_PARSERS), default="lxml",
+                        help="product page parser (default: lxml)")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--record", metavar="DIR", help="also save every response to a replay archive")
+    source.add_argument("--replay", metavar="DIR",
+                        help="crawl a replay archive (see replay.py, fixtures.py) instead of the live site")
+    return parser.parse_args(argv)
+
+def build_crawler(args, session=None):
+    """The Crawler for parsed command line `args`; --full leaves out the HTTP cache."""
+    delay = args.delay if args.delay is not None else (0 if args.replay else 1.0)
+    return Crawler(workers=args.workers, per_host=args.per_host, delay=delay,
+                   retries=args.retries, backoff=args.backoff, headers=headers, session=session,
+                   cache=None if args.full else HttpCache(args.http_cache),
+                   recorder=ArchiveRecorder(args.record) if args.record else None)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    with contextlib.ExitStack() as stack:
+        session = None
+        if args.replay:
+            session = replay_session(stack.enter_context(ReplayServer(args.replay)))
+        main(build_crawler(args, session),
+             full=args.full, parser=args.parser,
+             transforms=TransformPool(workers=args.image_workers, max_pending=args.image_queue),
+             frontier=Frontier(args.frontier), only_categories=args.only_category, restart=args.restart)
@@ -0,0 +1,26 @@
+'use strict';
+{
+    // Main image pickers (core.forms.ImageAutocompleteSelect): select2 over
+    // the paginated image autocomplete endpoint, showing each thumbnail.
+    const $ = django.jQuery;
+
+    function withThumbnail(image) {
+        if (!image.thumbnail) {
+            return image.text;
+        }
+        return $('<span>').append(
+            $('<img>', {src: image.thumbnail, loading: 'lazy', style: 'height:48px;vertical-align:middle;margin-right:8px;'}),
+            document.createTextNode(image.text)
+        );
+    }
+
+    $(function() {
+        $('.admin-image-autocomplete').select2({
+            ajax: {
+                data: (params) => ({term: params.term, page: params.page})
+            },
+            templateResult: withThumbnail,
+            templateSelection: withThumbnail
+        });
+    });
+}
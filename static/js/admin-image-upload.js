@@ -0,0 +1,128 @@
+'use strict';
+{
+    // Bulk image upload on the product change page: each file is posted on
+    // its own request (a few at a time) so it gets its own progress bar,
+    // then the queued jobs are polled until the worker has processed them.
+    const CONCURRENT_UPLOADS = 3;
+    const POLL_INTERVAL = 2000;
+
+    function csrfToken() {
+        const input = document.querySelector('input[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    function addRow(list, file) {
+        const row = list.insertRow();
+        const name = row.insertCell();
+        const progress = document.createElement('progress');
+        const status = row.insertCell();
+        name.textContent = file.name;
+        progress.max = file.size || 1;
+        progress.value = 0;
+        row.insertCell().appendChild(progress);
+        status.textContent = 'Waiting';
+        return {row, progress, status};
+    }
+
+    function showJob(entry, job) {
+        entry.status.textContent = job.error || job.status;
+        if (job.thumbnail && !entry.row.querySelector('img')) {
+            const img = document.createElement('img');
+            img.src = job.thumbnail;
+            img.style.height = '48px';
+            entry.row.cells[0].prepend(img);
+        }
+    }
+
+    function upload(url, file, entry) {
+        return new Promise((resolve) => {
+            const data = new FormData();
+            data.append('images', file);
+            const xhr = new XMLHttpRequest();
+            xhr.open('POST', url);
+            xhr.setRequestHeader('X-CSRFToken', csrfToken());
+            xhr.responseType = 'json';
+            xhr.upload.onprogress = (event) => {
+                entry.progress.value = event.loaded;
+                entry.status.textContent = 'Uploading';
+            };
+            xhr.onload = () => {
+                const body = xhr.response || {};
+                entry.progress.value = entry.progress.max;
+                if (body.jobs && body.jobs.length) {
+                    showJob(entry, body.jobs[0]);
+                    resolve(body.jobs[0].id);
+                } else {
+                    entry.status.textContent = body.errors && body.errors.length ? body.errors[0].error : 'Upload failed';
+                    resolve(null);
+                }
+            };
+            xhr.onerror = () => {
+                entry.status.textContent = 'Upload failed';
+                resolve(null);
+            };
+            entry.status.textContent = 'Uploading';
+            xhr.send(data);
+        });
+    }
+
+    function poller(url, pending) {
+        let running = false;
+        const poll = () => {
+            const ids = Object.keys(pending);
+            if (!ids.length) {
+                running = false;
+                return;
+            }
+            fetch(url + '?ids=' + ids.join(','), {credentials: 'same-origin'})
+                .then((response) => response.json())
+                .then((body) => {
+                    for (const job of body.jobs) {
+                        showJob(pending[job.id], job);
+                        if (job.status === 'done' || job.status === 'failed') {
+                            delete pending[job.id];
+                        }
+                    }
+                })
+                .finally(() => setTimeout(poll, POLL_INTERVAL));
+        };
+        return () => {
+            if (!running) {
+                running = true;
+                setTimeout(poll, POLL_INTERVAL);
+            }
+        };
+    }
+
+    document.addEventListener('DOMContentLoaded', () => {
+        const fieldset = document.getElementById('image-upload');
+        if (!fieldset) {
+            return;
+        }
+        const input = document.getElementById('image-upload-files');
+        const list = document.getElementById('image-upload-list');
+        const pending = {};
+        const startPolling = poller(fieldset.dataset.statusUrl, pending);
+
+        input.addEventListener('change', () => {
+            const queue = Array.from(input.files).map((file) => [file, addRow(list, file)]);
+            input.value = '';
+            const next = () => {
+                const item = queue.shift();
+                if (!item) {
+                    return;
+                }
+                upload(fieldset.dataset.uploadUrl, item[0], item[1]).then((id) => {
+                    if (id !== null) {
+                        pending[id] = item[1];
+                        startPolling();
+                    }
+                    next();
+                });
+            };
+            for (let i = 0; i < CONCURRENT_UPLOADS; i++) {
+                next();
+            }
+        });
+    });
+}